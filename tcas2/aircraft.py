@@ -1,5 +1,14 @@
+import math
 from enum import Enum
 
+TRACK_HISTORY_DEPTH = 2  # samples kept per aircraft, rates need two
+TRACK_FIELDS = 4  # time, distance, bearing, verticalSeparation
+# offsets of the newest sample from TrackHistory.head, read inline by the Aircraft getters
+LATEST_TIME = -TRACK_FIELDS
+LATEST_DISTANCE = 1 - TRACK_FIELDS
+LATEST_BEARING = 2 - TRACK_FIELDS
+LATEST_VERTICAL_SEPARATION = 3 - TRACK_FIELDS
+
 
 class AircraftCategory(Enum):
     OTHER = 0
@@ -8,7 +17,17 @@ class AircraftCategory(Enum):
     RA = 3
 
 
+class AdvisoryType(Enum):
+    NONE = 0
+    TA = 1
+    CC = 2
+    RA = 3
+
+
 class Advisory:
+    __slots__ = ("type", "minimalVerticalSpeed", "maximalVerticalSpeed", "alert", "opponentSolution", "isAccepted",
+                 "isSend")
+
     def __init__(self, advType):
         self.type = advType
         self.minimalVerticalSpeed = 0
@@ -19,11 +38,60 @@ class Advisory:
         self.isSend = False
 
 
+class TrackHistory:
+    # fixed capacity ring of samples in one preallocated flat list, the oldest sample is overwritten
+    # (an array("d") is smaller but boxes a new float on every read, which made saveEntry twice as slow)
+
+    __slots__ = ("depth", "samples", "head", "count")
+
+    def __init__(self, depth=TRACK_HISTORY_DEPTH):
+        self.depth = depth
+        self.samples = [0.0] * (TRACK_FIELDS * depth)
+        self.head = 0  # offset of the next sample, the newest one starts at head - TRACK_FIELDS
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, time, distance, bearing, verticalSeparation):
+        # returns the change of distance and verticalSeparation per second against the previous sample, None
+        # without one or at the same time, the rates come with the sample so saveEntry needs a single call
+        samples = self.samples
+        i = self.head
+        samples[i] = time
+        samples[i + 1] = distance
+        samples[i + 2] = bearing
+        samples[i + 3] = verticalSeparation
+        self.head = i + TRACK_FIELDS if i + TRACK_FIELDS < len(samples) else 0
+        if self.count < self.depth:
+            self.count += 1
+            if self.count < 2:
+                return None
+        # negative offsets wrap around the end of the list
+        prev = i - TRACK_FIELDS
+        dt = time - samples[prev]
+        if dt == 0:
+            return None
+        return (distance - samples[prev + 1]) / dt, (verticalSeparation - samples[prev + 3]) / dt
+
+    def __getitem__(self, index):
+        # (time, distance, bearing, verticalSeparation), oldest first like a list
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("track history index out of range")
+        i = self.head + (index - self.count) * TRACK_FIELDS
+        return tuple(self.samples[i + field] for field in range(TRACK_FIELDS))
+
+
 class Aircraft:
+    __slots__ = ("identification", "history", "tracker", "type", "rangeRate", "verticalRate", "lastMessage",
+                 "lasUpdate", "advisory")
 
-    def __init__(self, identification):
+    def __init__(self, identification, historyDepth=TRACK_HISTORY_DEPTH, tracker=None):
         self.identification = identification
-        self.history = []
+        self.history = TrackHistory(historyDepth)
+        self.tracker = tracker  # None: rates from the difference of the last two history samples
         self.type = AircraftCategory.PROXIMATE.name
         self.rangeRate = None
         self.verticalRate = None
@@ -31,28 +99,43 @@ class Aircraft:
         self.lasUpdate = 0
         self.advisory = None
 
-    def saveEntry(self, entry):
-        self.history.append(entry)
-        self.lasUpdate = entry.get("time")
-        if len(self.history) > 2:
-            self.history.pop(0)
-            self.calcRates()
-
-    def calcRates(self):
-        if len(self.history) < 2:
-            return
-        lastRecord = self.history[1]
-        prevRecord = self.history[0]
-        dt = prevRecord.get("time") - lastRecord.get("time")
-        if dt != 0:
-            self.rangeRate = (prevRecord.get("distance") - lastRecord.get("distance")) / dt
-            self.verticalRate = (prevRecord.get("verticalSeparation") - lastRecord.get("verticalSeparation")) / dt
+    def saveEntry(self, time, distance, bearing, verticalSeparation):
+        self.lasUpdate = time
+        # rates from the last two samples, from the second one on
+        rates = self.history.append(time, distance, bearing, verticalSeparation)
+        if self.tracker is not None:
+            rates = self.tracker.update(time, distance, bearing, verticalSeparation)
+        if rates is not None:
+            self.rangeRate, self.verticalRate = rates
+
+    def getTau(self):
+        # sec to the closest approach, inf while the range rate is unknown or zero
+        if not self.rangeRate:
+            return math.inf
+        return self.getLastDistance() / abs(self.rangeRate)
 
     def getLastDistance(self):
-        return self.history[len(self.history)-1].get("distance")
+        history = self.history
+        return history.samples[history.head + LATEST_DISTANCE]
 
     def getLastBearing(self):
-        return self.history[len(self.history)-1].get("bearing")
+        history = self.history
+        return history.samples[history.head + LATEST_BEARING]
 
     def getLatvSep(self):
-        return self.history[len(self.history)-1].get("verticalSeparation")
+        history = self.history
+        return history.samples[history.head + LATEST_VERTICAL_SEPARATION]
+
+    def predict(self, time):
+        # (distance, bearing, verticalSeparation) extrapolated from the last sample to time
+        if self.tracker is not None and self.tracker.initialised:
+            return self.tracker.predict(time)
+        samples = self.history.samples
+        head = self.history.head
+        distance = samples[head + LATEST_DISTANCE]
+        bearing = samples[head + LATEST_BEARING]
+        verticalSeparation = samples[head + LATEST_VERTICAL_SEPARATION]
+        if self.rangeRate is None:
+            return distance, bearing, verticalSeparation
+        dt = time - samples[head + LATEST_TIME]
+        return max(0.0, distance + self.rangeRate * dt), bearing, verticalSeparation + self.verticalRate * dt
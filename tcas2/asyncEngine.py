@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import math
+import time
+import paho.mqtt.client as mqtt
+from paho.mqtt.matcher import MQTTMatcher
+import tcas
+from metrics import labelled
+from recorder import RecordedMessage
+from tcas import Tcas
+from tracker import TRACKER_NAMES
+from wireFormat import WIRE_FORMATS, subscriptions
+
+ASYNC_QUEUE_SIZE = 10000  # messages waiting in each stage before the network side drops them
+ASYNC_BATCH = 256  # messages a stage handles before it lets the other tasks run
+
+
+class AsyncTcas:
+    # Runs a Tcas node on one asyncio loop instead of the paho network thread plus the scheduler thread.
+    # Received messages go through two bounded queues: received -> decode task -> decoded -> dispatch task, which
+    # applies them with the same Tcas logic. The periodic tasks of Tcas.scheduleTasks (squitter, threats or
+    # resolution, interrogation, coordination, timeouts, ...) are tasks on the same loop, so nothing needs a lock.
+
+    def __init__(self, node, queueSize=ASYNC_QUEUE_SIZE):
+        self.node = node
+        self.received = asyncio.Queue(queueSize)  # (paho message or RecordedMessage, perf_counter time)
+        self.decoded = asyncio.Queue(queueSize)  # (message, perf_counter time, traced)
+        self.periodic = []  # (name, function, rate) added by Tcas.scheduleTasks
+        self.tasks = {}  # name -> {"runs", "skipped"}
+        self.stats = {"received": 0, "dropped": 0, "decoded": 0, "dispatched": 0, "errors": 0}
+
+    def add(self, name, function, rate):
+        # the scheduler interface Tcas.scheduleTasks adds its tasks to
+        self.periodic.append((name, function, rate))
+
+    def offer(self, msg):
+        # from a network callback, never waits, a full queue drops the message like an overloaded QoS 0 link
+        try:
+            self.received.put_nowait((msg, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            self.node.countMessage(self.node.droppedCounts, "queue")
+            return
+        self.stats["received"] += 1
+
+    async def put(self, msg):
+        # from an in-process producer, waits for room
+        await self.received.put((msg, time.perf_counter()))
+        self.stats["received"] += 1
+
+    def failed(self, stage, error):
+        # a message or a periodic run that raised is dropped, the stage goes on with the next one
+        self.stats["errors"] += 1
+        droppedCounts = self.node.droppedCounts
+        droppedCounts["error"] = droppedCounts.get("error", 0) + 1
+        print(f"Error in {stage}: {type(error).__name__}: {error}")
+
+    async def decodeLoop(self):
+        node = self.node
+        decoded = self.decoded
+        while True:
+            for msg, start in await self.take(self.received):
+                try:
+                    node.sampleMessage()
+                    message = node.decodeReceived(msg, start)
+                except Exception as e:
+                    self.failed("decode", e)
+                    continue
+                if message is not None:
+                    self.stats["decoded"] += 1
+                    await decoded.put((message, start, node.traced))
+            await asyncio.sleep(0)
+
+    async def dispatchLoop(self):
+        node = self.node
+        while True:
+            for message, start, traced in await self.take(self.decoded):
+                node.traced = traced
+                try:
+                    node.dispatchMessage(message)
+                except Exception as e:
+                    self.failed("dispatch", e)
+                    continue
+                node.observeMessage("receive", start)
+                self.stats["dispatched"] += 1
+            await asyncio.sleep(0)
+
+    @staticmethod
+    async def take(queue):
+        # waits for the first item, then takes what is queued up to ASYNC_BATCH items without going through the loop
+        batch = [await queue.get()]
+        while len(batch) < ASYNC_BATCH and not queue.empty():
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def periodicLoop(self, name, function, rate):
+        # against deadlines like TaskScheduler, a task that fell behind drops the missed runs
+        clock = self.node.clock
+        period = 1 / rate
+        stats = self.tasks[name] = {"runs": 0, "skipped": 0}
+        deadline = clock()
+        while True:
+            try:
+                function()
+            except Exception as e:
+                self.failed(name, e)
+            stats["runs"] += 1
+            deadline += period
+            now = clock()
+            if deadline <= now:
+                missed = math.floor((now - deadline) / period) + 1
+                stats["skipped"] += missed
+                deadline += missed * period
+            await asyncio.sleep(deadline - now)
+
+    async def run(self, client, stopped):
+        # until the asyncio.Event stopped is set, client publishes like the paho client
+        node = self.node
+        node.client = client
+        node.ownPlane.connect()
+        node.scheduleTasks(self)
+        if node.metrics is not None:
+            node.metrics.gauge("async", lambda: labelled("stat", self.metrics()), "Async engine messages and queues")
+        tasks = [asyncio.create_task(self.decodeLoop()), asyncio.create_task(self.dispatchLoop())]
+        tasks += [asyncio.create_task(self.periodicLoop(*task)) for task in self.periodic]
+        for task in tasks:
+            task.add_done_callback(lambda task: self.stageDone(task, stopped))
+        try:
+            await stopped.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if node.recorder is not None:
+                node.recorder.close()
+            if node.metricsServer is not None:
+                node.metricsServer.stop()
+
+    def stageDone(self, task, stopped):
+        # a stage should only end when it is cancelled, otherwise the node would look alive while ignoring traffic
+        if task.cancelled():
+            return
+        error = task.exception()
+        print(f"Async stage ended: {error!r}")
+        stopped.set()
+
+    def metrics(self):
+        return dict(self.stats, receivedQueue=self.received.qsize(), decodedQueue=self.decoded.qsize())
+
+
+class AsyncMqttClient:
+    # paho driven by the asyncio loop through its socket callbacks, without the loop_start network thread
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.loop = None
+        self.misc = None
+        self.client = mqtt.Client()
+        self.client.on_connect = engine.node.on_connect
+        self.client.on_message = lambda client, userdata, msg: engine.offer(msg)
+        self.client.on_socket_open = self.onSocketOpen
+        self.client.on_socket_close = self.onSocketClose
+        self.client.on_socket_register_write = self.onSocketRegisterWrite
+        self.client.on_socket_unregister_write = self.onSocketUnregisterWrite
+
+    def connect(self, host=tcas.MQTT_TCAS_HOST, port=1883):
+        self.loop = asyncio.get_running_loop()
+        self.client.connect(host, port, 60)
+
+    def disconnect(self):
+        self.client.disconnect()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        return self.client.publish(topic, payload=payload, qos=qos, retain=retain)
+
+    def onSocketOpen(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.miscLoop())
+
+    def onSocketClose(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def onSocketRegisterWrite(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def onSocketUnregisterWrite(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def miscLoop(self):
+        # keep alive and retries
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class LoopbackBroker:
+    # in-process stand-in for the MQTT broker, delivers every message to the engines subscribed to its topic
+
+    def __init__(self):
+        self.matcher = MQTTMatcher()  # topic filter -> engines subscribed to it
+
+    def attach(self, engine):
+        for topicFilter, _ in subscriptions(tcas.MQTT_TCAS_CHANNEL, [engine.node.aircraftIdentification]):
+            try:
+                self.matcher[topicFilter].append(engine)
+            except KeyError:
+                self.matcher[topicFilter] = [engine]
+        return LoopbackClient(self)
+
+    def receivers(self, topic):
+        # an engine subscribed with overlapping filters gets the message once
+        return {id(engine): engine for engines in self.matcher.iter_match(topic) for engine in engines}.values()
+
+    def publish(self, topic, payload):
+        for engine in self.receivers(topic):
+            engine.offer(RecordedMessage(topic, payload))
+
+    async def publishWait(self, topic, payload):
+        # waits until every receiver has room, for producers that must not lose messages
+        for engine in self.receivers(topic):
+            await engine.put(RecordedMessage(topic, payload))
+
+
+class LoopbackClient:
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.broker.publish(topic, payload)
+
+
+async def main(args):
+    node = Tcas(None, True)
+    node.ownPlane.setPos(alt=args.alt, lat=args.lat, long=args.long, vs=0, gs=0, hdg=0)
+    node.batchEvaluation = args.batch
+    node.outboundScheduling = args.outbound
+    node.setTracker(args.tracker)
+    node.wireFormat = args.wire_format
+    if args.metrics_port is not None:
+        node.enableMetrics(args.metrics_port)
+    engine = AsyncTcas(node, args.queue)
+    client = AsyncMqttClient(engine)
+    client.connect(args.broker)
+    stopped = asyncio.Event()
+    try:
+        await engine.run(client, stopped)
+    finally:
+        client.disconnect()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='run a TCAS node on asyncio, for example a ground monitor with a '
+                                                 'dummy ownship at a fixed position')
+    parser.add_argument('lat', type=float, nargs='?', help='position latitude in deg', default=0.0)
+    parser.add_argument('long', type=float, nargs='?', help='position longitude in deg', default=0.0)
+    parser.add_argument('alt', type=float, nargs='?', help='position altitude in ft', default=0.0)
+    parser.add_argument('--broker', type=str, help='MQTT broker host', default=tcas.MQTT_TCAS_HOST)
+    parser.add_argument('--batch', action='store_true', help='batch threat evaluation')
+    parser.add_argument('--outbound', action='store_true',
+                        help='queue, coalesce and rate limit outgoing messages until the end of the tick')
+    parser.add_argument('--tracker', type=str, choices=TRACKER_NAMES, default="difference",
+                        help='rates of the intruders from the last two samples (difference) or a tracking filter')
+    parser.add_argument('--wire-format', type=str, choices=WIRE_FORMATS, default="json",
+                        help='format of the sent messages, received ones are decoded in either format')
+    parser.add_argument('--queue', type=int, help='size of the received and the decoded queue',
+                        default=ASYNC_QUEUE_SIZE)
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on localhost:PORT/metrics',
+                        default=None)
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
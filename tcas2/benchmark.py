@@ -0,0 +1,1204 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import heapq
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import timeit
+import tracemalloc
+import uuid
+import geopy
+import geopy.distance
+import numpy as np
+from aircraft import Aircraft, AircraftCategory
+from clock import ManualClock
+from coordination import CoordinationState
+from expiry import ExpiryHeap
+from geoUtils import EnuGeometry, GeodesicGeometry, GEOMETRIES, NumpyEnuGeometry, getBearing, getGeometry, \
+    wrapLongitude
+from resolution import VS_STEP, separation, solveJointResolution, solveResolution, solveResolutions
+from scenario import loadScenarios
+from threatEval import NO_ADVISORY, NO_CATEGORY, advisoryCode, classifyThreats
+from tracker import TRACKER_NAMES, getTracker
+from wireFormat import ALERTS, FLAG_RECEIVER, HEADER, MODE_CODES, RESOLUTION_REQUEST_V1, RESOLUTION_RESPONSE_V1, \
+    TYPE_CODES, WIRE_FORMATS, WIRE_VERSION, MessageMode, MessageType, addressToBytes, decodeBinary, decodeMessage, \
+    encodeBinary, encodeJson, isBinaryTopic, messageTopic, BINARY_TOPIC_SUFFIX
+
+
+RESULTS_FORMAT = 1
+LOWER_IS_BETTER = ("us", "ms", "bytes")  # units compared for regressions, other results are only reported
+REGRESSION_TOLERANCE = 0.25  # relative slowdown flagged as regression, timings on a busy machine vary by 20 %
+METRICS_OVERHEAD_LIMIT = 2  # %, stage instrumentation budget of the message path
+STARTUP_IMPORT_LIMIT = 500  # ms, imports of a headless node
+HEADLESS_UNUSED = ("tkinter", "SimConnect")  # modules a headless node with a dummy plane must not import
+RESOLUTION_CHECKS = 2000  # random threats the batch and the joint solver are compared on
+GEOMETRY_DISTANCE_LIMITS = ((0, 60, 1.0), (60, 80, 6.0))  # (deg of latitude from, to, m), bounds stated in geoUtils
+GEOMETRY_BEARING_LIMIT = 0.2  # deg, against getBearing
+GEOMETRY_DESTINATION_LIMIT = 0.5  # m per km travelled
+TRACKER_RATE_LIMIT = 0.01  # m/s and ft/s, filters on a noise free straight track
+TRACKER_POSITION_LIMIT = 1.0  # m and ft, extrapolated position of the filters on that track
+
+
+def measure(function, repeat=5, minTime=0.2):
+    # best time per call in seconds
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(number, int(number * minTime / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def record(results, name, value, unit):
+    if isinstance(value, float) and math.isnan(value):
+        value = None
+    results[name] = {"value": value, "unit": unit}
+
+
+@contextlib.contextmanager
+def quiet():
+    # the Tcas hot paths print every classification
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def sampleMessages():
+    address = str(uuid.uuid4())
+    receiver = str(uuid.uuid4())
+    plane = {"alt": 35600.0, "agl": 35600.0, "lat": 0.00000036, "long": -0.08, "vs": 0.0, "gs": 280.0, "hdg": 90.0}
+    return {
+        "short squitter": {"mode": MessageMode.BROADCAST.name, "address": address,
+                           "type": MessageType.SHORT_SQUITTER.name, "data": plane},
+        "long squitter": {"mode": MessageMode.SELECTIVE.name, "address": address, "receiver": receiver,
+                          "type": MessageType.LONG_SQUITTER.name, "data": plane},
+        "interrogation": {"mode": MessageMode.SELECTIVE.name, "address": address, "receiver": receiver,
+                          "type": MessageType.INTEROGATION.name, "data": {}},
+        "resolution request": {"mode": MessageMode.SELECTIVE.name, "address": address, "receiver": receiver,
+                               "type": MessageType.RESOLUTION_REQUEST.name,
+                               "data": {"alert": "CLIMB, CLIMB", "minimalVerticalSpeed": 0,
+                                        "maximalVerticalSpeed": 10000, "seq": 7}},
+        "resolution response": {"mode": MessageMode.SELECTIVE.name, "address": address, "receiver": receiver,
+                                "type": MessageType.RESOLUTION_RESPONSE.name, "data": {"accept": True, "seq": 7}},
+    }
+
+
+def benchWireFormat(results):
+    jsonTopic = "channel/address"
+    binaryTopic = f"channel/address/{BINARY_TOPIC_SUFFIX}"
+    print(f"{'message':20} {'format':6} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for name, message in sampleMessages().items():
+        for wireFormat, encode, topic in (("json", encodeJson, jsonTopic), ("binary", encodeBinary, binaryTopic)):
+            payload = encode(message)
+            if isinstance(payload, str):
+                payload = payload.encode()
+            encodeTime = measure(lambda: encode(message))
+            decodeTime = measure(lambda: decodeMessage(topic, payload))
+            print(f"{name:20} {wireFormat:6} {len(payload):6} {encodeTime * 1e6:10.2f} {decodeTime * 1e6:10.2f}")
+            record(results, f"{name}/{wireFormat}/size", len(payload), "bytes")
+            record(results, f"{name}/{wireFormat}/encode", encodeTime * 1e6, "us")
+            record(results, f"{name}/{wireFormat}/decode", decodeTime * 1e6, "us")
+    checkWireFormat(results)
+
+
+def checkWireFormat(results):
+    # every message type sent by a node in either wire format and decoded by another one has to come back unchanged,
+    # version 1 binary payloads still decode and unknown versions are rejected
+    import tcas
+    from host import LoopbackClient
+    from recorder import RecordedMessage
+    sender = headlessTcas()
+    receiver = headlessTcas()
+    sender.client = LoopbackClient()
+    failures = []
+    for wireFormat in WIRE_FORMATS:
+        sender.wireFormat = wireFormat
+        for name, message in sampleMessages().items():
+            message = dict(message, address=sender.aircraftIdentification)
+            if "receiver" in message:
+                message["receiver"] = receiver.aircraftIdentification
+            sender.transmit(message)
+            sent = sender.client.queue.popleft()
+            if isBinaryTopic(sent.topic) != (wireFormat == "binary"):
+                failures.append(f"{name} not sent as {wireFormat}")
+            elif receiver.decodeReceived(sent, 0.0) != message:
+                failures.append(f"{name} changed in {wireFormat}")
+    squitterMessage, request, response = (sampleMessages()[name] for name in
+                                          ("short squitter", "resolution request", "resolution response"))
+    for name, message in (("resolution request", request), ("resolution response", response)):
+        header = HEADER.pack(1, MODE_CODES[message["mode"]], TYPE_CODES[message["type"]], FLAG_RECEIVER,
+                             addressToBytes(message["address"])) + addressToBytes(message["receiver"])
+        data = message["data"]
+        if name == "resolution request":
+            payload = header + RESOLUTION_REQUEST_V1.pack(ALERTS.index(data["alert"]), data["minimalVerticalSpeed"],
+                                                          data["maximalVerticalSpeed"])
+        else:
+            payload = header + RESOLUTION_RESPONSE_V1.pack(data["accept"])
+        if decodeBinary(payload) != dict(message, data=dict(data, seq=0)):
+            failures.append(f"version 1 {name} not decoded")
+    payload = encodeBinary(squitterMessage)
+    for version in (0, 1 + WIRE_VERSION):
+        try:
+            decodeBinary(bytes([version]) + payload[1:])
+            failures.append(f"version {version} accepted")
+        except ValueError:
+            pass
+    topic = messageTopic(tcas.MQTT_TCAS_CHANNEL, squitterMessage["address"], binary=True)
+    receiver.enableMetrics()
+    receiver.decodeReceived(RecordedMessage(topic, bytes([1 + WIRE_VERSION]) + payload[1:]), 0.0)
+    if receiver.droppedCounts.get("decode") != 1:
+        failures.append(f"version {1 + WIRE_VERSION} not dropped by the node")
+    checks = 2 * len(sampleMessages()) + 5
+    flag = f"  {', '.join(failures)}" if failures else ""
+    print(f"round trip and versions: {len(failures)} of {checks} checks failed{flag}")
+    record(results, "round trip failures", len(failures), "checks")
+
+
+class LegacyAircraft:
+    # track history of Aircraft before the ring buffer, kept as the baseline of benchTrackHistory
+
+    def __init__(self, identification):
+        self.identification = identification
+        self.history = []
+        self.rangeRate = None
+        self.verticalRate = None
+        self.lasUpdate = 0
+
+    def saveEntry(self, time, distance, bearing, verticalSeparation):
+        self.history.append({"time": time, "distance": distance, "bearing": bearing,
+                             "verticalSeparation": verticalSeparation})
+        self.lasUpdate = time
+        if len(self.history) > 2:
+            self.history.pop(0)
+            lastRecord = self.history[1]
+            prevRecord = self.history[0]
+            dt = prevRecord.get("time") - lastRecord.get("time")
+            if dt != 0:
+                self.rangeRate = (prevRecord.get("distance") - lastRecord.get("distance")) / dt
+                self.verticalRate = (prevRecord.get("verticalSeparation") - lastRecord.get("verticalSeparation")) / dt
+
+    def getLastDistance(self):
+        return self.history[len(self.history) - 1].get("distance")
+
+
+def benchTrackHistory(results, count=500, samples=10):
+    print(f"{'track':8} {'bytes/aircraft':>15} {'saveEntry us':>13} {'getter us':>10}")
+    for name, factory in (("legacy", LegacyAircraft), ("ring", Aircraft)):
+        tracemalloc.start()
+        aircrafts = [factory(f"aircraft-{i}") for i in range(count)]
+        for t in range(samples):
+            for aircraft in aircrafts:
+                aircraft.saveEntry(float(t), 1000.0 - t, 90.0, 500.0 - t)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        aircraft = aircrafts[0]
+        times = itertools.count(float(samples))  # a new time on every call, so the rates are computed
+        saveTime = measure(lambda: aircraft.saveEntry(next(times), 1000.0, 90.0, 500.0))
+        getTime = measure(aircraft.getLastDistance)
+        print(f"{name:8} {size / count:15.0f} {saveTime * 1e6:13.3f} {getTime * 1e6:10.3f}")
+        record(results, f"{name}/memory per aircraft", size / count, "bytes")
+        record(results, f"{name}/saveEntry", saveTime * 1e6, "us")
+        record(results, f"{name}/getLastDistance", getTime * 1e6, "us")
+
+
+def benchExpiry(results, timeout=30):
+    # cost of one timeout check while every track is alive, full scan as before against the expiry heap
+    print(f"{'tracks':>7} {'scan us':>10} {'heap us':>10}")
+    for count in (100, 1000, 10000):
+        aircrafts = {f"aircraft-{i}": Aircraft(f"aircraft-{i}") for i in range(count)}
+        expiry = ExpiryHeap(timeout)
+        for address, aircraft in aircrafts.items():
+            aircraft.saveEntry(1.0, 1000.0, 90.0, 0.0)
+            expiry.touch(address, 1.0)
+
+        def scan():
+            toBeDeleted = []
+            for aircraft in list(aircrafts.values()):
+                if 2.0 - aircraft.lasUpdate > timeout:
+                    toBeDeleted.append(aircraft.identification)
+            return toBeDeleted
+
+        scanTime = measure(scan)
+        heapTime = measure(lambda: expiry.popExpired(2.0))
+        print(f"{count:7} {scanTime * 1e6:10.2f} {heapTime * 1e6:10.2f}")
+        record(results, f"{count} tracks/scan", scanTime * 1e6, "us")
+        record(results, f"{count} tracks/heap", heapTime * 1e6, "us")
+
+
+def sampleTraffic(count, seed=0, step=0):
+    from snapshot import AircraftView
+    categories = list(AircraftCategory)
+    rnd = random.Random(seed)
+    aircrafts = []
+    for i in range(count):
+        aircrafts.append(AircraftView(f"aircraft-{i}", categories[i % len(categories)],
+                                      rnd.uniform(0, 20000) + step * 10, (rnd.uniform(0, 360) + step) % 360,
+                                      rnd.uniform(-2500, 2500), rnd.choice((-1500, 0, 1500)), None))
+    return aircrafts
+
+
+def benchDisplay(results):
+    # frame time of the traffic display, needs a display for tk
+    import tkinter as tk
+    try:
+        from ui import UI
+        ui = UI()
+    except tk.TclError as e:
+        print(f"skipped, no display: {e}")
+        return
+
+    print(f"{'targets':>8} {'first frame ms':>15} {'update ms':>10} {'canvas items':>13}")
+    for count in (10, 50, 100, 200):
+        frames = [sampleTraffic(count, step=step) for step in range(2)]
+
+        def firstFrame():
+            ui.clearAircraftDisplay()
+            ui.displayAircraft(frames[0])
+            ui.root.update_idletasks()
+
+        def update():
+            frame = frames[update.step % 2]
+            update.step += 1
+            ui.displayAircraft(frame)
+            ui.updateDisplay()
+            ui.root.update_idletasks()
+        update.step = 0
+
+        firstTime = measure(firstFrame)
+        updateTime = measure(update)
+        print(f"{count:8} {firstTime * 1e3:15.3f} {updateTime * 1e3:10.3f} {len(ui.canvas.find_all()):13}")
+        record(results, f"{count} targets/first frame", firstTime * 1e3, "ms")
+        record(results, f"{count} targets/update", updateTime * 1e3, "ms")
+    ui.root.destroy()
+
+
+PRESETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Test Parameter Presets.txt")
+KNOTS_TO_MS = 0.514444
+
+
+def encounterScenarios(path=PRESETS):
+    # the presets with an ownship (first plane) and at least one intruder
+    return [scenario for scenario in loadScenarios(path) if len(scenario.planes) > 1]
+
+
+def planeState(geometry, setup, t):
+    # straight flight of a dummy plane, lat, long, alt after t sec
+    lat, long = geometry.destination(setup.lat, setup.long, setup.hdg, setup.gs * KNOTS_TO_MS * t)
+    return lat, long, setup.alt + setup.vs * t / 60
+
+
+def encounterSamples(scenario, period, duration=240, jitter=0.2, seed=0):
+    # squitters of every intruder received by the ownship every period sec, stamped with a random delay
+    # yields (address, receiveTime, distance, bearing, verticalSeparation, trueRangeRate, trueVerticalRate, ownAlt)
+    import tcas
+    geometry = EnuGeometry()
+    rnd = random.Random(seed)
+    own = scenario.planes[0]
+
+    def relative(intruder, t):
+        ownLat, ownLong, ownAlt = planeState(geometry, own, t)
+        lat, long, alt = planeState(geometry, intruder, t)
+        distance, bearing = geometry.distanceAndBearing(ownLat, ownLong, lat, long)
+        return distance, bearing, ownAlt - alt, ownAlt
+
+    t = 0.0
+    while t <= duration:
+        for i, intruder in enumerate(scenario.planes[1:]):
+            distance, bearing, verticalSeparation, ownAlt = relative(intruder, t)
+            if distance > tcas.TCAS_MAX_DISTANCE:
+                continue
+            rangeRate = (relative(intruder, t + 0.01)[0] - relative(intruder, t - 0.01)[0]) / 0.02
+            verticalRate = (own.vs - intruder.vs) / 60
+            yield (f"intruder-{i}", t + rnd.uniform(0, jitter), distance, bearing, verticalSeparation, rangeRate,
+                   verticalRate, ownAlt)
+        t += period
+
+
+def isTrafficAdvisory(distance, verticalSeparation, rangeRate, verticalRate, ownAlt):
+    import tcas
+    threshold = next(tcas.TcasThresholds[k] for k in tcas.TcasThresholds if k > ownAlt)
+    category, _, _, _ = classifyThreats(np.array([distance]), np.array([verticalSeparation]), np.array([rangeRate]),
+                                        np.array([verticalRate]), np.array([NO_CATEGORY]), np.array([NO_ADVISORY]),
+                                        threshold, True, tcas.TCAS_PROXIMATE_LIMIT, tcas.TCAS_PROXIMATE_VS_LIMIT)
+    return category[0] == AircraftCategory.TA.value
+
+
+def benchTrackers(results, periods=(1, 2, 3), seed=0):
+    # rate errors and first TA of the tracking filters against the exact rates on the preset encounters
+    print(f"{'scenario':40} {'period':>6} {'filter':>10} {'rates s':>8} {'TA s':>6} {'exact TA s':>10} "
+          f"{'rangeRate rms':>14} {'vertRate rms':>13}")
+    for scenario in encounterScenarios():
+        for period in periods:
+            samples = list(encounterSamples(scenario, period, seed=seed))
+            exactTA = next((s[1] for s in samples if isTrafficAdvisory(s[2], s[4], s[5], s[6], s[7])), None)
+            for name in ("difference", "alphabeta", "kalman"):
+                tracker = getTracker(name)
+                aircrafts = {}
+                errors = []
+                firstRates = None
+                firstTA = None
+                for address, t, distance, bearing, verticalSeparation, rangeRate, verticalRate, ownAlt in samples:
+                    if address not in aircrafts:
+                        aircrafts[address] = Aircraft(address, tracker=tracker() if tracker is not None else None)
+                    aircraft = aircrafts[address]
+                    aircraft.saveEntry(t, distance, bearing, verticalSeparation)
+                    if aircraft.rangeRate is None:
+                        continue
+                    firstRates = t if firstRates is None else firstRates
+                    errors.append((aircraft.rangeRate - rangeRate, aircraft.verticalRate - verticalRate))
+                    estimate = aircraft.predict(t) if aircraft.tracker is not None else (distance, bearing,
+                                                                                          verticalSeparation)
+                    if firstTA is None and isTrafficAdvisory(estimate[0], estimate[2], aircraft.rangeRate,
+                                                             aircraft.verticalRate, ownAlt):
+                        firstTA = t
+                rangeRms = math.sqrt(sum(e[0] ** 2 for e in errors) / len(errors)) if errors else math.nan
+                verticalRms = math.sqrt(sum(e[1] ** 2 for e in errors) / len(errors)) if errors else math.nan
+                print(f"{scenario.name[:40]:40} {period:6} {name:>10} {str(firstRates and round(firstRates, 1)):>8} "
+                      f"{str(firstTA and round(firstTA)):>6} {str(exactTA and round(exactTA)):>10} "
+                      f"{rangeRms:14.2f} {verticalRms:13.2f}")
+                key = f"{scenario.name}/{period} s/{name}"
+                record(results, f"{key}/first TA", firstTA, "s")
+                record(results, f"{key}/rangeRate rms", rangeRms, "m/s")
+                record(results, f"{key}/verticalRate rms", verticalRms, "ft/s")
+
+
+def syntheticTrack(t):
+    # intruder on a straight line relative to the ownship: (distance, bearing, verticalSeparation, rangeRate,
+    # verticalRate), passes 190 m from the ownship 53 s in
+    east = 8000.0 - 150.0 * t
+    north = 3000.0 - 60.0 * t
+    verticalSeparation = 1200.0 - 10.0 * t
+    distance = math.hypot(east, north)
+    rangeRate = (east * -150.0 + north * -60.0) / distance
+    return distance, math.degrees(math.atan2(east, north)) % 360.0, verticalSeparation, rangeRate, -10.0
+
+
+def benchTrackerAccuracy(results, period=1.0, samples=40, ahead=2.0):
+    # squitters of a noise free straight track through a node with setTracker, the rates and the position ahead sec
+    # after the last sample against the exact ones, flagged for the filters, the difference of the history is only
+    # reported, the distance is not linear in time
+    import tcas
+    from recorder import RecordedMessage
+    enu = EnuGeometry()
+    address = str(uuid.uuid4())
+    print(f"{'tracker':>10} {'rates s':>8} {'rangeRate m/s':>14} {'vertRate ft/s':>14} {'distance m':>11} "
+          f"{'bearing deg':>12} {'vertSep ft':>11}")
+    for name in TRACKER_NAMES:
+        ownship = headlessTcas()
+        ownship.setGeometry("enu")
+        ownship.setTracker(name)
+        clock = ManualClock()
+        ownship.setClock(clock)
+        firstRates = None
+        rateError = [0.0, 0.0]
+        for i in range(samples):
+            clock.set(i * period)
+            distance, bearing, verticalSeparation, rangeRate, verticalRate = syntheticTrack(clock())
+            lat, long = enu.destination(0.0, 0.0, bearing, distance)
+            payload = encodeJson(squitter(address, lat, long, ownship.ownPlane.alt - verticalSeparation))
+            with quiet():
+                ownship.on_message(None, None, RecordedMessage(messageTopic(tcas.MQTT_TCAS_CHANNEL, address), payload))
+            aircraft = ownship.knownAircrafts[address]
+            if aircraft.rangeRate is None:
+                continue
+            firstRates = clock() if firstRates is None else firstRates
+            rateError = [max(rateError[0], abs(aircraft.rangeRate - rangeRate)),
+                         max(rateError[1], abs(aircraft.verticalRate - verticalRate))]
+        t = clock() + ahead
+        distance, bearing, verticalSeparation, _, _ = syntheticTrack(t)
+        predicted = aircraft.predict(t)
+        positionError = (abs(predicted[0] - distance), abs(wrapLongitude(predicted[1] - bearing)),
+                         abs(predicted[2] - verticalSeparation))
+        flags = []
+        if (aircraft.tracker is None) != (name == "difference"):
+            flags.append("tracker not set")
+        if name != "difference":
+            if max(rateError) >= TRACKER_RATE_LIMIT:
+                flags.append(f"rates above {TRACKER_RATE_LIMIT}")
+            if positionError[0] >= TRACKER_POSITION_LIMIT or positionError[2] >= TRACKER_POSITION_LIMIT:
+                flags.append(f"position above {TRACKER_POSITION_LIMIT}")
+        flag = f"  {', '.join(flags)}" if flags else ""
+        print(f"{name:>10} {str(firstRates):>8} {rateError[0]:14.4f} {rateError[1]:14.4f} {positionError[0]:11.4f} "
+              f"{positionError[1]:12.4f} {positionError[2]:11.4f}{flag}")
+        record(results, f"{name}/rates after", firstRates, "s")
+        record(results, f"{name}/rangeRate error", rateError[0], "m/s")
+        record(results, f"{name}/verticalRate error", rateError[1], "ft/s")
+        record(results, f"{name}/distance error", positionError[0], "m")
+        record(results, f"{name}/bearing error", positionError[1], "deg")
+        record(results, f"{name}/verticalSeparation error", positionError[2], "ft")
+
+
+def headlessTcas(lat=0.0, long=0.0, alt=5000.0):
+    import tcas
+    from recorder import ReplayClient
+    ownship = tcas.Tcas(None, True)
+    ownship.client = ReplayClient()
+    ownship.ownPlane.setPos(alt=alt, lat=lat, long=long, vs=0, gs=0, hdg=0)
+    ownship.spatialIndex.setOwnship(lat, long, alt)
+    return ownship
+
+
+def squitter(address, lat, long, alt, vs=0.0):
+    return {"mode": MessageMode.BROADCAST.name, "address": address, "type": MessageType.SHORT_SQUITTER.name,
+            "data": {"alt": alt, "agl": alt, "lat": lat, "long": long, "vs": vs, "gs": 250.0, "hdg": 0.0}}
+
+
+def benchSquitter(results, counts=(1, 10, 100), seed=0):
+    # listenToSquitter per message with count intruders converging on the ownship, one squitter per intruder and sec
+    print(f"{'intruders':>9} {'mode':>7} {'per message us':>15} {'evaluate us':>12}")
+    rnd = random.Random(seed)
+    for count in counts:
+        starts = [(rnd.uniform(-0.1, 0.1), rnd.uniform(-0.1, 0.1), 5000 + rnd.uniform(-1000, 1000))
+                  for _ in range(count)]
+        for mode in ("scalar", "batch"):
+            ownship = headlessTcas()
+            ownship.batchEvaluation = mode == "batch"
+            clock = ManualClock()
+            ownship.setClock(clock)
+            addresses = [str(uuid.uuid4()) for _ in range(count)]
+
+            def second():
+                clock.advance(1)
+                shrink = 0.999 ** clock()  # everybody closes in on the ownship
+                for address, (lat, long, alt) in zip(addresses, starts):
+                    ownship.listenToSquitter(squitter(address, lat * shrink, long * shrink, alt))
+
+            with quiet():
+                messageTime = measure(second) / count
+                evaluateTime = measure(ownship.evaluateThreats) if ownship.batchEvaluation else math.nan
+            print(f"{count:9} {mode:>7} {messageTime * 1e6:15.2f} {evaluateTime * 1e6:12.2f}")
+            record(results, f"{count} intruders/{mode}/listenToSquitter", messageTime * 1e6, "us")
+            if ownship.batchEvaluation:
+                record(results, f"{count} intruders/{mode}/evaluateThreats", evaluateTime * 1e6, "us")
+    compareThreatEvaluation(results, rnd)
+
+
+def compareThreatEvaluation(results, rnd, count=40, seconds=120):
+    # the same squitters through a scalar and a batch node, the batch one evaluated after every squitter so both
+    # classify the same samples, category and advisory of every intruder have to match exactly
+    clock = ManualClock()
+    scalar = headlessTcas()
+    batch = headlessTcas()
+    batch.batchEvaluation = True
+    for ownship in (scalar, batch):
+        ownship.setClock(clock)
+    # start within about 6 NM and 1500 ft, drifting up to about 170 m/s and 3000 ft/min
+    intruders = [(str(uuid.uuid4()), rnd.uniform(-0.1, 0.1), rnd.uniform(-0.1, 0.1), 5000 + rnd.uniform(-1500, 1500),
+                  rnd.uniform(-0.0015, 0.0015), rnd.uniform(-0.0015, 0.0015), rnd.uniform(-50, 50))
+                 for _ in range(count)]
+    compared = 0
+    mismatches = 0
+    seen = {AircraftCategory.TA: 0, AircraftCategory.RA: 0}
+    with quiet():
+        for t in range(1, seconds + 1):
+            clock.set(float(t))
+            for address, lat, long, alt, dLat, dLong, dAlt in intruders:
+                message = squitter(address, lat + dLat * t, long + dLong * t, alt + dAlt * t)
+                scalar.listenToSquitter(message)
+                scalar.resolveThreats()
+                batch.listenToSquitter(message)
+                batch.evaluateThreats()
+                expected = scalar.knownAircrafts.get(address)
+                actual = batch.knownAircrafts.get(address)
+                if expected is None and actual is None:
+                    continue
+                compared += 1
+                if expected is None or actual is None or expected.type != actual.type or \
+                        advisoryCode(expected.advisory) != advisoryCode(actual.advisory):
+                    mismatches += 1
+                elif expected.type in seen:
+                    seen[expected.type] += 1
+    flag = "" if mismatches == 0 else "  batch differs from scalar"
+    print(f"scalar against batch: {mismatches} mismatches in {compared} squitters "
+          f"({seen[AircraftCategory.TA]} TA, {seen[AircraftCategory.RA]} RA){flag}")
+    record(results, "batch mismatches", mismatches, "squitters")
+
+
+def benchResolution(results, counts=(1, 2, 5, 10, 20, 50), seed=0):
+    # count intruders converging on the ownship from all sides, all of them RA:
+    #   joint:          solveJointResolution over all threats (the solver alone)
+    #   per threat:     solveResolution for every threat on its own, as before the joint resolver
+    #   batch:          solveResolutions, every threat on its own in one call
+    #   resolveThreats: the tick including the coordination requests
+    # then the batch and the single threat joint solver against solveResolution
+    print(f"{'threats':>7} {'RA':>4} {'joint us':>9} {'per threat us':>14} {'batch us':>9} {'resolveThreats us':>18} "
+          f"{'senses':>6} {'satisfied':>9}")
+    rnd = random.Random(seed)
+    for count in counts:
+        ownship = headlessTcas(alt=8000.0)
+        clock = ManualClock()
+        ownship.setClock(clock)
+        intruders = [(str(uuid.uuid4()), rnd.uniform(0, 360), rnd.uniform(0.015, 0.025), rnd.uniform(-300, 300))
+                     for _ in range(count)]
+        with quiet():
+            for t in range(3):
+                clock.set(float(t))
+                for address, bearing, radius, offset in intruders:
+                    radius *= 1 - 0.05 * t
+                    ownship.listenToSquitter(squitter(address, radius * math.cos(math.radians(bearing)),
+                                                      radius * math.sin(math.radians(bearing)), 8000.0 + offset))
+        threats = [aircraft for aircraft in ownship.knownAircrafts.values() if aircraft.type == AircraftCategory.RA]
+        verticalSeparation = [aircraft.getLatvSep() for aircraft in threats]
+        verticalRate = [aircraft.verticalRate for aircraft in threats]
+        tau = [aircraft.getLastDistance() / abs(aircraft.rangeRate) for aircraft in threats]
+        zthr = ownship.getTcasThreshold().get("TA_ZTHR")
+
+        def resolve():
+            for aircraft in threats:
+                aircraft.advisory.isSend = False
+            ownship.resolveThreats()
+
+        jointTime = measure(lambda: solveJointResolution(verticalSeparation, verticalRate, tau, zthr))
+        perThreatTime = measure(lambda: [solveResolution(*threat, zthr)
+                                         for threat in zip(verticalSeparation, verticalRate, tau)])
+        batchTime = measure(lambda: solveResolutions(verticalSeparation, verticalRate, tau, zthr))
+        with quiet():
+            resolveTime = measure(resolve)
+        senses = len({solveResolution(*threat, zthr).climb for threat in zip(verticalSeparation, verticalRate, tau)})
+        satisfied = solveJointResolution(verticalSeparation, verticalRate, tau, zthr).satisfied
+        print(f"{count:7} {len(threats):4} {jointTime * 1e6:9.2f} {perThreatTime * 1e6:14.2f} {batchTime * 1e6:9.2f} "
+              f"{resolveTime * 1e6:18.2f} {senses:6} {str(satisfied):>9}")
+        record(results, f"{count} threats/solveJointResolution", jointTime * 1e6, "us")
+        record(results, f"{count} threats/solveResolution per threat", perThreatTime * 1e6, "us")
+        record(results, f"{count} threats/solveResolutions", batchTime * 1e6, "us")
+        record(results, f"{count} threats/resolveThreats", resolveTime * 1e6, "us")
+    thresholdTime = measure(ownship.getTcasThreshold)
+    print(f"getTcasThreshold {thresholdTime * 1e6:.2f} us")
+    record(results, "getTcasThreshold", thresholdTime * 1e6, "us")
+    batchMismatches, jointMismatches = compareResolutions(rnd)
+    flag = "" if batchMismatches == jointMismatches == 0 else "  differs from solveResolution"
+    print(f"against solveResolution: batch {batchMismatches}, single threat joint {jointMismatches} mismatches "
+          f"in {RESOLUTION_CHECKS} threats{flag}")
+    record(results, "solveResolutions mismatches", batchMismatches, "count")
+    record(results, "single threat solveJointResolution mismatches", jointMismatches, "count")
+    satisfiedBands, badBands = checkJointBands(rnd)
+    flag = "" if badBands == 0 else "  bands include vertical speeds that do not satisfy every threat"
+    print(f"joint bands of 2-4 threats: {badBands} of {satisfiedBands} with unsatisfying speeds{flag}")
+    record(results, "joint bands with unsatisfying speeds", badBands, "count")
+
+
+def checkJointBands(rnd, count=RESOLUTION_CHECKS):
+    # every vertical speed of a satisfied joint band has to keep every threat above zthr
+    zthr = 600
+    satisfiedBands = 0
+    badBands = 0
+    for _ in range(count):
+        threats = [(rnd.uniform(-1200, 1200), rnd.uniform(-60, 60), rnd.uniform(1, 40))
+                   for _ in range(rnd.randint(2, 4))]
+        resolution = solveJointResolution(*zip(*threats), zthr)
+        if not resolution.satisfied:
+            continue
+        satisfiedBands += 1
+        low, high = sorted((resolution.minimalVerticalSpeed, resolution.maximalVerticalSpeed))
+        badBands += any(abs(separation(*threat, vs)) <= zthr for vs in range(low, high + 1, VS_STEP)
+                        for threat in threats)
+    return satisfiedBands, badBands
+
+
+def compareResolutions(rnd, count=RESOLUTION_CHECKS):
+    # random threats including ones at tau 0 and without any solving vertical speed, the batch solver and the joint
+    # solver with one threat have to give the sense and limits of solveResolution, returns both mismatch counts
+    zthr = 600
+    verticalSeparation = [rnd.choice((rnd.uniform(-1500, 1500), 0.0)) for _ in range(count)]
+    verticalRate = [rnd.uniform(-100, 100) for _ in range(count)]
+    tau = [rnd.choice((rnd.uniform(0, 60), 0.0, 1e-3)) for _ in range(count)]
+    batchMismatches = 0
+    jointMismatches = 0
+    for allow in (True, False):
+        climb, minimal, maximal = solveResolutions(verticalSeparation, verticalRate, tau, zthr, allowClimb=allow)
+        for i, threat in enumerate(zip(verticalSeparation, verticalRate, tau)):
+            scalar = solveResolution(*threat, zthr, allowClimb=allow)
+            batchMismatches += (bool(climb[i]), int(minimal[i]), int(maximal[i])) != scalar[:3]
+            if scalar.climbBands or scalar.descendBands:
+                joint = solveJointResolution(*[[value] for value in threat], zthr, allowClimb=allow)
+                jointMismatches += joint[:3] != scalar[:3]
+    return batchMismatches, jointMismatches
+
+
+def benchGeometry(results):
+    point1 = geopy.Point(53.8036111, 10.7148917)
+    point2 = geopy.Point(53.9, 10.9)
+    timings = {
+        "getBearing": measure(lambda: getBearing(point1, point2)),
+        "geopy.distance": measure(lambda: geopy.distance.distance(point1, point2).m),
+    }
+    for name in GEOMETRIES:
+        geometry = getGeometry(name)
+        timings[f"{name}.distanceAndBearing"] = measure(
+            lambda: geometry.distanceAndBearing(point1.latitude, point1.longitude, point2.latitude, point2.longitude))
+    for name, seconds in timings.items():
+        print(f"{name:30} {seconds * 1e6:10.2f} us")
+        record(results, name, seconds * 1e6, "us")
+
+
+def benchGeometryAccuracy(results, samples=2000, seed=0):
+    # EnuGeometry and NumpyEnuGeometry against GeodesicGeometry for intruders within TCAS_MAX_DISTANCE of an ownship
+    # on either hemisphere, flags every error above the bounds stated in geoUtils
+    from tcas import TCAS_MAX_DISTANCE
+    rnd = random.Random(seed)
+    exact = GeodesicGeometry()
+    enu = EnuGeometry()
+    vectorized = NumpyEnuGeometry()
+    print(f"{'latitude':>9} {'limit m':>8} {'enu m':>8} {'numpy m':>8} {'bearing deg':>12} {'dest. m/km':>11}")
+    for low, high, limit in GEOMETRY_DISTANCE_LIMITS:
+        lats = []
+        longs = []
+        targets = []
+        for _ in range(samples):
+            lat = rnd.uniform(low, high) * rnd.choice((1, -1))
+            long = rnd.uniform(-180, 180)
+            bearing = rnd.uniform(0, 360)
+            distance = rnd.uniform(1000, TCAS_MAX_DISTANCE)
+            lats.append(lat)
+            longs.append(long)
+            targets.append((bearing, distance) + exact.destination(lat, long, bearing, distance))
+        distanceError = 0.0
+        numpyError = 0.0
+        bearingError = 0.0
+        destinationError = 0.0
+        for lat, long, (bearing, distance, lat2, long2) in zip(lats, longs, targets):
+            exactDistance, exactBearing = exact.distanceAndBearing(lat, long, lat2, long2)
+            enuDistance, enuBearing = enu.distanceAndBearing(lat, long, lat2, long2)
+            numpyDistances, numpyBearings = vectorized.distancesAndBearings(lat, long, [lat2], [long2])
+            distanceError = max(distanceError, abs(enuDistance - exactDistance))
+            numpyError = max(numpyError, abs(numpyDistances[0] - exactDistance))
+            bearingError = max(bearingError, abs(wrapLongitude(enuBearing - exactBearing)),
+                               abs(wrapLongitude(numpyBearings[0] - exactBearing)))
+            # the distance travelled along the local bearing
+            destination = enu.destination(lat, long, bearing, distance)
+            travelled, _ = exact.distanceAndBearing(lat, long, *destination)
+            destinationError = max(destinationError, abs(travelled - distance) / distance * 1000)
+        flags = []
+        if max(distanceError, numpyError) >= limit:
+            flags.append(f"distance above {limit} m")
+        if bearingError >= GEOMETRY_BEARING_LIMIT:
+            flags.append(f"bearing above {GEOMETRY_BEARING_LIMIT} deg")
+        if destinationError >= GEOMETRY_DESTINATION_LIMIT:
+            flags.append(f"destination above {GEOMETRY_DESTINATION_LIMIT} m/km")
+        flag = f"  {', '.join(flags)}" if flags else ""
+        print(f"{low:4}-{high:<4} {limit:8.1f} {distanceError:8.3f} {numpyError:8.3f} {bearingError:12.4f} "
+              f"{destinationError:11.4f}{flag}")
+        key = f"{low}-{high} deg"
+        record(results, f"{key}/enu distance error", distanceError, "m")
+        record(results, f"{key}/numpy distance error", numpyError, "m")
+        record(results, f"{key}/bearing error", bearingError, "deg")
+        record(results, f"{key}/destination error", destinationError, "m/km")
+        record(results, f"{key}/within bounds", not flags, "bool")
+
+
+def runScenario(scenario, samples):
+    # returns the sec spent in listenToSquitter and the time of the first sample in every category
+    ownship = headlessTcas()
+    own = scenario.planes[0]
+    clock = ManualClock()
+    ownship.setClock(clock)
+    geometry = EnuGeometry()
+    firstAlerts = {}
+    elapsed = 0.0
+    with quiet():
+        for address, t, distance, bearing, verticalSeparation, _, _, _ in samples:
+            clock.set(t)
+            lat, long, alt = planeState(geometry, own, t)
+            ownship.ownPlane.setPos(alt=alt, lat=lat, long=long, vs=own.vs, gs=own.gs, hdg=own.hdg)
+            ownship.spatialIndex.setOwnship(lat, long, alt)
+            intruderLat, intruderLong = geometry.destination(lat, long, bearing, distance)
+            message = squitter(address, intruderLat, intruderLong, alt - verticalSeparation)
+            start = timeit.default_timer()
+            ownship.listenToSquitter(message)
+            elapsed += timeit.default_timer() - start
+            aircraft = ownship.knownAircrafts.get(address)
+            if aircraft is not None and isinstance(aircraft.type, AircraftCategory):
+                firstAlerts.setdefault(aircraft.type, t)
+    return elapsed, firstAlerts
+
+
+def benchScenarios(results, period=1, repeat=5, seed=0):
+    # the preset encounters through Tcas.listenToSquitter with a simulated clock, best of repeat runs
+    print(f"{'scenario':40} {'messages':>8} {'per message us':>15} {'first TA s':>10} {'first RA s':>10}")
+    for scenario in encounterScenarios():
+        samples = list(encounterSamples(scenario, period, seed=seed))
+        runs = [runScenario(scenario, samples) for _ in range(repeat)]
+        perMessage = min(run[0] for run in runs) / len(samples)
+        firstTA = runs[0][1].get(AircraftCategory.TA)
+        firstRA = runs[0][1].get(AircraftCategory.RA)
+        print(f"{scenario.name[:40]:40} {len(samples):8} {perMessage * 1e6:15.2f} "
+              f"{str(firstTA and round(firstTA)):>10} {str(firstRA and round(firstRA)):>10}")
+        record(results, f"{scenario.name}/listenToSquitter", perMessage * 1e6, "us")
+        record(results, f"{scenario.name}/first TA", firstTA, "s")
+        record(results, f"{scenario.name}/first RA", firstRA, "s")
+
+
+def runMessages(messages, geometry, instrumented):
+    # sec spent in on_message for all messages, the received messages of a replay without the broker
+    ownship = headlessTcas()
+    ownship.setGeometry(geometry)
+    if instrumented:
+        ownship.enableMetrics()
+    return replayMessages(ownship, messages)
+
+
+def replayMessages(ownship, messages):
+    import tcas
+    from recorder import RecordedMessage
+    clock = ManualClock()
+    ownship.setClock(clock)
+    start = timeit.default_timer()
+    with quiet():
+        for t, address, payload in messages:
+            clock.set(t)
+            ownship.on_message(None, None, RecordedMessage(messageTopic(tcas.MQTT_TCAS_CHANNEL, address), payload))
+    return timeit.default_timer() - start
+
+
+def benchMetrics(results, count=10, seconds=120, pairs=31, seed=0):
+    # on_message with and without the stage instrumentation, runs in interleaved pairs, the overhead is the median
+    # ratio of a pair, a single best time is too noisy for a few %
+    rnd = random.Random(seed)
+    starts = [(str(uuid.uuid4()), rnd.uniform(-0.1, 0.1), rnd.uniform(-0.1, 0.1), 5000 + rnd.uniform(-1000, 1000))
+              for _ in range(count)]
+    messages = []
+    for t in range(1, seconds + 1):
+        shrink = 0.99 ** t
+        for address, lat, long, alt in starts:
+            messages.append((float(t), address, encodeJson(squitter(address, lat * shrink, long * shrink, alt))))
+    print(f"{'geometry':>9} {'plain us':>9} {'metrics us':>11} {'overhead %':>11}")
+    for geometry in ("geodesic", "enu"):
+        plain = []
+        instrumented = []
+        for i in range(pairs):
+            order = (False, True) if i % 2 else (True, False)
+            times = {instrumentation: runMessages(messages, geometry, instrumentation) for instrumentation in order}
+            plain.append(times[False])
+            instrumented.append(times[True])
+        overhead = (np.median(np.array(instrumented) / np.array(plain)) - 1) * 100
+        plainTime = min(plain) / len(messages)
+        instrumentedTime = min(instrumented) / len(messages)
+        flag = "" if overhead < METRICS_OVERHEAD_LIMIT else f"  above {METRICS_OVERHEAD_LIMIT} %"
+        print(f"{geometry:>9} {plainTime * 1e6:9.2f} {instrumentedTime * 1e6:11.2f} {overhead:11.2f}{flag}")
+        record(results, f"{geometry}/on_message", plainTime * 1e6, "us")
+        record(results, f"{geometry}/on_message with metrics", instrumentedTime * 1e6, "us")
+        record(results, f"{geometry}/overhead", float(overhead), "%")
+    # the type counter is not sampled, every decoded message is counted
+    ownship = headlessTcas()
+    ownship.enableMetrics()
+    replayMessages(ownship, messages)
+    counted = sum(ownship.messageCounts.values())
+    flag = "" if counted == len(messages) else "  not exact"
+    print(f"messages_total: {counted} of {len(messages)} messages{flag}")
+    record(results, "messages_total", counted, "messages")
+
+
+class SimulatedLink:
+    # broker between headless Tcas nodes on a virtual clock, every copy of a message is lost with probability loss
+    # or delivered after a uniform delay in sec
+
+    def __init__(self, loss=0.0, delay=(0.0, 0.0), seed=0):
+        self.loss = loss
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.clock = ManualClock()
+        self.nodes = []
+        self.queue = []  # (delivery time, number, node, message)
+        self.sent = 0
+        self.lost = 0
+
+    def attach(self, node):
+        node.client = LinkClient(self, node)
+        node.setClock(self.clock)
+        self.nodes.append(node)
+
+    def publish(self, sender, topic, payload):
+        from recorder import RecordedMessage
+        for node in self.nodes:
+            if node is sender:
+                continue
+            self.sent += 1
+            if self.random.random() < self.loss:
+                self.lost += 1
+                continue
+            heapq.heappush(self.queue, (self.clock() + self.random.uniform(*self.delay), self.sent, node,
+                                        RecordedMessage(topic, payload)))
+
+    def advance(self, until):
+        while self.queue and self.queue[0][0] <= until:
+            deliver, _, node, message = heapq.heappop(self.queue)
+            self.clock.set(deliver)
+            node.on_message(None, None, message)
+        self.clock.set(until)
+
+
+class LinkClient:
+
+    def __init__(self, link, node):
+        self.link = link
+        self.node = node
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.link.publish(self.node, topic, payload)
+
+
+def coordinationTrial(link, rnd, duration=30, step=0.1):
+    # two aircraft head on at the same altitude until both sides are settled, returns both nodes and whether they
+    # ended with complementary senses (None if no RA was raised)
+    import tcas
+    nodes = [tcas.Tcas(None, True), tcas.Tcas(None, True)]
+    separation = rnd.uniform(0.06, 0.08)  # deg of latitude, the RA comes within a few sec
+    for node, lat, hdg in zip(nodes, (0.0, separation), (0.0, 180.0)):
+        link.attach(node)
+        node.ownPlane.setPos(alt=8000.0, lat=lat, long=0.0, vs=0, gs=250, hdg=hdg)
+    geometry = EnuGeometry()
+    speed = 250 * 0.514444  # m/s
+    own, other = nodes
+    for tick in range(int(duration / step)):
+        now = tick * step
+        link.advance(now)
+        if tick % int(round(1 / step)) == 0:
+            for node, hdg, start in zip(nodes, (0.0, 180.0), (0.0, separation)):
+                lat, long = geometry.destination(start, 0.0, hdg, speed * now)
+                node.ownPlane.setPos(alt=8000.0, lat=lat, long=long, vs=0, gs=250, hdg=hdg)
+                node.sendShortSquitter()
+        for node in nodes:
+            node.resolveThreats()
+            node.retransmitResolutions()
+        states = (own.coordination.state(other.aircraftIdentification),
+                  other.coordination.state(own.aircraftIdentification))
+        if None not in states and CoordinationState.REQUESTED not in states:
+            alerts = {own.knownAircrafts[other.aircraftIdentification].advisory.alert,
+                      other.knownAircrafts[own.aircraftIdentification].advisory.alert}
+            return nodes, alerts == {"CLIMB, CLIMB", "DESCEND, DESCEND"}
+    return nodes, None
+
+
+def benchCoordination(results, trials=200, seed=0,
+                      conditions=((0.0, 0.05), (0.1, 0.2), (0.3, 0.2), (0.5, 0.5))):
+    # RA coordination of head on encounters over a lossy link: per request latency percentiles, failed requests,
+    # crossing requests settled by the tie-break and encounters that ended with the same sense on both sides
+    from coordination import Coordinator
+    bound = Coordinator().bound()
+    print(f"{'loss':>5} {'delay s':>8} {'p50 s':>6} {'p95 s':>6} {'max s':>6} {'failed %':>9} {'crossed':>8} "
+          f"{'conflicts':>9}   (bound {bound:.1f} s + delay)")
+    rnd = random.Random(seed)
+    for loss, delay in conditions:
+        latencies = []
+        requested = failed = crossed = conflicts = 0
+        with quiet():
+            for trial in range(trials):
+                link = SimulatedLink(loss, (0.0, delay), seed=rnd.random())
+                nodes, complementary = coordinationTrial(link, rnd)
+                for node in nodes:
+                    latencies += node.coordination.latencies
+                    requested += node.coordination.stats["requested"]
+                    failed += node.coordination.stats["failed"]
+                    crossed += node.coordination.stats["ignored"] > 0
+                conflicts += complementary is False
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] if latencies else math.nan
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else math.nan
+        worst = latencies[-1] if latencies else math.nan
+        failedRate = failed / requested * 100 if requested else math.nan
+        print(f"{loss:5.2f} {delay:8.2f} {p50:6.2f} {p95:6.2f} {worst:6.2f} {failedRate:9.1f} {crossed:8} "
+              f"{conflicts:9}")
+        key = f"loss {loss} delay {delay}"
+        record(results, f"{key}/p50", p50, "s")
+        record(results, f"{key}/p95", p95, "s")
+        record(results, f"{key}/max", worst, "s")
+        record(results, f"{key}/failed", failedRate, "%")
+        record(results, f"{key}/conflicts", conflicts, "count")
+
+
+def fastTimeRun(scenario, duration):
+    # wall sec of duration sec of all planes of the scenario in fast time, and the final state of every ownship
+    from host import TcasHost
+    addresses = [str(uuid.UUID(int=i + 1)) for i in range(len(scenario.planes))]
+    tcasHost = TcasHost(scenario.planes, ManualClock(), addresses)
+    with quiet():
+        start = timeit.default_timer()
+        tcasHost.simulate(duration)
+        elapsed = timeit.default_timer() - start
+    state = [(ownship.ownPlane.getAsDict(), ownship.messageCounts, ownship.coordination.stats,
+              sorted((address, str(aircraft.type), aircraft.advisory.alert if aircraft.advisory else None,
+                      aircraft.rangeRate) for address, aircraft in ownship.knownAircrafts.items()))
+             for ownship in tcasHost.ownships]
+    return elapsed, repr(state)
+
+
+def benchFastTime(results, duration=600):
+    # the presets through TcasHost on a ManualClock, twice, both runs have to end in the same state to the last bit
+    print(f"{'scenario':40} {'wall ms':>8} {'speedup':>8} {'identical':>9}")
+    for scenario in encounterScenarios():
+        elapsed, state = fastTimeRun(scenario, duration)
+        _, again = fastTimeRun(scenario, duration)
+        print(f"{scenario.name[:40]:40} {elapsed * 1e3:8.1f} {duration / elapsed:8.0f} {str(state == again):>9}")
+        record(results, f"{scenario.name}/{duration} s", elapsed * 1e3, "ms")
+        record(results, f"{scenario.name}/identical", state == again, "bool")
+
+
+def benchOutbound(results, burst=30):
+    # a burst of interrogations to different receivers through the outgoing message budget of a node with
+    # outboundScheduling and metrics, one flush per sec, flags an exported queue depth or publish latency other than
+    # the token bucket allows
+    from outbound import percentile
+    ownship = headlessTcas()
+    clock = ManualClock()
+    ownship.setClock(clock)
+    ownship.outboundScheduling = True
+    ownship.enableMetrics()
+    outbound = ownship.outbound
+    for i in range(burst):
+        ownship.publish({"mode": MessageMode.SELECTIVE.name, "address": ownship.aircraftIdentification,
+                         "receiver": str(uuid.UUID(int=i + 1)), "type": MessageType.INTEROGATION.name})
+    # outbound.burst messages right away, then outbound.rate more every sec
+    expectedLatencies = [max(0, math.ceil((i + 1 - outbound.burst) / outbound.rate)) for i in range(burst)]
+    flushes = max(expectedLatencies) + 1
+    print(f"{'flush':>5} {'depth':>6} {'expected':>9} {'published':>10}")
+    mismatches = 0
+    for t in range(flushes):
+        clock.set(float(t))
+        ownship.outbound.flush()
+        # tcas_outbound{stat="queueDepth"} 20 -> {"queueDepth": 20.0}
+        exported = {line.split('"')[1]: float(line.split()[1]) for line in ownship.metrics.render().splitlines()
+                    if line.startswith("tcas_outbound{")}
+        depth = exported["queueDepth"]
+        expected = sum(latency > t for latency in expectedLatencies)
+        mismatches += depth != expected
+        print(f"{t:5} {depth:6.0f} {expected:9} {exported['published']:10.0f}")
+        record(results, f"flush {t}/queue depth", depth, "count")
+    latencies = {name: exported[name] for name in ("latencyP50", "latencyP95", "latencyMax")}
+    expected = {"latencyP50": percentile(expectedLatencies, 0.5), "latencyP95": percentile(expectedLatencies, 0.95),
+                "latencyMax": max(expectedLatencies)}
+    for name, value in latencies.items():
+        mismatches += value != expected[name]
+        record(results, name, value, "s")
+    flag = "" if mismatches == 0 else f"  {mismatches} values differ from the token bucket"
+    print(f"publish latency p50 {latencies['latencyP50']:.1f} s, p95 {latencies['latencyP95']:.1f} s, "
+          f"max {latencies['latencyMax']:.1f} s, expected {expected['latencyP50']:.1f} / "
+          f"{expected['latencyP95']:.1f} / {expected['latencyMax']:.1f} s{flag}")
+    record(results, "matches the budget", mismatches == 0, "bool")
+
+
+def benchStartup(results, repeat=5):
+    # imports of client.py and a headless dummy node in a fresh interpreter, best of repeat runs
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import client, tcas\n"
+            "tcas.Tcas(None, True)\n"
+            "print(time.perf_counter() - start)\n"
+            f"print(*[name for name in {HEADLESS_UNUSED!r} if name in sys.modules])")
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.splitlines()
+        times.append(float(output[0]))
+        loaded = output[1].split() if len(output) > 1 else []
+    elapsed = min(times) * 1e3
+    flag = "" if elapsed < STARTUP_IMPORT_LIMIT else f"  above {STARTUP_IMPORT_LIMIT} ms"
+    print(f"headless startup {elapsed:.1f} ms{flag}, loaded unused modules: {', '.join(loaded) or 'none'}")
+    record(results, "headless startup", elapsed, "ms")
+    record(results, "unused modules loaded", len(loaded), "count")
+
+
+def floodMessages(count, rounds, seed=0):
+    # rounds of squitters of count aircraft within range of a monitor at 0, 0, 5000 ft, closing in slowly
+    import tcas
+    rnd = random.Random(seed)
+    starts = [(str(uuid.uuid4()), rnd.uniform(-0.3, 0.3), rnd.uniform(-0.3, 0.3), 5000 + rnd.uniform(-5000, 5000))
+              for _ in range(count)]
+    return [(messageTopic(tcas.MQTT_TCAS_CHANNEL, address),
+             encodeJson(squitter(address, lat * 0.999 ** t, long * 0.999 ** t, alt)))
+            for t in range(rounds) for address, lat, long, alt in starts]
+
+
+async def floodEngine(messages):
+    # sec until the engine has applied all messages, the producer waits whenever the queues are full
+    from asyncEngine import AsyncTcas, LoopbackBroker
+    ownship = headlessTcas()
+    ownship.batchEvaluation = True
+    ownship.setGeometry("enu")
+    ownship.enableMetrics()
+    engine = AsyncTcas(ownship)
+    broker = LoopbackBroker()
+    stopped = asyncio.Event()
+    runner = asyncio.create_task(engine.run(broker.attach(engine), stopped))
+    await asyncio.sleep(0)
+    start = timeit.default_timer()
+    for topic, payload in messages:
+        await broker.publishWait(topic, payload)
+    while engine.stats["dispatched"] < len(messages):
+        await asyncio.sleep(0.001)
+    elapsed = timeit.default_timer() - start
+    stopped.set()
+    await runner
+    return elapsed, engine
+
+
+def benchAsync(results, counts=(100, 1000, 5000), messages=30000, seed=0):
+    # sustained messages per sec of the asyncio engine on one core, squitters of count aircraft flooded through the
+    # loopback broker with batch evaluation, the enu geometry, metrics and all periodic tasks running, against
+    # on_message called directly without the periodic tasks
+    from recorder import RecordedMessage
+    print(f"{'aircraft':>8} {'async msg/s':>12} {'direct msg/s':>13} {'tracked':>8} {'dropped':>8} "
+          f"{'threats runs':>12} {'skipped':>8}")
+    for count in counts:
+        flood = floodMessages(count, max(1, messages // count), seed)
+        with quiet():
+            elapsed, engine = asyncio.run(floodEngine(flood))
+            ownship = headlessTcas()
+            ownship.batchEvaluation = True
+            ownship.setGeometry("enu")
+            ownship.enableMetrics()
+            start = timeit.default_timer()
+            for topic, payload in flood:
+                ownship.on_message(None, None, RecordedMessage(topic, payload))
+            direct = timeit.default_timer() - start
+        rate = len(flood) / elapsed
+        directRate = len(flood) / direct
+        threats = engine.tasks.get("threats", {"runs": 0, "skipped": 0})
+        print(f"{count:8} {rate:12.0f} {directRate:13.0f} {len(engine.node.knownAircrafts):8} "
+              f"{engine.stats['dropped']:8} {threats['runs']:12} {threats['skipped']:8}")
+        record(results, f"{count} aircraft/async messages per s", rate, "msg/s")
+        record(results, f"{count} aircraft/direct messages per s", directRate, "msg/s")
+        record(results, f"{count} aircraft/async per message", elapsed / len(flood) * 1e6, "us")
+
+
+def airspace(count, seed=0):
+    # squitters of count aircraft spread over 20 x 30 deg, about the size of the European airspace
+    rng = np.random.default_rng(seed)
+    alts = rng.uniform(1000, 40000, count)
+    return [{"mode": MessageMode.BROADCAST.name, "address": str(uuid.UUID(int=int(rng.integers(1 << 62)))),
+             "type": MessageType.SHORT_SQUITTER.name,
+             "data": {"lat": float(rng.uniform(40, 60)), "long": float(rng.uniform(-5, 25)), "alt": float(alt),
+                      "agl": float(alt), "vs": float(rng.choice([0, 0, 0, -1500, 1500])),
+                      "gs": float(rng.uniform(150, 480)), "hdg": float(rng.uniform(0, 360))}} for alt in alts]
+
+
+def monitorPass(messages, workers, shardSize, repeat=3):
+    # best sec of a pass over the airspace after one warm up pass, and the conflict table
+    from monitor import ConflictMonitor
+    conflictMonitor = ConflictMonitor(workers, shardSize, ManualClock())
+    for message in messages:
+        conflictMonitor.update(message)
+    conflictMonitor.evaluate()
+    best = math.inf
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        conflicts = conflictMonitor.evaluate()
+        best = min(best, timeit.default_timer() - start)
+    stats = dict(conflictMonitor.stats)
+    conflictMonitor.close()
+    return best, conflicts, stats
+
+
+def benchMonitor(results, counts=(1000, 5000, 10000), seed=0):
+    # sharded all pairs conflict monitor: pass time by aircraft and worker processes, and the conflict table of the
+    # shards against one shard over the whole airspace (identical if the overlap margins are right)
+    from monitor import MONITOR_SHARD_SIZE
+    cores = os.cpu_count() or 1
+    workerCounts = sorted({1, 2, cores} | {2 ** k for k in range(3) if 2 ** k <= cores})
+    print(f"{cores} cores")
+    print(f"{'aircraft':>8} {'workers':>7} {'shards':>6} {'pairs':>7} {'TA+RA':>6} {'pass ms':>8} {'aircraft/s':>11} "
+          f"{'speedup':>7} {'identical':>9}")
+    for count in counts:
+        messages = airspace(count, seed)
+        _, reference, _ = monitorPass(messages, 1, 1000.0, repeat=1)
+        serial = None
+        for workers in workerCounts:
+            elapsed, conflicts, stats = monitorPass(messages, workers, MONITOR_SHARD_SIZE)
+            serial = serial or elapsed
+            identical = conflicts == reference
+            print(f"{count:8} {workers:7} {stats['shards']:6} {stats['inRange']:7} {len(conflicts):6} "
+                  f"{elapsed * 1e3:8.1f} {count / elapsed:11.0f} {serial / elapsed:7.2f} {str(identical):>9}")
+            key = f"{count} aircraft/{workers} workers"
+            record(results, f"{key}/pass", elapsed * 1e3, "ms")
+            record(results, f"{key}/aircraft per s", count / elapsed, "aircraft/s")
+            record(results, f"{key}/identical", identical, "bool")
+
+
+BENCHMARKS = {
+    "squitter": benchSquitter,
+    "resolution": benchResolution,
+    "geometry": benchGeometry,
+    "geometryAccuracy": benchGeometryAccuracy,
+    "scenarios": benchScenarios,
+    "wireFormat": benchWireFormat,
+    "display": benchDisplay,
+    "trackHistory": benchTrackHistory,
+    "trackers": benchTrackers,
+    "trackerAccuracy": benchTrackerAccuracy,
+    "expiry": benchExpiry,
+    "metrics": benchMetrics,
+    "coordination": benchCoordination,
+    "outbound": benchOutbound,
+    "fastTime": benchFastTime,
+    "startup": benchStartup,
+    "async": benchAsync,
+    "monitor": benchMonitor,
+}
+
+
+def runBenchmarks(names):
+    document = {"format": RESULTS_FORMAT, "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(), "platform": platform.platform(), "benchmarks": {}}
+    for name in names:
+        print(f"== {name}")
+        results = {}
+        BENCHMARKS[name](results)
+        document["benchmarks"][name] = results
+    return document
+
+
+def compareResults(baseline, current, tolerance=REGRESSION_TOLERANCE):
+    # prints every result found in both documents, returns the names of the regressions
+    regressions = []
+    print(f"{'result':70} {'baseline':>12} {'current':>12} {'change':>8}")
+    for bench, results in current["benchmarks"].items():
+        for name, result in results.items():
+            old = baseline["benchmarks"].get(bench, {}).get(name)
+            if old is None or old["value"] is None or result["value"] is None or old["unit"] != result["unit"]:
+                continue
+            change = (result["value"] - old["value"]) / old["value"] if old["value"] else 0.0
+            flag = ""
+            if result["unit"] in LOWER_IS_BETTER and change > tolerance:
+                flag = "REGRESSION"
+                regressions.append(f"{bench}/{name}")
+            print(f"{(bench + '/' + name)[:70]:70} {old['value']:12.3f} {result['value']:12.3f} "
+                  f"{change * 100:+7.1f}% {flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='offline benchmarks of the TCAS hot paths')
+    parser.add_argument('names', type=str, nargs='*', help=f'benchmarks to run: {", ".join(BENCHMARKS)}')
+    parser.add_argument('--output', type=str, help='write the results as json to this file', default=None)
+    parser.add_argument('--compare', type=str, nargs='+', metavar='RESULTS',
+                        help='baseline results, compared to the second results file or to this run', default=None)
+    parser.add_argument('--tolerance', type=float, help='relative slowdown flagged as regression',
+                        default=REGRESSION_TOLERANCE)
+
+    args = parser.parse_args()
+    if args.compare is not None and len(args.compare) > 2:
+        parser.error("--compare takes a baseline and at most one results file")
+    if args.compare is not None and len(args.compare) > 1 and (args.names or args.output is not None):
+        parser.error("benchmark names and --output need a run, not two results files to compare")
+
+    if args.compare is not None and len(args.compare) > 1:
+        with open(args.compare[1]) as file:
+            current = json.load(file)
+    else:
+        current = runBenchmarks(args.names or BENCHMARKS)
+        if args.output is not None:
+            with open(args.output, "w") as file:
+                json.dump(current, file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare[0]) as file:
+            baseline = json.load(file)
+        regressions = compareResults(baseline, current, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            sys.exit(1)
@@ -1,6 +1,34 @@
-import plane
-from ui import UI
 import argparse
+from clock import getClock
+from positionSource import POSITION_SOURCES, createPositionSource
+from tracker import TRACKER_NAMES
+from wireFormat import WIRE_FORMATS
+
+
+def runHeadless(args, ownPlane, clock):
+    # the node without a display, tkinter is never imported
+    from recorder import Recorder
+    from tcas import Tcas
+    node = Tcas(None, ownPlane is not None, clock)
+    if ownPlane is not None:
+        node.ownPlane = ownPlane
+    node.outboundScheduling = args.outbound
+    node.setTracker(args.tracker)
+    node.wireFormat = args.wire_format
+    if args.record is not None:
+        node.recorder = Recorder(args.record, node.aircraftIdentification)
+    if args.metrics_port is not None or args.metrics_file is not None:
+        node.enableMetrics(args.metrics_port, args.metrics_file)
+    node.start()
+    try:
+        while node.is_alive():
+            node.join(0.5)
+    except KeyboardInterrupt:
+        Tcas.stop()
+        node.join()
+    if node.error is not None:
+        print(node.error)
+
 
 if __name__ == "__main__":
 
@@ -12,15 +40,52 @@ if __name__ == "__main__":
     parser.add_argument('vs', type=float, nargs='?', help='dummy plane vertical speed in ft / min', default=0.0)
     parser.add_argument('gs', type=float, nargs='?', help='dummy plane ground speed in knots', default=0.0)
     parser.add_argument('hdg', type=float, nargs='?', help='dummy plane hdg in deg', default=0.0)
+    parser.add_argument('--record', type=str, help='write all received and sent messages to this log', default=None)
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on localhost:PORT/metrics',
+                        default=None)
+    parser.add_argument('--metrics-file', type=str, help='rewrite Prometheus metrics to this text file', default=None)
+    parser.add_argument('--speed', type=float, help='run the dummy plane and the tasks N times faster than real time',
+                        default=1.0)
+    parser.add_argument('--source', type=str, choices=list(POSITION_SOURCES),
+                        help='ownship position source, dummy or simconnect by the dummy argument if not given',
+                        default=None)
+    parser.add_argument('--source-file', type=str, help='recording of the replay source or script of the scripted one',
+                        default=None)
+    parser.add_argument('--headless', action='store_true', help='run without the display')
+    parser.add_argument('--outbound', action='store_true',
+                        help='queue, coalesce and rate limit outgoing messages until the end of the tick')
+    parser.add_argument('--tracker', type=str, choices=TRACKER_NAMES, default="difference",
+                        help='rates of the intruders from the last two samples (difference) or a tracking filter')
+    parser.add_argument('--wire-format', type=str, choices=WIRE_FORMATS, default="json",
+                        help='format of the sent messages, received ones are decoded in either format')
 
     args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    clock = getClock(args.speed)
 
-    ui = UI()
-
-    if args.dummy is not None:
-        ui.useDummy = args.dummy
-        if args.dummy:
-            ui.dummyPlane = plane.PlaneDummy()
-            ui.dummyPlane.setPos(alt=args.alt, lat=args.lat, long=args.long, vs=args.vs, gs=args.gs, hdg=args.hdg)
+    source = args.source or ("dummy" if args.dummy else "simconnect")
+    ownPlane = None  # the SimConnect plane is created by Tcas
+    if source == "dummy":
+        ownPlane = createPositionSource(source, clock)
+        ownPlane.setPos(alt=args.alt, lat=args.lat, long=args.long, vs=args.vs, gs=args.gs, hdg=args.hdg)
+    elif source != "simconnect":
+        if args.source_file is None:
+            parser.error(f"--source {source} needs --source-file")
+        ownPlane = createPositionSource(source, clock, path=args.source_file)
 
-    ui.run()
+    if args.headless:
+        runHeadless(args, ownPlane, clock)
+    else:
+        from ui import UI
+        ui = UI()
+        ui.recordPath = args.record
+        ui.metricsPort = args.metrics_port
+        ui.metricsFile = args.metrics_file
+        ui.clock = clock
+        ui.outboundScheduling = args.outbound
+        ui.tracker = args.tracker
+        ui.wireFormat = args.wire_format
+        ui.useDummy = ownPlane is not None
+        ui.dummyPlane = ownPlane
+        ui.run()
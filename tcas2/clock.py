@@ -0,0 +1,63 @@
+import time
+
+# A clock is called for the current time in sec and sleeps in its own time. Tcas, PlaneDummy, the outbound and the
+# task scheduler all read the clock they were given, so a simulation runs on virtual time instead of the wall clock.
+
+
+class RealClock:
+
+    def __call__(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class ManualClock:
+    # only moves when it is set or stepped, sleeping steps it, so a scheduler runs as fast as its tasks allow and a
+    # run gives the same result every time
+
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def __call__(self):
+        return self.time
+
+    def set(self, time):
+        self.time = time
+
+    def advance(self, seconds):
+        self.time += seconds
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.time += seconds
+
+
+class ScaledClock:
+    # wall clock running factor times faster from start, sleeps a factor shorter
+
+    def __init__(self, factor, start=0.0):
+        if factor <= 0:
+            raise ValueError(f"clock factor must be positive: {factor}")
+        self.factor = factor
+        self.start = start
+        self.origin = time.monotonic()
+
+    def __call__(self):
+        return self.start + (time.monotonic() - self.origin) * self.factor
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.factor)
+
+
+REAL_CLOCK = RealClock()
+
+
+def getClock(speed):
+    # 1 for the wall clock, N for N times faster, 0 or None for a ManualClock
+    if not speed:
+        return ManualClock()
+    if speed == 1:
+        return REAL_CLOCK
+    return ScaledClock(speed)
@@ -0,0 +1,138 @@
+from collections import deque
+from enum import Enum
+from threading import Lock
+from outbound import percentile
+
+COORDINATION_RETRANSMIT = 0.5  # sec between two requests of the same resolution
+COORDINATION_ATTEMPTS = 4  # requests sent before the coordination fails
+# A request is answered or given up within COORDINATION_RETRANSMIT * COORDINATION_ATTEMPTS sec after the first one
+# (2 sec, plus one period of the retransmit task), well below the smallest RA tau of 15 sec.
+
+
+class CoordinationState(Enum):
+    REQUESTED = 0  # our request is waiting for the response
+    COORDINATED = 1  # the intruder accepted our request
+    ACCEPTED = 2  # we accepted the request of the intruder
+    FAILED = 3  # no response after all attempts, or rejected
+
+
+class RequestAction(Enum):
+    ACCEPT = 0  # apply the solution of the intruder and respond
+    RESEND = 1  # duplicate of the request we accepted last, respond again without applying it
+    IGNORE = 2
+
+
+def outranks(address, otherAddress):
+    # of two crossing requests the one from the higher address stands
+    return address > otherAddress
+
+
+class Coordination:
+    __slots__ = ("state", "seq", "solution", "attempts", "sent", "deadline")
+
+    def __init__(self, state, seq, solution=None, sent=0.0, deadline=0.0):
+        self.state = state
+        self.seq = seq  # of our request, or of the accepted request of the intruder
+        self.solution = solution  # requested opponent solution
+        self.attempts = 1
+        self.sent = sent  # first request
+        self.deadline = deadline  # next retransmit
+
+
+class Coordinator:
+    # RA coordination with every intruder. Requests carry a sequence number, the response echoes it, unanswered
+    # requests are sent again every retransmit sec until attempts requests are out. Sequence number 0 comes from
+    # nodes without sequence numbers, their requests are always accepted.
+
+    def __init__(self, retransmit=COORDINATION_RETRANSMIT, attempts=COORDINATION_ATTEMPTS):
+        self.retransmit = retransmit
+        self.attempts = attempts
+        self.lock = Lock()
+        self.seq = 0  # last sequence number used
+        self.pairs = {}  # address -> Coordination
+        self.latencies = deque(maxlen=1000)  # sec from the first request to the accepting response
+        self.stats = {"requested": 0, "retransmitted": 0, "coordinated": 0, "accepted": 0, "duplicates": 0,
+                      "ignored": 0, "failed": 0, "stale": 0}
+
+    def bound(self):
+        # worst case sec from the first request until it is coordinated or failed
+        return self.retransmit * self.attempts
+
+    def state(self, address):
+        coordination = self.pairs.get(address)
+        return None if coordination is None else coordination.state
+
+    def request(self, address, solution, now):
+        # a new resolution against address, replaces any earlier coordination, returns the sequence number to send
+        with self.lock:
+            self.seq += 1
+            self.pairs[address] = Coordination(CoordinationState.REQUESTED, self.seq, solution, now,
+                                               now + self.retransmit)
+            self.stats["requested"] += 1
+            return self.seq
+
+    def onRequest(self, address, seq, outranked):
+        # outranked: the sender outranks us
+        with self.lock:
+            coordination = self.pairs.get(address)
+            if coordination is not None:
+                initiator = coordination.state in (CoordinationState.REQUESTED, CoordinationState.COORDINATED)
+                if initiator and not outranked:
+                    self.stats["ignored"] += 1
+                    return RequestAction.IGNORE
+                if coordination.state == CoordinationState.ACCEPTED and seq != 0:
+                    if seq == coordination.seq:
+                        self.stats["duplicates"] += 1
+                        return RequestAction.RESEND
+                    if seq < coordination.seq:
+                        self.stats["stale"] += 1
+                        return RequestAction.IGNORE
+            self.pairs[address] = Coordination(CoordinationState.ACCEPTED, seq)
+            self.stats["accepted"] += 1
+            return RequestAction.ACCEPT
+
+    def onResponse(self, address, seq, accept, now):
+        # True when the response completes our pending request
+        with self.lock:
+            coordination = self.pairs.get(address)
+            if coordination is None or coordination.state != CoordinationState.REQUESTED or \
+                    seq not in (0, coordination.seq):
+                self.stats["stale"] += 1
+                return False
+            if accept:
+                coordination.state = CoordinationState.COORDINATED
+                self.latencies.append(now - coordination.sent)
+                self.stats["coordinated"] += 1
+            else:
+                coordination.state = CoordinationState.FAILED
+                self.stats["failed"] += 1
+            return True
+
+    def due(self, now):
+        # (address, seq, solution) of the requests to send again
+        resend = []
+        with self.lock:
+            for address, coordination in self.pairs.items():
+                if coordination.state != CoordinationState.REQUESTED or coordination.deadline > now:
+                    continue
+                if coordination.attempts >= self.attempts:
+                    coordination.state = CoordinationState.FAILED
+                    self.stats["failed"] += 1
+                    continue
+                coordination.attempts += 1
+                coordination.deadline = now + self.retransmit
+                self.stats["retransmitted"] += 1
+                resend.append((address, coordination.seq, coordination.solution))
+        return resend
+
+    def forget(self, address):
+        with self.lock:
+            self.pairs.pop(address, None)
+
+    def metrics(self):
+        latencies = list(self.latencies)
+        with self.lock:
+            pending = sum(c.state == CoordinationState.REQUESTED for c in self.pairs.values())
+        return dict(self.stats, pending=pending,
+                    latencyP50=percentile(latencies, 0.5), latencyP95=percentile(latencies, 0.95),
+                    latencyMax=max(latencies) if latencies else 0.0)
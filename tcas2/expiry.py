@@ -0,0 +1,51 @@
+import heapq
+from threading import Lock
+
+
+class ExpiryHeap:
+    # Min-heap of (time, key) with one entry per key. A touch only records the new time, the heap entry is moved
+    # lazily when it comes up, so a tick only looks at keys whose oldest known touch is older than the timeout.
+
+    def __init__(self, timeout):
+        self.timeout = timeout  # sec, a key expires timeout sec after its last touch
+        self.lock = Lock()
+        self.heap = []
+        self.touches = {}  # key -> time of the last touch
+        self.queued = set()  # keys with an entry in the heap
+        self.stats = {"touched": 0, "rescheduled": 0, "discarded": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self.touches)
+
+    def touch(self, key, time):
+        with self.lock:
+            self.stats["touched"] += 1
+            self.touches[key] = time
+            if key not in self.queued:
+                self.queued.add(key)
+                heapq.heappush(self.heap, (time, key))
+
+    def discard(self, key):
+        # the heap entry stays until it comes up
+        with self.lock:
+            if self.touches.pop(key, None) is not None:
+                self.stats["discarded"] += 1
+
+    def popExpired(self, now):
+        # keys not touched for more than timeout sec, oldest first
+        expired = []
+        with self.lock:
+            while self.heap and now - self.heap[0][0] > self.timeout:
+                _, key = heapq.heappop(self.heap)
+                last = self.touches.get(key)
+                if last is None:
+                    self.queued.discard(key)
+                elif now - last > self.timeout:
+                    self.queued.discard(key)
+                    self.touches.pop(key)
+                    expired.append(key)
+                else:
+                    self.stats["rescheduled"] += 1
+                    heapq.heappush(self.heap, (last, key))
+            self.stats["evicted"] += len(expired)
+        return expired
@@ -0,0 +1,163 @@
+import argparse
+import struct
+import time
+import uuid
+from collections import deque
+import paho.mqtt.client as mqtt
+import tcas
+from clock import REAL_CLOCK, ManualClock, getClock
+from recorder import RecordedMessage
+from scenario import loadScenarios, findScenario
+from scheduler import TaskScheduler
+from tcas import Tcas
+from tracker import TRACKER_NAMES
+from wireFormat import WIRE_FORMATS, decodeMessage, parseTopic, subscriptions
+
+
+class LoopbackClient:
+    # takes the place of the broker in fast time, every message sent in a task run is delivered after the run
+
+    def __init__(self):
+        self.queue = deque()
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.queue.append(RecordedMessage(topic, payload))
+
+    def deliver(self, on_message):
+        # messages sent while delivering are delivered in the same call
+        while self.queue:
+            on_message(self, None, self.queue.popleft())
+
+
+class TcasHost:
+    # runs several ownships in one process on a single broker connection, every message is decoded once
+
+    def __init__(self, planes, clock=REAL_CLOCK, addresses=None):
+        self.running = False
+        self.client = None
+        self.clock = clock
+        self.scheduler = TaskScheduler(clock, clock.sleep)
+        self.ownships = []
+        self.ownshipsByAddress = {}
+        for i, setup in enumerate(planes):
+            ownship = Tcas(None, True, clock)
+            if addresses is not None:
+                ownship.aircraftIdentification = addresses[i]
+            ownship.ownPlane.setPos(alt=setup.alt, lat=setup.lat, long=setup.long, vs=setup.vs, gs=setup.gs,
+                                    hdg=setup.hdg)
+            self.ownships.append(ownship)
+            self.ownshipsByAddress[ownship.aircraftIdentification] = ownship
+
+    def run(self, host=tcas.MQTT_TCAS_HOST, port=1883):
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        for ownship in self.ownships:
+            ownship.client = self.client
+            ownship.ownPlane.connect()
+            ownship.scheduleTasks(self.scheduler, f"{ownship.aircraftIdentification[:8]} ")
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        self.running = True
+        try:
+            self.scheduler.run(lambda: not self.running)
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def simulate(self, duration):
+        # duration sec of all ownships on a ManualClock with a LoopbackClient instead of the broker, gives the same
+        # result on every run with the same addresses, without the display snapshots
+        if not isinstance(self.clock, ManualClock):
+            raise ValueError("simulate needs a ManualClock")
+        self.client = LoopbackClient()
+        for ownship in self.ownships:
+            ownship.client = self.client
+            ownship.scheduleTasks(self.scheduler, f"{ownship.aircraftIdentification[:8]} ", display=False)
+        end = self.clock() + duration
+        while self.clock() < end:
+            self.scheduler.runPending()
+            self.client.deliver(self.on_message)
+            self.clock.sleep(min(end, self.scheduler.nextDeadline()) - self.clock())
+
+    def stop(self):
+        self.running = False
+
+    def on_connect(self, client, userdata, flags, rc):
+        print("Connected with result code " + str(rc))
+        client.subscribe(subscriptions(tcas.MQTT_TCAS_CHANNEL, self.ownshipsByAddress.keys()))
+
+    def on_message(self, client, userdata, msg):
+        sender, receiver = parseTopic(tcas.MQTT_TCAS_CHANNEL, msg.topic)
+        if receiver is not None:
+            ownships = [self.ownshipsByAddress[receiver]] if receiver in self.ownshipsByAddress else []
+        else:
+            ownships = self.ownships
+        if not ownships:
+            return
+        try:
+            message = decodeMessage(msg.topic, msg.payload)
+        except (ValueError, struct.error):
+            return
+        for ownship in ownships:
+            ownship.dispatchMessage(message)
+
+
+def configureOwnships(tcasHost, args):
+    for ownship in tcasHost.ownships:
+        ownship.outboundScheduling = args.outbound
+        ownship.setTracker(args.tracker)
+        ownship.wireFormat = args.wire_format
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='run several dummy planes in one process')
+    parser.add_argument('file', type=str, help='scenario file in the format of "Test Parameter Presets.txt"')
+    parser.add_argument('scenario', type=str, nargs='?', help='scenario index or part of its name', default=None)
+    parser.add_argument('--broker', type=str, help='MQTT broker host', default=tcas.MQTT_TCAS_HOST)
+    parser.add_argument('--list', action='store_true', help='list the scenarios of the file')
+    parser.add_argument('--speed', type=float, help='run N times faster than real time', default=1.0)
+    parser.add_argument('--fast', type=float, metavar='SECONDS',
+                        help='simulate SECONDS in fast time without a broker and print the final state', default=None)
+    parser.add_argument('--outbound', action='store_true',
+                        help='queue, coalesce and rate limit outgoing messages until the end of the tick')
+    parser.add_argument('--tracker', type=str, choices=TRACKER_NAMES, default="difference",
+                        help='rates of the intruders from the last two samples (difference) or a tracking filter')
+    parser.add_argument('--wire-format', type=str, choices=WIRE_FORMATS, default="json",
+                        help='format of the sent messages, received ones are decoded in either format')
+
+    args = parser.parse_args()
+
+    scenarios = loadScenarios(args.file)
+    if args.list or args.scenario is None and len(scenarios) > 1:
+        for i, scenario in enumerate(scenarios):
+            print(f"{i}: {scenario.name} ({len(scenario.planes)} planes)")
+    else:
+        scenario = findScenario(scenarios, args.scenario) if args.scenario is not None else scenarios[0]
+        print(f"Running {scenario.name} with {len(scenario.planes)} planes")
+        if args.fast is not None:
+            # fixed addresses, the RA tie-break depends on them
+            tcasHost = TcasHost(scenario.planes, ManualClock(),
+                                [str(uuid.UUID(int=i + 1)) for i in range(len(scenario.planes))])
+            configureOwnships(tcasHost, args)
+            start = time.perf_counter()
+            tcasHost.simulate(args.fast)
+            elapsed = time.perf_counter() - start
+            for ownship in tcasHost.ownships:
+                own = ownship.ownPlane
+                print(f"{ownship.aircraftIdentification[-4:]}: alt {own.alt:.1f} ft, vs {own.vs:.0f} ft/min, "
+                      f"lat {own.lat:.6f}, long {own.long:.6f}")
+                for address, aircraft in sorted(ownship.knownAircrafts.items()):
+                    print(f"    {address[-4:]}: {aircraft.type}, "
+                          f"{aircraft.advisory.alert if aircraft.advisory else None}")
+            print(f"{args.fast:.0f} s simulated in {elapsed:.3f} s")
+        else:
+            if args.speed <= 0:
+                parser.error("--speed must be positive")
+            tcasHost = TcasHost(scenario.planes, getClock(args.speed))
+            configureOwnships(tcasHost, args)
+            try:
+                tcasHost.run(args.broker)
+            except KeyboardInterrupt:
+                tcasHost.stop()
@@ -0,0 +1,83 @@
+from threading import Lock
+from aircraft import AircraftCategory
+
+INTERROGATION_SILENCE = 5  # sec without a squitter before an aircraft is interrogated
+INTERROGATION_BACKOFF = 1  # sec between the first two interrogations, doubled for every unanswered one
+INTERROGATION_MAX_BACKOFF = 60  # sec
+
+PRIORITIES = {
+    AircraftCategory.RA: 0,
+    AircraftCategory.TA: 1,
+    AircraftCategory.PROXIMATE: 2,
+}
+
+
+def priority(aircraft):
+    # most threatening first, then the shortest time to the closest approach
+    return PRIORITIES.get(aircraft.type, 3), aircraft.getTau()
+
+
+class InterrogationScheduler:
+    # Interrogates silent aircraft within a budget of interrogations per second (token bucket),
+    # aircraft that do not answer are interrogated again after an exponentially growing backoff.
+
+    def __init__(self, send, rate=5, burst=5, silence=INTERROGATION_SILENCE):
+        self.send = send
+        self.rate = rate  # interrogations per second
+        self.burst = burst
+        self.silence = silence
+        self.lock = Lock()
+        self.tokens = burst
+        self.lastRefill = None
+        self.pending = {}  # address -> (attempts, time of the next attempt)
+        self.waiting = set()  # addresses of due aircraft over the budget, counted once until they are interrogated
+        self.stats = {"sent": 0, "answered": 0, "deferred": 0, "unanswered": 0}
+
+    def answered(self, address):
+        # any message of the aircraft answers its interrogation
+        with self.lock:
+            self.waiting.discard(address)
+            if self.pending.pop(address, None) is not None:
+                self.stats["answered"] += 1
+
+    def forget(self, address):
+        with self.lock:
+            self.waiting.discard(address)
+            if self.pending.pop(address, None) is not None:
+                self.stats["unanswered"] += 1
+
+    def run(self, aircrafts, now):
+        with self.lock:
+            if self.lastRefill is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.lastRefill) * self.rate)
+            self.lastRefill = now
+
+            due = []
+            for aircraft in aircrafts:
+                if now - aircraft.lasUpdate <= self.silence:
+                    continue
+                attempt = self.pending.get(aircraft.identification)
+                if attempt is None or attempt[1] <= now:
+                    due.append(aircraft)
+            due.sort(key=priority)
+
+            sending = []
+            for aircraft in due:
+                if self.tokens < 1:
+                    if aircraft.identification not in self.waiting:
+                        self.waiting.add(aircraft.identification)
+                        self.stats["deferred"] += 1
+                    continue
+                self.tokens -= 1
+                self.waiting.discard(aircraft.identification)
+                attempts = self.pending.get(aircraft.identification, (0, now))[0] + 1
+                backoff = min(INTERROGATION_MAX_BACKOFF, INTERROGATION_BACKOFF * 2 ** (attempts - 1))
+                self.pending[aircraft.identification] = (attempts, now + backoff)
+                sending.append(aircraft)
+
+        for aircraft in sending:
+            self.send(aircraft)
+            self.stats["sent"] += 1
+
+    def metrics(self):
+        return dict(self.stats, pending=len(self.pending))
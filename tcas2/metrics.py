@@ -0,0 +1,137 @@
+import os
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+METRICS_PREFIX = "tcas"
+METRICS_HOST = "127.0.0.1"  # only served on localhost
+METRICS_PORT = 9464
+STAGE_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5,
+                 1.0)  # sec
+METRICS_SAMPLE = 64  # every Nth message is timed
+METRICS_FOLD = 4096  # buffered observations before they are folded into the histograms
+
+STAGE_HELP = "Latency of the processing stages: receive, decode, geometry, classification (sampled messages), " \
+             "resolution, snapshot, render and display (snapshot age when drawn)"
+
+
+class Histogram:
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def labelled(label, values):
+    # {value: count} as {((label, value),): count}, copied first, the values may change while they are rendered
+    return {((label, key),): value for key, value in dict(values).items()}
+
+
+class Metrics:
+    # Stage latency histograms plus counters and gauges read at scrape time, rendered in the Prometheus text format.
+    # The message path only appends to a deque (thread safe without the lock), the observations are folded into
+    # the histograms every METRICS_FOLD observations and before rendering.
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self.lock = Lock()
+        self.pending = deque()  # (stage, seconds)
+        self.stages = {}  # stage -> Histogram
+        self.collected = {}  # name -> (type, help, function returning the value or a {labels -> value} dict)
+
+    def observe(self, stage, seconds):
+        self.pending.append((stage, seconds))
+        if len(self.pending) > METRICS_FOLD:
+            self.fold()
+
+    def fold(self):
+        with self.lock:
+            pending = self.pending
+            while pending:
+                stage, seconds = pending.popleft()
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = Histogram()
+                histogram.observe(seconds)
+
+    def counter(self, name, function, help=""):
+        # labels are tuples of (name, value) pairs
+        self.collected[name] = ("counter", help, function)
+
+    def gauge(self, name, function, help=""):
+        self.collected[name] = ("gauge", help, function)
+
+    def render(self):
+        self.fold()
+        lines = []
+        with self.lock:
+            if self.stages:
+                name = f"{self.prefix}_stage_seconds"
+                lines += [f"# HELP {name} {STAGE_HELP}", f"# TYPE {name} histogram"]
+                for stage, histogram in sorted(self.stages.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        for collectedName, (kind, help, function) in sorted(self.collected.items()):
+            name = f"{self.prefix}_{collectedName}"
+            lines += [f"# HELP {name} {help or collectedName}", f"# TYPE {name} {kind}"]
+            value = function()
+            if isinstance(value, dict):
+                lines += [f"{name}{formatLabels(labels)} {v}" for labels, v in sorted(value.items())]
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def writeTextFile(self, path):
+        # replaced as a whole, for the textfile collector of the node exporter
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(self.render())
+        os.replace(temporary, path)
+
+
+class MetricsServer:
+    # GET /metrics on localhost in a daemon thread
+
+    def __init__(self, metrics, host=METRICS_HOST, port=METRICS_PORT):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
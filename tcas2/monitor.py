@@ -0,0 +1,272 @@
+import argparse
+import math
+import os
+import struct
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import numpy as np
+import paho.mqtt.client as mqtt
+import tcas
+from aircraft import AircraftCategory
+from clock import REAL_CLOCK
+from expiry import ExpiryHeap
+from geoUtils import WGS84_A, WGS84_E2, wrapLongitude
+from scheduler import TaskScheduler
+from tcas import TcasThresholds, TCAS_MAX_DISTANCE, TCAS_MAX_VERTICAL_SEPARATION, TCAS_AIRCRAFT_TIMEOUT, \
+    TCAS_PROXIMATE_LIMIT, TCAS_PROXIMATE_VS_LIMIT, TCAS_TA_ONLY_ALTITUDE
+from threatEval import NO_ADVISORY, NO_CATEGORY, TA, classifyThreats
+from wireFormat import MessageMode, MessageType, decodeMessage
+
+MONITOR_SHARD_SIZE = 3.0  # deg of latitude and longitude owned by one shard
+MONITOR_RATE = 1  # Hz, passes over the whole airspace
+MONITOR_CHUNK = 250000  # pairs evaluated at once in a shard
+KNOTS_TO_MS = 0.514444
+SHARD_MARGIN = math.degrees(TCAS_MAX_DISTANCE / (WGS84_A * (1 - WGS84_E2))) * 1.01  # deg of latitude
+
+# Every aircraft is owned by the shard of its latitude / longitude cell. A shard also gets the aircraft within
+# TCAS_MAX_DISTANCE of its cell, so it sees every pair in range of the aircraft it owns. A pair is reported by the
+# shard owning the aircraft with the lower address (the shards are built from the aircraft sorted by address).
+
+Conflict = namedtuple("Conflict", ["category", "distance", "tau", "vSepMin", "verticalSeparation"])
+
+
+def thresholdBands(thresholds):
+    keys = np.array(sorted(thresholds))
+    return keys, [thresholds[k] for k in keys]
+
+
+def classifyPairs(distance, verticalSeparation, rangeRate, verticalRate, alt, agl, keys, bands):
+    # classifyThreats from the side of the aircraft at alt with its altitude band and TA only below
+    # TCAS_TA_ONLY_ALTITUDE, no earlier state, the monitor judges every pass on its own
+    band = np.minimum(np.searchsorted(keys, alt, side="right"), len(keys) - 1)
+    noRA = agl < TCAS_TA_ONLY_ALTITUDE
+    category = np.empty(len(distance), dtype=np.int8)
+    tau = np.empty(len(distance))
+    vSepMin = np.empty(len(distance))
+    for b in np.unique(band):
+        for ta in (False, True):
+            rows = np.flatnonzero((band == b) & (noRA == ta))
+            if len(rows) == 0:
+                continue
+            oldCategory = np.full(len(rows), NO_CATEGORY, dtype=np.int8)
+            oldAdvisory = np.full(len(rows), NO_ADVISORY, dtype=np.int8)
+            category[rows], _, tau[rows], vSepMin[rows] = classifyThreats(
+                distance[rows], verticalSeparation[rows], rangeRate[rows], verticalRate[rows], oldCategory,
+                oldAdvisory, bands[b], ta, TCAS_PROXIMATE_LIMIT, TCAS_PROXIMATE_VS_LIMIT)
+    return category, tau, vSepMin
+
+
+def evaluateShard(job):
+    # all pairs of the owned aircraft with the aircraft of the shard, in a worker process
+    # returns the conflicts (TA and RA) as arrays of global indices and pair values, and the pairs in range
+    indices, owned, lat, long, alt, agl, vs, gs, hdg, thresholds = job
+    keys, bands = thresholdBands(thresholds)
+    east = gs * KNOTS_TO_MS * np.sin(np.radians(hdg))  # m/s
+    north = gs * KNOTS_TO_MS * np.cos(np.radians(hdg))
+    results = []
+    inRange = 0
+    rows = np.flatnonzero(owned)
+    step = max(1, MONITOR_CHUNK // len(indices))
+    for first in range(0, len(rows), step):
+        i, j = np.meshgrid(rows[first:first + step], np.arange(len(indices)), indexing="ij")
+        later = j > i
+        i = i[later]
+        j = j[later]
+        verticalSeparation = alt[i] - alt[j]
+        near = np.abs(verticalSeparation) <= TCAS_MAX_VERTICAL_SEPARATION
+        i, j, verticalSeparation = i[near], j[near], verticalSeparation[near]
+        # local tangent plane at the mid latitude, as NumpyEnuGeometry
+        phi = np.radians((lat[i] + lat[j]) / 2)
+        w = 1 - WGS84_E2 * np.sin(phi) ** 2
+        dNorth = np.radians(lat[j] - lat[i]) * WGS84_A * (1 - WGS84_E2) / (w * np.sqrt(w))
+        dEast = np.radians(wrapLongitude(long[j] - long[i])) * WGS84_A / np.sqrt(w) * np.cos(phi)
+        distance = np.hypot(dNorth, dEast)
+        near = distance <= TCAS_MAX_DISTANCE
+        i, j, verticalSeparation, distance = i[near], j[near], verticalSeparation[near], distance[near]
+        dNorth, dEast = dNorth[near], dEast[near]
+        inRange += len(i)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rangeRate = np.where(distance > 0, (dNorth * (north[j] - north[i]) + dEast * (east[j] - east[i])) /
+                                 distance, 0.0)
+        verticalRate = (vs[i] - vs[j]) / 60  # ft/s
+        # either side may alert, the pair takes the higher category
+        category, tau, vSepMin = classifyPairs(distance, verticalSeparation, rangeRate, verticalRate, alt[i],
+                                               agl[i], keys, bands)
+        other, _, _ = classifyPairs(distance, -verticalSeparation, rangeRate, -verticalRate, alt[j], agl[j], keys,
+                                    bands)
+        category = np.maximum(category, other)
+        conflict = category >= TA
+        results.append((indices[i[conflict]], indices[j[conflict]], category[conflict], distance[conflict],
+                        tau[conflict], vSepMin[conflict], verticalSeparation[conflict]))
+    return results, inRange
+
+
+class ConflictMonitor:
+    # Follows the broadcast squitters of all aircraft on the channel and keeps the TA / RA state of every pair of
+    # aircraft in range of each other. The airspace is cut into shards evaluated in parallel by a process pool, the
+    # results are merged into one conflict table.
+
+    def __init__(self, workers=None, shardSize=MONITOR_SHARD_SIZE, clock=REAL_CLOCK, thresholds=TcasThresholds):
+        self.workers = workers or os.cpu_count()
+        self.shardSize = shardSize  # deg
+        self.clock = clock
+        self.thresholds = thresholds
+        self.lock = Lock()
+        self.states = {}  # address -> (time, lat, long, alt, agl, vs, gs, hdg)
+        self.expiry = ExpiryHeap(TCAS_AIRCRAFT_TIMEOUT)
+        self.conflicts = {}  # (address, address) -> Conflict, lower address first, replaced as a whole every pass
+        self.executor = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        self.client = None
+        self.running = False
+        self.stats = {"squitters": 0, "passes": 0, "aircraft": 0, "shards": 0, "evaluated": 0, "inRange": 0,
+                      "seconds": 0.0}
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def update(self, message):
+        if message.get("mode") != MessageMode.BROADCAST.name or message.get("type") not in (
+                MessageType.SHORT_SQUITTER.name, MessageType.LONG_SQUITTER.name):
+            return
+        data = message.get("data")
+        now = self.clock()
+        with self.lock:
+            self.states[message.get("address")] = (now, data["lat"], data["long"], data["alt"],
+                                                   data.get("agl", data["alt"]), data["vs"], data["gs"], data["hdg"])
+            self.stats["squitters"] += 1
+        self.expiry.touch(message.get("address"), now)
+
+    def on_connect(self, client, userdata, flags, rc):
+        print("Connected with result code " + str(rc))
+        client.subscribe(f"{tcas.MQTT_TCAS_CHANNEL}/#")
+
+    def on_message(self, client, userdata, msg):
+        try:
+            self.update(decodeMessage(msg.topic, msg.payload))
+        except (ValueError, KeyError, struct.error):
+            pass
+
+    def checkTimeouts(self):
+        expired = self.expiry.popExpired(self.clock())
+        with self.lock:
+            for address in expired:
+                self.states.pop(address, None)
+
+    def snapshot(self, now):
+        # addresses sorted and their state dead reckoned to now, as arrays
+        with self.lock:
+            items = sorted(self.states.items())
+        addresses = [address for address, _ in items]
+        t, lat, long, alt, agl, vs, gs, hdg = np.array([state for _, state in items], dtype=float).reshape(-1, 8).T
+        dt = now - t
+        phi = np.radians(lat)
+        w = 1 - WGS84_E2 * np.sin(phi) ** 2
+        lat = lat + np.degrees(gs * KNOTS_TO_MS * np.cos(np.radians(hdg)) * dt * w * np.sqrt(w) /
+                               (WGS84_A * (1 - WGS84_E2)))
+        long = wrapLongitude(long + np.degrees(gs * KNOTS_TO_MS * np.sin(np.radians(hdg)) * dt * np.sqrt(w) /
+                                               (WGS84_A * np.maximum(np.cos(phi), 1e-6))))
+        alt = alt + vs * dt / 60
+        agl = agl + vs * dt / 60
+        return addresses, lat, long, alt, agl, vs, gs, hdg
+
+    def shards(self, lat, long, alt, agl, vs, gs, hdg):
+        # one job per occupied cell, the owned aircraft and those within the margin of the cell, in address order
+        size = self.shardSize
+        cellLat = np.floor(lat / size)
+        cellLong = np.floor(long / size)
+        order = np.argsort(lat)
+        sortedLat = lat[order]
+        jobs = []
+        for cLat in np.unique(cellLat):
+            # the latitude band of the row first, the cells of the row only look at its aircraft
+            centerLat = (cLat + 0.5) * size
+            low, high = np.searchsorted(sortedLat, [centerLat - size / 2 - SHARD_MARGIN,
+                                                    centerLat + size / 2 + SHARD_MARGIN], side="right")
+            band = np.sort(order[low:high])
+            edge = min(90.0, abs(centerLat) + size / 2 + SHARD_MARGIN)
+            longMargin = SHARD_MARGIN / max(math.cos(math.radians(edge)), 1e-3)
+            for cLong in np.unique(cellLong[cellLat == cLat]):
+                centerLong = (cLong + 0.5) * size
+                owned = (cellLat[band] == cLat) & (cellLong[band] == cLong)
+                members = owned | (np.abs(wrapLongitude(long[band] - centerLong)) <= size / 2 + longMargin)
+                indices = band[members]
+                jobs.append((indices, owned[members], lat[indices], long[indices], alt[indices], agl[indices],
+                             vs[indices], gs[indices], hdg[indices], self.thresholds))
+        return jobs
+
+    def evaluate(self):
+        start = time.perf_counter()
+        addresses, lat, long, alt, agl, vs, gs, hdg = self.snapshot(self.clock())
+        jobs = self.shards(lat, long, alt, agl, vs, gs, hdg) if addresses else []
+        if self.executor is not None and len(jobs) > 1:
+            results = list(self.executor.map(evaluateShard, jobs))
+        else:
+            results = [evaluateShard(job) for job in jobs]
+        conflicts = {}
+        inRange = 0
+        for shardResults, shardInRange in results:
+            inRange += shardInRange
+            for i, j, category, distance, tau, vSepMin, verticalSeparation in shardResults:
+                for k in range(len(i)):
+                    conflicts[(addresses[i[k]], addresses[j[k]])] = Conflict(
+                        AircraftCategory(int(category[k])), float(distance[k]), float(tau[k]), float(vSepMin[k]),
+                        float(verticalSeparation[k]))
+        self.conflicts = conflicts
+        self.stats["passes"] += 1
+        self.stats["aircraft"] = len(addresses)
+        self.stats["shards"] = len(jobs)
+        self.stats["evaluated"] = sum(len(job[0]) for job in jobs)
+        self.stats["inRange"] = inRange
+        self.stats["seconds"] = time.perf_counter() - start
+        return conflicts
+
+    def report(self):
+        self.evaluate()
+        ra = sum(conflict.category == AircraftCategory.RA for conflict in self.conflicts.values())
+        print(f"{self.stats['aircraft']} aircraft in {self.stats['shards']} shards, {self.stats['inRange']} pairs in "
+              f"range, {len(self.conflicts) - ra} TA, {ra} RA in {self.stats['seconds'] * 1000:.1f} ms")
+        for (a, b), conflict in sorted(self.conflicts.items(), key=lambda item: item[1].tau):
+            print(f"    {conflict.category.name} {a} {b}: {conflict.distance * tcas.METERS_TO_NM:.2f} NM, "
+                  f"vertSep {round(conflict.verticalSeparation)} ft, tau {conflict.tau:.1f} s, "
+                  f"vSepMin {round(conflict.vSepMin)} ft")
+
+    def run(self, host=tcas.MQTT_TCAS_HOST, port=1883, rate=MONITOR_RATE):
+        self.client = mqtt.Client()
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+        scheduler = TaskScheduler(self.clock, self.clock.sleep)
+        scheduler.add("monitor", self.report, rate)
+        scheduler.add("timeouts", self.checkTimeouts, tcas.TCAS_TASK_RATES["timeouts"])
+        self.running = True
+        try:
+            scheduler.run(lambda: not self.running)
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='all pairs TA / RA monitor of the whole channel')
+    parser.add_argument('--broker', type=str, help='MQTT broker host', default=tcas.MQTT_TCAS_HOST)
+    parser.add_argument('--workers', type=int, help='worker processes, all cores by default', default=None)
+    parser.add_argument('--shard-size', type=float, help='deg of latitude and longitude per shard',
+                        default=MONITOR_SHARD_SIZE)
+    parser.add_argument('--rate', type=float, help='passes per sec', default=MONITOR_RATE)
+
+    args = parser.parse_args()
+
+    conflictMonitor = ConflictMonitor(args.workers, args.shard_size)
+    try:
+        conflictMonitor.run(args.broker, rate=args.rate)
+    except KeyboardInterrupt:
+        conflictMonitor.stop()
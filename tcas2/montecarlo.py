@@ -0,0 +1,263 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from aircraft import AircraftCategory, AdvisoryType
+from clock import ManualClock
+from geoUtils import WGS84_A, WGS84_E2
+from recorder import ReplayClient
+from tcas import Tcas, TcasThresholds, METERS_TO_FEET
+from wireFormat import MessageMode, MessageType
+
+NMAC_HORIZONTAL = 500 / METERS_TO_FEET  # m
+NMAC_VERTICAL = 100  # ft
+PILOT_DELAY = 5  # sec from the first RA until the pilot starts to follow it
+PILOT_ACCELERATION = 0.25 * 9.80665 * METERS_TO_FEET * 60  # ft/min per sec, 0.25 g
+KNOTS_TO_MS = 0.514444
+SQUITTER_PERIOD = 1  # sec, the intruders are classified once per squitter
+SUBSTEPS = 10  # kinematic and NMAC steps per squitter period
+AFTER_CPA = 20  # sec simulated after the last closest point of approach
+ORIGIN = (53.8036111, 10.7148917)  # lat, long in deg, the ownship starts here
+BATCH_SIZE = 200  # encounters per process pool task
+
+# Encounters are drawn around their closest point of approach (CPA): time of the CPA, horizontal and vertical miss
+# distance of the straight line trajectories, speeds, headings and vertical speeds. The ownship runs the Tcas logic
+# (batch evaluation, joint resolution) in fast time and follows its RA after PILOT_DELAY with PILOT_ACCELERATION,
+# the intruders are unequipped and fly straight. NMAC is checked against the flown and the nominal ownship altitude.
+
+
+def generateEncounters(rng, count, intruders):
+    # arrays of shape (count,) for the ownship and (count, intruders) for the intruders
+    shape = (count, intruders)
+    return {
+        "ownAlt": rng.uniform(1500, 35000, count),  # ft at the start
+        "ownVs": np.clip(rng.normal(0, 1000, count), -4000, 4000),  # ft/min
+        "ownGs": rng.uniform(150, 450, count),  # knots
+        "ownHdg": rng.uniform(0, 360, count),  # deg
+        "tCpa": rng.uniform(40, 90, shape),  # sec
+        "hmd": rng.uniform(-2000, 2000, shape),  # m, the sign picks the side
+        "vmd": rng.uniform(-800, 800, shape),  # ft, intruder above the nominal ownship
+        "gs": rng.uniform(100, 450, shape),
+        "hdg": rng.uniform(0, 360, shape),
+        "vs": np.clip(rng.normal(0, 1000, shape), -4000, 4000),
+        "addresses": [[str(uuid.UUID(bytes=rng.bytes(16))) for _ in range(intruders)] for _ in range(count)],
+    }
+
+
+def velocity(gs, hdg):
+    hdg = np.radians(hdg)
+    return gs * KNOTS_TO_MS * np.sin(hdg), gs * KNOTS_TO_MS * np.cos(hdg)  # east, north in m/s
+
+
+def toLatLong(east, north):
+    # local tangent plane at ORIGIN, as EnuGeometry
+    phi = math.radians(ORIGIN[0])
+    w = 1 - WGS84_E2 * math.sin(phi) ** 2
+    lat = ORIGIN[0] + np.degrees(north * w * math.sqrt(w) / (WGS84_A * (1 - WGS84_E2)))
+    long = ORIGIN[1] + np.degrees(east * math.sqrt(w) / (WGS84_A * math.cos(phi)))
+    return lat, long
+
+
+def encounterTracks(encounters, i, times):
+    # ownship (east, north) and intruder (east, north, alt) over times, the intruders fly straight lines through
+    # their CPA with the nominal ownship
+    ownEast, ownNorth = velocity(encounters["ownGs"][i], encounters["ownHdg"][i])
+    east, north = velocity(encounters["gs"][i], encounters["hdg"][i])
+    relativeEast = east - ownEast
+    relativeNorth = north - ownNorth
+    relativeSpeed = np.maximum(np.hypot(relativeEast, relativeNorth), 1e-6)
+    hmd = encounters["hmd"][i]
+    cpaEast = hmd * relativeNorth / relativeSpeed  # perpendicular to the relative velocity
+    cpaNorth = -hmd * relativeEast / relativeSpeed
+    tCpa = encounters["tCpa"][i][:, np.newaxis]
+    dt = times - tCpa
+    intruderEast = ownEast * times + cpaEast[:, np.newaxis] + relativeEast[:, np.newaxis] * dt
+    intruderNorth = ownNorth * times + cpaNorth[:, np.newaxis] + relativeNorth[:, np.newaxis] * dt
+    ownAltAtCpa = encounters["ownAlt"][i] + encounters["ownVs"][i] / 60 * tCpa
+    intruderAlt = ownAltAtCpa + encounters["vmd"][i][:, np.newaxis] + encounters["vs"][i][:, np.newaxis] / 60 * dt
+    return ownEast * times, ownNorth * times, intruderEast, intruderNorth, intruderAlt
+
+
+def squitter(address, lat, long, alt, vs, gs, hdg):
+    return {"mode": MessageMode.BROADCAST.name, "address": address, "type": MessageType.SHORT_SQUITTER.name,
+            "data": {"alt": alt, "agl": alt, "lat": lat, "long": long, "vs": vs, "gs": gs, "hdg": hdg}}
+
+
+def currentRA(ownship):
+    for aircraft in ownship.knownAircrafts.values():
+        advisory = aircraft.advisory
+        if advisory is not None and advisory.type == AdvisoryType.RA and advisory.alert != "RA":
+            return advisory
+    return None
+
+
+def runEncounter(encounters, i, thresholds, geometry):
+    steps = int(math.ceil(encounters["tCpa"][i].max())) + AFTER_CPA
+    times = np.arange(steps * SUBSTEPS) / SUBSTEPS
+    ownEast, ownNorth, intruderEast, intruderNorth, intruderAlt = encounterTracks(encounters, i, times)
+    ownLat, ownLong = toLatLong(ownEast, ownNorth)
+    intruderLat, intruderLong = toLatLong(intruderEast, intruderNorth)
+    addresses = encounters["addresses"][i]
+    gs = encounters["gs"][i]
+    hdg = encounters["hdg"][i]
+    intruderVs = encounters["vs"][i]
+
+    ownship = Tcas(None, True)
+    ownship.aircraftIdentification = str(uuid.UUID(int=i))
+    ownship.client = ReplayClient()
+    ownship.batchEvaluation = True
+    ownship.setGeometry(geometry)
+    ownship.thresholds = thresholds
+    clock = ManualClock()
+    ownship.setClock(clock)
+
+    ownGs = encounters["ownGs"][i]
+    ownHdg = encounters["ownHdg"][i]
+    alt = encounters["ownAlt"][i]
+    vs = encounters["ownVs"][i]
+    alts = np.empty(len(times))
+    firstTA = firstRA = None
+    target = None  # ft/min the pilot is flying towards
+    respond = None  # sec when the pilot starts to follow the RA
+    alert = None
+    dt = SQUITTER_PERIOD / SUBSTEPS
+    for step in range(steps):
+        index = step * SUBSTEPS
+        now = float(times[index])
+        clock.set(now)
+        ownship.ownPlane.setPos(alt=alt, lat=ownLat[index], long=ownLong[index], vs=vs, gs=ownGs, hdg=ownHdg)
+        ownship.spatialIndex.setOwnship(ownLat[index], ownLong[index], alt)
+        for k, address in enumerate(addresses):
+            ownship.listenToSquitter(squitter(address, intruderLat[k, index], intruderLong[k, index],
+                                              intruderAlt[k, index], intruderVs[k], gs[k], hdg[k]))
+        ownship.evaluateThreats()
+
+        if firstTA is None and any(aircraft.type in (AircraftCategory.TA, AircraftCategory.RA)
+                                   for aircraft in ownship.knownAircrafts.values()):
+            firstTA = now
+        advisory = currentRA(ownship)
+        if advisory is not None and advisory.alert != alert:
+            # first RA or a reversal, the advised change is the band edge closest to the current vertical speed
+            alert = advisory.alert
+            target = vs + advisory.maximalVerticalSpeed
+            if firstRA is None:
+                firstRA = now
+                respond = now + PILOT_DELAY
+
+        for j in range(SUBSTEPS):
+            alts[index + j] = alt
+            if target is not None and now + j * dt >= respond:
+                change = PILOT_ACCELERATION * dt
+                vs = min(vs + change, target) if target > vs else max(vs - change, target)
+            alt += vs / 60 * dt
+
+    horizontal = np.hypot(intruderEast - ownEast, intruderNorth - ownNorth)
+    nominalAlts = encounters["ownAlt"][i] + encounters["ownVs"][i] / 60 * times
+    vertical = np.abs(intruderAlt - alts)
+    nominalVertical = np.abs(intruderAlt - nominalAlts)
+    close = horizontal < NMAC_HORIZONTAL
+    return {
+        "nmac": bool((close & (vertical < NMAC_VERTICAL)).any()),
+        "nominalNmac": bool((close & (nominalVertical < NMAC_VERTICAL)).any()),
+        "ta": firstTA is not None,
+        "ra": firstRA is not None,
+        "timeToRa": math.nan if firstRA is None else firstRA,
+        "raLead": math.nan if firstRA is None else float(encounters["tCpa"][i].min()) - firstRA,  # sec before the first CPA
+    }
+
+
+def runBatch(job):
+    # one process pool task, all randomness comes from the seed sequence of the batch
+    seedSequence, count, intruders, thresholds, geometry = job
+    rng = np.random.default_rng(seedSequence)
+    encounters = generateEncounters(rng, count, intruders)
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(count):
+            results.append(runEncounter(encounters, i, thresholds, geometry))
+    return {key: np.array([result[key] for result in results]) for key in results[0]}
+
+
+def percentiles(values, fractions=(0.05, 0.5, 0.95)):
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return [math.nan] * len(fractions)
+    return [float(np.quantile(values, fraction)) for fraction in fractions]
+
+
+def summarize(results, seconds):
+    count = len(results["nmac"])
+    nmac = int(results["nmac"].sum())
+    nominalNmac = int(results["nominalNmac"].sum())
+    leadP5, leadP50, leadP95 = percentiles(results["raLead"])
+    return {
+        "encounters": count,
+        "seconds": seconds,
+        "nmac": nmac,
+        "nominalNmac": nominalNmac,
+        "riskRatio": nmac / nominalNmac if nominalNmac else math.nan,
+        "induced": int((results["nmac"] & ~results["nominalNmac"]).sum()),
+        "resolved": int((~results["nmac"] & results["nominalNmac"]).sum()),
+        "taRate": float(results["ta"].mean()),
+        "raRate": float(results["ra"].mean()),
+        "raLeadP5": leadP5,
+        "raLeadP50": leadP50,
+        "raLeadP95": leadP95,
+        "timeToRaP50": percentiles(results["timeToRa"], (0.5,))[0],
+    }
+
+
+def runMonteCarlo(encounters, intruders=1, seed=0, workers=None, batchSize=BATCH_SIZE, thresholds=None,
+                  geometry="enu"):
+    # the batches and their seeds only depend on seed and batchSize, the result does not depend on workers
+    thresholds = TcasThresholds if thresholds is None else thresholds
+    batches = (encounters + batchSize - 1) // batchSize
+    seeds = np.random.SeedSequence(seed).spawn(batches)
+    jobs = [(seeds[b], min(batchSize, encounters - b * batchSize), intruders, thresholds, geometry)
+            for b in range(batches)]
+    start = time.perf_counter()
+    if workers == 1:
+        parts = list(map(runBatch, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(runBatch, jobs))
+    results = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    return summarize(results, time.perf_counter() - start)
+
+
+def loadThresholds(path):
+    with open(path) as file:
+        return {int(altitude): threshold for altitude, threshold in json.load(file).items()}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='fast time Monte Carlo encounters through the Tcas logic')
+    parser.add_argument('--encounters', type=int, help='number of encounters', default=1000)
+    parser.add_argument('--intruders', type=int, help='intruders per encounter', default=1)
+    parser.add_argument('--seed', type=int, help='seed of the random geometries', default=0)
+    parser.add_argument('--workers', type=int, help='processes, all cores by default', default=None)
+    parser.add_argument('--batch', type=int, help='encounters per process pool task', default=BATCH_SIZE)
+    parser.add_argument('--thresholds', type=str, help='json file replacing TcasThresholds', default=None)
+    parser.add_argument('--geometry', type=str, help='geodesic, enu or numpy', default="enu")
+    parser.add_argument('--output', type=str, help='write the summary as json', default=None)
+
+    args = parser.parse_args()
+
+    summary = runMonteCarlo(args.encounters, args.intruders, args.seed, args.workers, args.batch,
+                            loadThresholds(args.thresholds) if args.thresholds else None, args.geometry)
+    print(f"{summary['encounters']} encounters with {args.intruders} intruder(s) in {summary['seconds']:.1f} s")
+    print(f"NMAC {summary['nmac']} (nominal {summary['nominalNmac']}, risk ratio {summary['riskRatio']:.3f}, "
+          f"induced {summary['induced']}, resolved {summary['resolved']})")
+    print(f"TA rate {summary['taRate']:.3f}, RA rate {summary['raRate']:.3f}, median time to RA "
+          f"{summary['timeToRaP50']:.1f} s")
+    print(f"RA before CPA p5 {summary['raLeadP5']:.1f} s, p50 {summary['raLeadP50']:.1f} s, "
+          f"p95 {summary['raLeadP95']:.1f} s")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=2)
@@ -0,0 +1,110 @@
+import time
+from collections import deque
+from threading import Lock
+from wireFormat import MessageMode, MessageType
+
+# resolution coordination is never delayed or merged
+IMMEDIATE_TYPES = (MessageType.RESOLUTION_REQUEST.name, MessageType.RESOLUTION_RESPONSE.name)
+
+PRIORITIES = {
+    MessageType.LONG_SQUITTER.name: 0,
+    MessageType.INTEROGATION.name: 1,
+    MessageType.SHORT_SQUITTER.name: 2,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class OutboundScheduler:
+    # Queues outgoing messages until the next flush:
+    #   a newer message of the same type to the same receiver replaces the pending one
+    #   several pending long squitters are sent as one broadcast long squitter, which also replaces the short squitter
+    #   a token bucket limits the messages per second, messages over budget wait for the next flush
+
+    def __init__(self, transmit, rate=10, burst=10, clock=time.monotonic):
+        self.transmit = transmit
+        self.rate = rate  # messages per second
+        self.burst = burst
+        self.clock = clock
+        self.lock = Lock()
+        self.pending = {}  # (type, receiver) -> (queued, message)
+        self.waiting = set()  # keys of pending messages over the budget, counted once until they are published
+        self.tokens = burst
+        self.lastRefill = clock()
+        self.latencies = deque(maxlen=1000)  # sec from enqueue to publish
+        self.stats = {"queued": 0, "coalesced": 0, "merged": 0, "published": 0, "deferred": 0, "immediate": 0}
+
+    def setClock(self, clock):
+        # the budget refills from the time of the new clock
+        self.clock = clock
+        self.lastRefill = clock()
+
+    def enqueue(self, message):
+        if message.get("type") in IMMEDIATE_TYPES:
+            self.stats["immediate"] += 1
+            self.transmit(message)
+            return
+        key = (message.get("type"), message.get("receiver"))
+        with self.lock:
+            self.stats["queued"] += 1
+            old = self.pending.get(key)
+            if old is not None:
+                self.stats["coalesced"] += 1
+                self.pending[key] = (old[0], message)
+            else:
+                self.pending[key] = (self.clock(), message)
+
+    def mergeLongSquitters(self):
+        longSquitters = [key for key in self.pending if key[0] == MessageType.LONG_SQUITTER.name]
+        if len(longSquitters) < 2:
+            return
+        queued = min(self.pending[key][0] for key in longSquitters)
+        message = self.pending[longSquitters[-1]][1]
+        for key in longSquitters:
+            self.pending.pop(key)
+        merged = dict(message, mode=MessageMode.BROADCAST.name)
+        merged.pop("receiver", None)
+        self.pending[(MessageType.LONG_SQUITTER.name, None)] = (queued, merged)
+        self.stats["merged"] += len(longSquitters) - 1
+
+    def flush(self):
+        with self.lock:
+            self.mergeLongSquitters()
+            if (MessageType.LONG_SQUITTER.name, None) in self.pending and \
+                    self.pending.pop((MessageType.SHORT_SQUITTER.name, None), None) is not None:
+                self.stats["merged"] += 1
+
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.lastRefill) * self.rate)
+            self.lastRefill = now
+            ready = sorted(self.pending.items(), key=lambda item: (PRIORITIES.get(item[0][0], 3), item[1][0]))
+            sending = []
+            for key, (queued, message) in ready:
+                if self.tokens < 1:
+                    if key not in self.waiting:
+                        self.waiting.add(key)
+                        self.stats["deferred"] += 1
+                    continue
+                self.tokens -= 1
+                self.pending.pop(key)
+                sending.append((queued, message))
+            self.waiting.intersection_update(self.pending)  # published, merged or replaced by a merge
+
+        for queued, message in sending:
+            self.transmit(message)
+            self.latencies.append(self.clock() - queued)
+            self.stats["published"] += 1
+
+    def queueDepth(self):
+        return len(self.pending)
+
+    def metrics(self):
+        latencies = list(self.latencies)
+        return dict(self.stats, queueDepth=self.queueDepth(),
+                    latencyP50=percentile(latencies, 0.5), latencyP95=percentile(latencies, 0.95),
+                    latencyMax=max(latencies) if latencies else 0.0)
@@ -1,8 +1,8 @@
 from enum import Enum
 import geopy
 import geopy.distance
-import time
-from SimConnect import *
+from clock import REAL_CLOCK
+from geoUtils import GeodesicGeometry
 
 ALTITUDE_KEY = "PLANE_ALTITUDE"
 ALTITUDE_AGL_KEY = "PLANE_ALT_ABOVE_GROUND"
@@ -22,8 +22,10 @@ class Transponder(Enum):
 
 
 class Plane:
+    # ownship position from Microsoft Flight Simulator, SimConnect is only imported on connect
 
-    def __init__(self):
+    def __init__(self, clock=REAL_CLOCK):
+        self.clock = clock
         self.transponder = Transponder.ModeS
         self.sm = None
         self.aq = None
@@ -38,9 +40,13 @@ class Plane:
         self.point = geopy.Point(0, 0, 0)
 
     def connect(self):
+        from SimConnect import SimConnect, AircraftRequests
         self.sm = SimConnect()
         self.aq = AircraftRequests(self.sm, _time=500)
 
+    def setClock(self, clock):
+        self.clock = clock
+
     def update(self):
         if self.aq is None:
             self.connect()
@@ -60,9 +66,10 @@ class Plane:
 
 
 class PlaneDummy(Plane):
-    def __init__(self):
-        super().__init__()
-        self.lastTime = time.monotonic()
+    def __init__(self, clock=REAL_CLOCK):
+        super().__init__(clock)
+        self.lastTime = clock()
+        self.geometry = GeodesicGeometry()
 
     def setPos(self, alt, lat, long, vs, gs, hdg):
         self.alt = alt
@@ -72,25 +79,32 @@ class PlaneDummy(Plane):
         self.hdg = hdg
         self.vs = vs
         self.gs = gs
-        self.lastTime = time.monotonic()
+        self.lastTime = self.clock()
 
     def connect(self):
         pass
 
+    def setClock(self, clock):
+        # keeps the position and moves on from the time of the new clock
+        self.clock = clock
+        self.lastTime = clock()
+
     def update(self):
+        self.moveTo(self.clock())
+
+    def moveTo(self, now):
         # calculate position from time
         # time passed in sec
-        dtime = time.monotonic() - self.lastTime
-        self.lastTime = time.monotonic()
+        dtime = now - self.lastTime
+        self.lastTime = now
         # altitude
         self.alt = self.alt + self.vs * dtime / 60                                              # ft + ft/min * sec / 60
         self.alt_agl = self.alt
         # new position
         knttoms = 0.514444
-        range = self.gs * knttoms * dtime / 1000                                  # gs in knots to m/s * time in s to km
-        self.point = geopy.distance.distance(kilometers=range).destination(point=geopy.Point(latitude=self.lat, longitude=self.long), bearing=self.hdg)
-        self.lat = self.point.latitude
-        self.long = self.point.longitude
+        range = self.gs * knttoms * dtime                                         # gs in knots to m/s * time in s to m
+        self.lat, self.long = self.geometry.destination(self.lat, self.long, self.hdg, range)
+        self.point = geopy.Point(latitude=self.lat, longitude=self.long)
         # self.hdg = (self.hdg + 10) % 360
 
         # print(f"alt: {self.alt}, lat: {self.lat}, long: {self.long}, vs: {self.vs}, gs: {self.gs}")
@@ -0,0 +1,25 @@
+import importlib
+from clock import REAL_CLOCK
+
+# Ownship position sources by name, as "module.Class". The module is only imported when the source is used, so
+# SimConnect, tkinter or a recording are never loaded by a node that does not need them. A source is created as
+# Class(clock=clock, **options) and provides update(), connect(), setClock(clock), getAsDict() and the plane fields.
+POSITION_SOURCES = {
+    "simconnect": "plane.Plane",
+    "dummy": "plane.PlaneDummy",
+    "replay": "trajectory.ReplayPlane",  # options: path of a recording
+    "scripted": "trajectory.ScriptedPlane",  # options: path of a script, or script
+}
+
+
+def registerPositionSource(name, className):
+    POSITION_SOURCES[name] = className
+
+
+def getPositionSource(name):
+    moduleName, className = POSITION_SOURCES[name].rsplit(".", 1)
+    return getattr(importlib.import_module(moduleName), className)
+
+
+def createPositionSource(name, clock=REAL_CLOCK, **options):
+    return getPositionSource(name)(clock=clock, **options)
@@ -0,0 +1,203 @@
+import argparse
+import mmap
+import struct
+import time
+from collections import namedtuple
+from threading import Lock
+from time import monotonic
+from clock import ManualClock
+from scheduler import TaskScheduler
+from wireFormat import MessageMode, MessageType, decodeMessage
+
+# log layout, little endian:
+#   header:  magic, address of the recording node (uuid string, 36 bytes)
+#   records: payload length, time in sec (monotonic clock of the node), direction, topic length, topic, payload
+MAGIC = b"TCASLOG1"
+HEADER = struct.Struct("<8s36s")
+RECORD = struct.Struct("<IdBH")
+RECORDER_FLUSH_PERIOD = 0.5  # sec, at most this much of the log is lost when the node crashes
+
+RECEIVED = 0
+SENT = 1
+
+Record = namedtuple("Record", ["time", "direction", "topic", "payload"])
+RecordedMessage = namedtuple("RecordedMessage", ["topic", "payload"])  # stands in for the paho message
+
+
+class Recorder:
+    # writes every message a node receives or sends to a new log, an existing one is replaced since a log holds the
+    # session of one node, the file is flushed every RECORDER_FLUSH_PERIOD
+
+    def __init__(self, path, address):
+        self.lock = Lock()
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, address.encode()))
+        self.file.flush()
+        self.flushed = monotonic()
+        self.records = 0
+
+    def record(self, direction, topic, payload, time):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        topic = topic.encode()
+        with self.lock:
+            self.file.write(RECORD.pack(len(payload), time, direction, len(topic)))
+            self.file.write(topic)
+            self.file.write(payload)
+            self.records += 1
+            now = monotonic()
+            if now - self.flushed >= RECORDER_FLUSH_PERIOD:
+                self.file.flush()
+                self.flushed = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class Recording:
+    # memory mapped log, records are read in place
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, address = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a TCAS recording")
+        self.address = address.decode()
+
+    def __iter__(self):
+        offset = HEADER.size
+        end = len(self.map)
+        while offset + RECORD.size <= end:
+            payloadLength, time, direction, topicLength = RECORD.unpack_from(self.map, offset)
+            offset += RECORD.size
+            if offset + topicLength + payloadLength > end:
+                break  # record cut off while recording
+            topic = self.map[offset:offset + topicLength].decode()
+            offset += topicLength
+            payload = self.map[offset:offset + payloadLength]
+            offset += payloadLength
+            yield Record(time, direction, topic, payload)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def ownshipData(record):
+    # position data of a squitter the node sent, None for any other record
+    if record.direction != SENT:
+        return None
+    try:
+        message = decodeMessage(record.topic, record.payload)
+    except (ValueError, struct.error):
+        return None
+    if message.get("mode") != MessageMode.BROADCAST.name or message.get("type") not in (
+            MessageType.SHORT_SQUITTER.name, MessageType.LONG_SQUITTER.name):
+        return None
+    return message.get("data")
+
+
+class ReplayClient:
+    # takes the place of the mqtt client, counts what the replayed node would have sent
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published += 1
+
+
+class Replay:
+    # Feeds the received messages of a recording into a headless Tcas on the recorded time line.
+    # The ownship follows the recorded squitters of the node, squitters and interrogations are not sent again.
+    # speed 1 replays in real time, N N times faster, None as fast as possible.
+
+    def __init__(self, recording, tcas, speed=1.0, sleep=time.sleep):
+        self.recording = recording
+        self.tcas = tcas
+        self.speed = speed
+        self.sleep = sleep
+        self.clock = ManualClock()  # recorded time of the current record
+        self.stats = {"received": 0, "ownship": 0, "seconds": 0.0}
+
+        tcas.aircraftIdentification = recording.address
+        tcas.client = ReplayClient()
+        tcas.setClock(self.clock)
+
+    def applyOwnship(self, record):
+        data = ownshipData(record)
+        if data is None:
+            return
+        ownPlane = self.tcas.ownPlane
+        ownPlane.setPos(alt=data["alt"], lat=data["lat"], long=data["long"], vs=data["vs"], gs=data["gs"],
+                        hdg=data["hdg"])
+        ownPlane.alt_agl = data["agl"]
+        self.tcas.spatialIndex.setOwnship(ownPlane.lat, ownPlane.long, ownPlane.alt)
+        self.stats["ownship"] += 1
+
+    def run(self):
+        tcas = self.tcas
+        records = iter(self.recording)
+        first = next(records, None)
+        if first is None:
+            return self.stats
+        self.clock.set(first.time)
+        scheduler = TaskScheduler(clock=self.clock, sleep=lambda _: None)
+        if tcas.batchEvaluation:
+            scheduler.add("threats", tcas.evaluateThreats, tcas.taskRates["threats"])
+        else:
+            scheduler.add("resolution", tcas.resolveThreats, tcas.taskRates["resolution"])
+        if tcas.outboundScheduling:
+            scheduler.add("outbound", tcas.outbound.flush, tcas.taskRates["outbound"])
+        scheduler.add("coordination", tcas.retransmitResolutions, tcas.taskRates["coordination"])
+        scheduler.add("timeouts", tcas.checkAircraftTimout, tcas.taskRates["timeouts"])
+        scheduler.add("display", tcas.publishSnapshot, tcas.taskRates["display"])
+        if tcas.metrics is not None and tcas.metricsFile is not None:
+            scheduler.add("metrics", tcas.writeMetrics, tcas.taskRates["metrics"])
+
+        start = time.perf_counter()
+        record = first
+        while record is not None:
+            if self.speed:
+                delay = (record.time - first.time) / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    self.sleep(delay)
+            self.clock.set(record.time)
+            scheduler.runPending()
+            if record.direction == SENT:
+                self.applyOwnship(record)
+            else:
+                tcas.on_message(None, None, RecordedMessage(record.topic, bytes(record.payload)))
+                self.stats["received"] += 1
+            record = next(records, None)
+        self.stats["seconds"] = time.perf_counter() - start
+        return self.stats
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='replay a recorded channel log into a headless TCAS')
+    parser.add_argument('file', type=str, help='log written by Recorder')
+    parser.add_argument('--speed', type=float, help='replay speed, 0 for as fast as possible', default=0)
+    parser.add_argument('--batch', action='store_true', help='batch threat evaluation')
+    parser.add_argument('--metrics-file', type=str, help='write Prometheus metrics of the replay to this text file',
+                        default=None)
+
+    args = parser.parse_args()
+
+    from tcas import Tcas
+
+    recording = Recording(args.file)
+    tcas = Tcas(None, True)
+    tcas.batchEvaluation = args.batch
+    if args.metrics_file is not None:
+        tcas.enableMetrics(path=args.metrics_file)
+    stats = Replay(recording, tcas, speed=args.speed or None).run()
+    if tcas.metrics is not None:
+        tcas.writeMetrics()
+    recording.close()
+    rate = stats["received"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"{stats['received']} messages, {stats['ownship']} ownship updates in {stats['seconds']:.3f} s "
+          f"({rate:.0f} messages/s), {len(tcas.knownAircrafts)} aircraft known at the end")
@@ -0,0 +1,199 @@
+import math
+from collections import namedtuple
+import numpy as np
+
+VS_STEP = 100  # ft/min, resolution of the advised vertical speeds
+
+# climbBands / descendBands are lists of (lowest, highest) vertical speed additions in ft/min
+# that reach the required separation, minimal/maximalVerticalSpeed keep the meaning of the advisory fields
+Resolution = namedtuple("Resolution", ["climb", "minimalVerticalSpeed", "maximalVerticalSpeed",
+                                       "climbBands", "descendBands"])
+
+
+# vSepMin(vsPlus) = |vSep + (verticalRate + vsPlus / 60) * tau| is linear inside the abs, so the vertical speeds
+# reaching zthr are a prefix (separation below -zthr) and a suffix (separation above zthr) of every sweep range.
+# Both boundaries are solved directly and then snapped onto the grid with the exact separation expression.
+
+def separation(verticalSeparation, verticalRate, tau, vsPlus):
+    return verticalSeparation + (verticalRate + vsPlus / 60) * tau  # to ft/sec
+
+
+def firstAbove(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd):
+    # smallest grid index whose separation is above zthr, kEnd + 1 if none
+    try:
+        k = math.floor(((zthr - verticalSeparation) / tau - verticalRate) * 60 / VS_STEP) + 1
+    except (ZeroDivisionError, OverflowError, ValueError):
+        # separation does not depend on the vertical speed
+        return kStart if separation(verticalSeparation, verticalRate, tau, kStart * VS_STEP) > zthr else kEnd + 1
+    k = min(max(k, kStart), kEnd + 1)
+    while k > kStart and separation(verticalSeparation, verticalRate, tau, (k - 1) * VS_STEP) > zthr:
+        k -= 1
+    while k <= kEnd and not separation(verticalSeparation, verticalRate, tau, k * VS_STEP) > zthr:
+        k += 1
+    return k
+
+
+def lastBelow(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd):
+    # largest grid index whose separation is below -zthr, kStart - 1 if none
+    try:
+        k = math.ceil(((-zthr - verticalSeparation) / tau - verticalRate) * 60 / VS_STEP) - 1
+    except (ZeroDivisionError, OverflowError, ValueError):
+        return kEnd if separation(verticalSeparation, verticalRate, tau, kEnd * VS_STEP) < -zthr else kStart - 1
+    k = min(max(k, kStart - 1), kEnd)
+    while k < kEnd and separation(verticalSeparation, verticalRate, tau, (k + 1) * VS_STEP) < -zthr:
+        k += 1
+    while k >= kStart and not separation(verticalSeparation, verticalRate, tau, k * VS_STEP) < -zthr:
+        k -= 1
+    return k
+
+
+def solveBands(verticalSeparation, verticalRate, tau, zthr, vsFrom, vsTo):
+    kStart = vsFrom // VS_STEP
+    kEnd = (vsTo - 1) // VS_STEP
+    below = lastBelow(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd)
+    above = firstAbove(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd)
+    bands = []
+    if below >= kStart:
+        bands.append((kStart * VS_STEP, below * VS_STEP))
+    if above <= kEnd:
+        bands.append((above * VS_STEP, kEnd * VS_STEP))
+    return bands
+
+
+def solveResolution(verticalSeparation, verticalRate, tau, zthr, allowClimb=True, allowDescend=True,
+                    vsMin=-10000, vsMax=10000):
+    climbBands = solveBands(verticalSeparation, verticalRate, tau, zthr, 0, vsMax) if allowClimb else []
+    descendBands = solveBands(verticalSeparation, verticalRate, tau, zthr, vsMin, 0) if allowDescend else []
+
+    # the sense is chosen by the separation reached at the lowest vertical speed of each sweep
+    climbLow = climbBands[0][0] if climbBands else 0
+    climbHigh = climbBands[-1][1] if climbBands else 0
+    descendLow = descendBands[0][0] if descendBands else 0
+    descendHigh = descendBands[-1][1] if descendBands else 0
+    climbSeparation = abs(separation(verticalSeparation, verticalRate, tau, climbLow)) if climbBands else 0
+    descendSeparation = abs(separation(verticalSeparation, verticalRate, tau, descendLow)) if descendBands else 0
+
+    if climbSeparation > descendSeparation:
+        return Resolution(True, climbHigh, climbLow, climbBands, descendBands)
+    return Resolution(False, descendLow, descendHigh, climbBands, descendBands)
+
+
+def firstAboveBatch(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd):
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        estimate = np.floor(((zthr - verticalSeparation) / tau - verticalRate) * 60 / VS_STEP) + 1
+    constant = separation(verticalSeparation, verticalRate, tau, kStart * VS_STEP) > zthr
+    estimate = np.where(np.isfinite(estimate) & (tau != 0), estimate, np.where(constant, kStart, kEnd + 1))
+    k = np.clip(estimate, kStart, kEnd + 1).astype(np.int64)
+    for _ in range(2):
+        k -= (k > kStart) & (separation(verticalSeparation, verticalRate, tau, (k - 1) * VS_STEP) > zthr)
+        k += (k <= kEnd) & ~(separation(verticalSeparation, verticalRate, tau, k * VS_STEP) > zthr)
+    return k
+
+
+def lastBelowBatch(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd):
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        estimate = np.ceil(((-zthr - verticalSeparation) / tau - verticalRate) * 60 / VS_STEP) - 1
+    constant = separation(verticalSeparation, verticalRate, tau, kEnd * VS_STEP) < -zthr
+    estimate = np.where(np.isfinite(estimate) & (tau != 0), estimate, np.where(constant, kEnd, kStart - 1))
+    k = np.clip(estimate, kStart - 1, kEnd).astype(np.int64)
+    for _ in range(2):
+        k += (k < kEnd) & (separation(verticalSeparation, verticalRate, tau, (k + 1) * VS_STEP) < -zthr)
+        k -= (k >= kStart) & ~(separation(verticalSeparation, verticalRate, tau, k * VS_STEP) < -zthr)
+    return k
+
+
+def solveSenseBatch(verticalSeparation, verticalRate, tau, zthr, vsFrom, vsTo, allow):
+    # lowest and highest solving vertical speed of one sweep range, solvable mask
+    kStart = vsFrom // VS_STEP
+    kEnd = (vsTo - 1) // VS_STEP
+    below = lastBelowBatch(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd)
+    above = firstAboveBatch(verticalSeparation, verticalRate, tau, zthr, kStart, kEnd)
+    solvable = ((below >= kStart) | (above <= kEnd)) & allow
+    low = np.where(below >= kStart, kStart, above) * VS_STEP
+    high = np.where(above <= kEnd, kEnd, below) * VS_STEP
+    low = np.where(solvable, low, 0)
+    high = np.where(solvable, high, 0)
+    return low, high, solvable
+
+
+def solveResolutions(verticalSeparation, verticalRate, tau, zthr, allowClimb=True, allowDescend=True,
+                     vsMin=-10000, vsMax=10000):
+    # batch form of solveResolution, returns climb, minimalVerticalSpeed and maximalVerticalSpeed arrays
+    verticalSeparation = np.asarray(verticalSeparation, dtype=float)
+    verticalRate = np.asarray(verticalRate, dtype=float)
+    tau = np.asarray(tau, dtype=float)
+    climbLow, climbHigh, climbSolvable = solveSenseBatch(verticalSeparation, verticalRate, tau, zthr, 0, vsMax,
+                                                         allowClimb)
+    descendLow, descendHigh, descendSolvable = solveSenseBatch(verticalSeparation, verticalRate, tau, zthr, vsMin, 0,
+                                                               allowDescend)
+    with np.errstate(invalid="ignore", over="ignore"):
+        climbSeparation = np.where(climbSolvable,
+                                   np.abs(separation(verticalSeparation, verticalRate, tau, climbLow)), 0)
+        descendSeparation = np.where(descendSolvable,
+                                     np.abs(separation(verticalSeparation, verticalRate, tau, descendLow)), 0)
+    climb = climbSeparation > descendSeparation
+    minimal = np.where(climb, climbHigh, descendLow)
+    maximal = np.where(climb, climbLow, descendHigh)
+    return climb, minimal, maximal
+
+
+JointResolution = namedtuple("JointResolution", ["climb", "minimalVerticalSpeed", "maximalVerticalSpeed", "margin",
+                                                 "satisfied"])
+
+
+def solveJointResolution(verticalSeparation, verticalRate, tau, zthr, allowClimb=True, allowDescend=True,
+                         vsMin=-10000, vsMax=10000, climb=None):
+    # One sense and vertical speed band for all threats: the grid of vertical speed additions x threats is
+    # evaluated at once, a vertical speed satisfies a threat when its separation at the closest approach is above
+    # zthr. Without a vertical speed satisfying all of them the one with the largest smallest separation (maximin)
+    # is advised alone. climb fixes the sense (it was accepted from an intruder).
+    # margin is the smallest separation at the advised vertical speed closest to the current one.
+    # The band is the run of satisfying vertical speeds around the advised one, a run of the other sense or one
+    # beyond speeds that do not satisfy every threat is left out.
+    # A single threat without a fixed sense keeps the sense rule of solveResolution (the separation reached at the
+    # lowest solving vertical speed of each sweep) and its bands, so one intruder is advised as before.
+    if climb is None and len(verticalSeparation) == 1:
+        single = solveResolution(verticalSeparation[0], verticalRate[0], tau[0], zthr, allowClimb, allowDescend,
+                                 vsMin, vsMax)
+        if single.climbBands or single.descendBands:
+            nearest = single.climbBands[0][0] if single.climb else single.descendBands[-1][1]
+            margin = abs(separation(verticalSeparation[0], verticalRate[0], tau[0], nearest))
+            return JointResolution(single.climb, single.minimalVerticalSpeed, single.maximalVerticalSpeed,
+                                   float(margin), True)
+    verticalSeparation = np.asarray(verticalSeparation, dtype=float)[:, np.newaxis]
+    verticalRate = np.asarray(verticalRate, dtype=float)[:, np.newaxis]
+    tau = np.asarray(tau, dtype=float)[:, np.newaxis]
+    k = np.arange(vsMin // VS_STEP, (vsMax - 1) // VS_STEP + 1)
+    allowed = np.where(k >= 0, allowClimb, allowDescend)
+    if climb is not None:
+        allowed &= (k >= 0) == climb
+    if not allowed.any():
+        return JointResolution(False, 0, 0, 0.0, False)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        grid = np.abs(separation(verticalSeparation, verticalRate, tau, k * VS_STEP))
+    margin = np.where(allowed, np.nan_to_num(grid, nan=0.0).min(axis=0), -np.inf)
+    satisfied = margin > zthr
+
+    if satisfied.any():
+        # the sense that needs the smaller change of the vertical speed, then the larger margin there
+        best = None
+        for sense in (True, False):
+            solving = np.flatnonzero(satisfied & ((k >= 0) == sense))
+            if len(solving) == 0:
+                continue
+            nearest = solving[np.argmin(np.abs(k[solving]))]
+            key = (abs(k[nearest]), -margin[nearest])
+            if best is None or key < best[0]:
+                best = (key, sense, nearest, solving)
+        _, sense, nearest, solving = best
+        runs = np.split(solving, np.flatnonzero(np.diff(solving) != 1) + 1)
+        band = next(run for run in runs if run[0] <= nearest <= run[-1])
+        low = int(k[band[0]]) * VS_STEP
+        high = int(k[band[-1]]) * VS_STEP
+        resolution = (high, low) if sense else (low, high)  # field meaning of solveResolution
+        return JointResolution(sense, resolution[0], resolution[1], float(margin[nearest]), True)
+
+    nearest = int(np.argmax(margin))
+    vs = int(k[nearest]) * VS_STEP
+    return JointResolution(bool(k[nearest] >= 0), vs, vs, float(margin[nearest]), False)
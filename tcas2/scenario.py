@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+# one dummy plane: lat, long in deg, alt in ft, vs in ft/min, gs in knots, hdg in deg
+PlaneSetup = namedtuple("PlaneSetup", ["lat", "long", "alt", "vs", "gs", "hdg"])
+Scenario = namedtuple("Scenario", ["name", "planes"])
+
+
+def parsePlane(line):
+    # "python .\client.py True lat long alt vs gs hdg" as in the presets or just "lat long alt vs gs hdg"
+    tokens = line.split()
+    for i, token in enumerate(tokens):
+        if token.endswith("client.py"):
+            tokens = tokens[i + 2:]
+            break
+    if len(tokens) != 6:
+        return None
+    try:
+        return PlaneSetup(*[float(token) for token in tokens])
+    except ValueError:
+        return None
+
+
+def isSection(lines, i):
+    # "Collision unter Afrika:" or a title standing alone between blank lines like "Airspace Lübeck"
+    line = lines[i]
+    if line.endswith(":"):
+        return True
+    before = lines[i - 1] if i > 0 else ""
+    after = lines[i + 1] if i + 1 < len(lines) else ""
+    return not before and not after
+
+
+def loadScenarios(path):
+    # every block of consecutive plane lines is a scenario, named after the section and the line above the block
+    scenarios = []
+    section = ""
+    heading = ""
+    planes = []
+    with open(path, encoding="utf-8") as file:
+        lines = [line.strip() for line in file]
+    for i, line in enumerate(lines):
+        plane = parsePlane(line)
+        if plane is not None:
+            planes.append(plane)
+            continue
+        if planes:
+            scenarios.append(Scenario(f"{section} {heading}".strip(), planes))
+            planes = []
+        if not line:
+            continue
+        if isSection(lines, i):
+            section = line if line.endswith(":") else line + ":"
+            heading = ""
+        else:
+            heading = line
+    if planes:
+        scenarios.append(Scenario(f"{section} {heading}".strip(), planes))
+    return scenarios
+
+
+def findScenario(scenarios, selector):
+    # selector is the index in the file or a part of the name
+    if selector.isdigit():
+        return scenarios[int(selector)]
+    for scenario in scenarios:
+        if selector.lower() in scenario.name.lower():
+            return scenario
+    raise KeyError(selector)
@@ -0,0 +1,71 @@
+import math
+import time
+
+
+class ScheduledTask:
+
+    def __init__(self, name, function, rate, deadline):
+        self.name = name
+        self.function = function
+        self.period = 1 / rate  # sec
+        self.deadline = deadline  # monotonic time of the next run
+        self.runs = 0
+        self.overruns = 0  # runs that took longer than the period
+        self.skipped = 0  # runs dropped because they were already stale
+        self.lastDuration = 0.0
+        self.maxDuration = 0.0
+
+
+class TaskScheduler:
+    # Runs every task at its own rate against monotonic deadlines, so the period does not stretch with the work.
+    # A task that fell behind by more than one period runs once and drops the missed runs instead of catching up.
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.tasks = []
+
+    def add(self, name, function, rate):
+        task = ScheduledTask(name, function, rate, self.clock())
+        self.tasks.append(task)
+        return task
+
+    def setRate(self, name, rate):
+        for task in self.tasks:
+            if task.name == name:
+                task.period = 1 / rate
+
+    def nextDeadline(self):
+        return min(task.deadline for task in self.tasks)
+
+    def runPending(self):
+        # tasks due at the same time run in the order they were added
+        for task in sorted(self.tasks, key=lambda t: t.deadline):
+            start = self.clock()
+            if task.deadline > start:
+                continue
+            task.function()
+            end = self.clock()
+            task.runs += 1
+            task.lastDuration = end - start
+            task.maxDuration = max(task.maxDuration, task.lastDuration)
+            if task.lastDuration > task.period:
+                task.overruns += 1
+                print(f"Overrun: {task.name} took {round(task.lastDuration * 1000)} ms, "
+                      f"period {round(task.period * 1000)} ms")
+
+            task.deadline += task.period
+            if task.deadline <= end:
+                missed = math.floor((end - task.deadline) / task.period) + 1
+                task.skipped += missed
+                task.deadline += missed * task.period
+
+    def run(self, stopped):
+        while not stopped():
+            self.runPending()
+            self.sleep(max(0.0, self.nextDeadline() - self.clock()))
+
+    def metrics(self):
+        return {task.name: {"rate": 1 / task.period, "runs": task.runs, "overruns": task.overruns,
+                            "skipped": task.skipped, "lastDuration": task.lastDuration,
+                            "maxDuration": task.maxDuration} for task in self.tasks}
@@ -0,0 +1,40 @@
+from collections import namedtuple
+import geopy
+
+# immutable per tick copies of the traffic state, the UI reads only the latest snapshot
+OwnshipView = namedtuple("OwnshipView", ["lat", "long", "alt", "alt_agl", "vs", "gs", "hdg"])
+AdvisoryView = namedtuple("AdvisoryView", ["type", "alert", "minimalVerticalSpeed", "maximalVerticalSpeed"])
+AircraftView = namedtuple("AircraftView", ["identification", "type", "distance", "bearing", "verticalSeparation",
+                                           "vs", "advisory"])
+TrafficSnapshot = namedtuple("TrafficSnapshot", ["time", "ownship", "aircrafts", "advisory", "status"])
+
+
+def viewAdvisory(advisory):
+    if advisory is None:
+        return None
+    return AdvisoryView(advisory.type, advisory.alert, advisory.minimalVerticalSpeed, advisory.maximalVerticalSpeed)
+
+
+def takeSnapshot(ownPlane, knownAircrafts, now):
+    # knownAircrafts is written by the MQTT thread, list() copies it without iterating the live dict
+    ownship = OwnshipView(ownPlane.lat, ownPlane.long, ownPlane.alt, ownPlane.alt_agl, ownPlane.vs, ownPlane.gs,
+                          ownPlane.hdg)
+    aircrafts = []
+    mostSevereAdv = None
+    for aircraft in list(knownAircrafts.values()):
+        history = aircraft.history
+        message = aircraft.lastMessage
+        if not len(history) or message is None:
+            continue
+        if aircraft.tracker is not None and aircraft.rangeRate is not None:
+            distance, bearing, verticalSeparation = aircraft.predict(now)
+        else:
+            _, distance, bearing, verticalSeparation = history[-1]  # one sample, even while a new one is saved
+        advisory = viewAdvisory(aircraft.advisory)
+        aircrafts.append(AircraftView(aircraft.identification, aircraft.type, distance, bearing, verticalSeparation,
+                                      message.get('data').get('vs'), advisory))
+        if advisory is not None and (mostSevereAdv is None or advisory.type.value > mostSevereAdv.type.value):
+            mostSevereAdv = advisory
+
+    status = f"GPS: {geopy.Point(latitude=ownship.lat, longitude=ownship.long)} ALT: {round(ownship.alt)} ft VS: {round(ownship.vs)} ft/min GS: {round(ownship.gs)} knt HDG: {round(ownship.hdg)}"
+    return TrafficSnapshot(now, ownship, tuple(aircrafts), mostSevereAdv, status)
@@ -0,0 +1,109 @@
+import math
+from expiry import ExpiryHeap
+
+MIN_EARTH_RADIUS = 6335439  # m, smallest WGS84 radius of curvature (meridional, at the equator)
+EARTH_RADIUS = 6378137  # m, WGS84 semi-major axis, smallest prime vertical radius of curvature
+
+
+class SpatialGrid:
+    # Lat/long cells at least maxDistance wide and altitude bands of maxVerticalSeparation, so traffic in range
+    # is never more than one cell (or the longitude span at the ownship latitude) away from the ownship cell.
+
+    def __init__(self, maxDistance, maxVerticalSeparation):
+        self.cellSize = math.degrees(maxDistance / MIN_EARTH_RADIUS)  # deg
+        self.bandSize = maxVerticalSeparation  # ft
+        self.minLongCell = math.floor(-180 / self.cellSize)
+        self.longCells = math.floor(179.999999 / self.cellSize) - self.minLongCell + 1
+        self.maxDistance = maxDistance
+        self.positions = {}  # address -> (latCell, longCell, altBand, time)
+        self.buckets = {}  # (latCell, longCell) -> addresses
+        self.ownCell = None
+        self.longSpan = None  # None: no culling by longitude
+        self.expiry = ExpiryHeap(0)  # expire() passes the oldest time to keep as now
+        self.stats = {"received": 0, "culledHorizontal": 0, "culledVertical": 0, "candidates": 0, "culledExact": 0}
+
+    def cellOf(self, lat, long, alt):
+        return math.floor(lat / self.cellSize), math.floor(long / self.cellSize), math.floor(alt / self.bandSize)
+
+    def setOwnship(self, lat, long, alt):
+        self.ownCell = self.cellOf(lat, long, alt)
+        maxLat = abs(lat) + self.cellSize
+        if maxLat >= 90:
+            self.longSpan = None
+            return
+        longRange = math.degrees(self.maxDistance / (EARTH_RADIUS * math.cos(math.radians(maxLat))))
+        self.longSpan = math.ceil(longRange / self.cellSize)
+        if 2 * self.longSpan + 1 >= self.longCells:
+            self.longSpan = None
+
+    def isNear(self, latCell, longCell, altBand):
+        if self.ownCell is None:
+            return True
+        if abs(altBand - self.ownCell[2]) > 1:
+            self.stats["culledVertical"] += 1
+            return False
+        if abs(latCell - self.ownCell[0]) > 1:
+            self.stats["culledHorizontal"] += 1
+            return False
+        if self.longSpan is not None:
+            longDiff = abs(longCell - self.ownCell[1])
+            if longDiff > self.longSpan and self.longCells - longDiff > self.longSpan + 1:  # across +-180 deg
+                self.stats["culledHorizontal"] += 1
+                return False
+        return True
+
+    def update(self, address, lat, long, alt, time):
+        # stores the position and returns whether the aircraft may be in range of the ownship
+        self.stats["received"] += 1
+        latCell, longCell, altBand = self.cellOf(lat, long, alt)
+        old = self.positions.get(address)
+        if old is None or old[0] != latCell or old[1] != longCell:
+            if old is not None:
+                self.discard(address, old)
+            self.buckets.setdefault((latCell, longCell), set()).add(address)
+        self.positions[address] = (latCell, longCell, altBand, time)
+        self.expiry.touch(address, time)
+
+        near = self.isNear(latCell, longCell, altBand)
+        if near:
+            self.stats["candidates"] += 1
+        return near
+
+    def rejectExact(self):
+        # candidate found out of range by the exact distance check
+        self.stats["culledExact"] += 1
+
+    def discard(self, address, position):
+        bucket = self.buckets.get((position[0], position[1]))
+        if bucket is not None:
+            bucket.discard(address)
+            if not bucket:
+                self.buckets.pop((position[0], position[1]), None)
+
+    def remove(self, address):
+        position = self.positions.pop(address, None)
+        if position is not None:
+            self.discard(address, position)
+        self.expiry.discard(address)
+
+    def expire(self, before):
+        for address in self.expiry.popExpired(before):
+            self.remove(address)
+
+    def neighbours(self):
+        # addresses in the cells around the ownship
+        if self.ownCell is None:
+            return set(self.positions.keys())
+        if self.longSpan is None:
+            longCells = range(self.minLongCell, self.minLongCell + self.longCells)
+        else:
+            longCells = [(self.ownCell[1] + offset - self.minLongCell) % self.longCells + self.minLongCell
+                         for offset in range(-self.longSpan - 1, self.longSpan + 2)]  # one extra cell across +-180 deg
+        result = set()
+        for latCell in range(self.ownCell[0] - 1, self.ownCell[0] + 2):
+            for longCell in longCells:
+                for address in list(self.buckets.get((latCell, longCell), ())):
+                    position = self.positions.get(address)
+                    if position is not None and abs(position[2] - self.ownCell[2]) <= 1:
+                        result.add(address)
+        return result
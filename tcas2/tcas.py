@@ -1,15 +1,28 @@
-import collections
-import json
+import struct
 import time
 import uuid
-from enum import Enum
 from threading import Thread
-import geopy
-import geopy.distance
+import numpy as np
 import paho.mqtt.client as mqtt
 import plane
-from aircraft import Aircraft, AircraftCategory, Advisory
-from geoUtils import getBearing
+from aircraft import Aircraft, AircraftCategory, Advisory, AdvisoryType, TRACK_HISTORY_DEPTH
+from clock import REAL_CLOCK
+from coordination import Coordinator, CoordinationState, RequestAction, outranks
+from expiry import ExpiryHeap
+from geoUtils import GeodesicGeometry, getGeometry
+from interrogation import InterrogationScheduler
+from metrics import Metrics, MetricsServer, METRICS_SAMPLE, labelled
+from outbound import OutboundScheduler
+from positionSource import createPositionSource
+from recorder import RECEIVED, SENT
+from resolution import solveJointResolution
+from scheduler import TaskScheduler
+from snapshot import takeSnapshot
+from spatialIndex import SpatialGrid
+from threatEval import ThreatTable, categoryCode, advisoryCode
+from tracker import getTracker
+from wireFormat import MessageMode, MessageType, encodeJson, encodeBinary, decodeMessage, messageTopic, parseTopic, \
+    subscriptions
 
 abort = False
 MQTT_TCAS_HOST = "localhost"
@@ -22,30 +35,12 @@ TCAS_MAX_VERTICAL_SEPARATION = 9900  # ft
 TCAS_PROXIMATE_LIMIT = 6 * NM_TO_METERS  # 6NM
 TCAS_PROXIMATE_VS_LIMIT = 1200  # ft
 TCAS_AIRCRAFT_TIMEOUT = 30  # sec
+TCAS_INDEX_MARGIN = NM_TO_METERS  # m, ownship movement between two index updates
+TCAS_INDEX_VS_MARGIN = 500  # ft
 VS_MIN = -10000
 VS_MAX = 10000
-
-
-class MessageMode(Enum):
-    ALLCALL = 0
-    BROADCAST = 1
-    SELECTIVE = 2
-    INTEROGATE = 3
-
-
-class MessageType(Enum):
-    SHORT_SQUITTER = 0
-    LONG_SQUITTER = 1
-    INTEROGATION = 2
-    RESOLUTION_REQUEST = 3
-    RESOLUTION_RESPONSE = 4
-
-
-class AdvisoryType(Enum):
-    NONE = 0
-    TA = 1
-    CC = 2
-    RA = 3
+TCAS_TASK_RATES = {"squitter": 1, "threats": 5, "resolution": 5, "interrogation": 1, "outbound": 1, "timeouts": 0.2,
+                   "display": 20, "metrics": 0.2, "coordination": 10}  # Hz
 
 
 TcasThresholds = {
@@ -72,15 +67,13 @@ TCAS_TA_NO_AURAL = 500
 
 
 class Tcas(Thread):
-    def __init__(self, ui, useDummy):
+    def __init__(self, ui, useDummy, clock=REAL_CLOCK):
         super().__init__()
         global abort
         abort = False
+        self.ownPlane = createPositionSource("dummy" if useDummy else "simconnect", clock)
         if useDummy:
-            self.ownPlane = plane.PlaneDummy()
             self.ownPlane.setPos(15000, 53.8036111, 10.7148917, 200, 200, 270)
-        else:
-            self.ownPlane = plane.Plane()
         self.ui = ui
         self.client = None
 
@@ -89,6 +82,93 @@ class Tcas(Thread):
         self.maxRange = 0  # nm
         self.transmitInterval = 1  # sec
         self.aircraftIdentification = f"{uuid.uuid4()}"
+        self.batchEvaluation = False  # classify all intruders once per tick instead of per message
+        self.threatTable = ThreatTable()
+        self.thresholds = TcasThresholds  # by altitude in ft, replaced to tune them
+        self.geometry = GeodesicGeometry()
+        self.wireFormat = "json"  # or "binary", received messages are decoded in either format
+        self.outboundScheduling = False  # queue, coalesce and rate limit outgoing messages until the end of the tick
+        self.outbound = OutboundScheduler(self.transmit, clock=clock)
+        self.snapshot = None  # latest TrafficSnapshot, replaced as a whole every tick
+        self.taskRates = dict(TCAS_TASK_RATES)
+        self.historyDepth = TRACK_HISTORY_DEPTH
+        self.tracker = None  # tracker class of the intruders, None for the difference of the last two samples
+        self.scheduler = None
+        self.error = None
+        self.clock = clock  # see clock.py, replaced with setClock
+        self.recorder = None  # Recorder of all received and sent messages
+        self.metrics = None  # Metrics of the processing stages, see enableMetrics
+        self.metricsServer = None
+        self.metricsFile = None  # Prometheus text file rewritten at taskRates["metrics"]
+        self.metricsSample = METRICS_SAMPLE  # stage latencies of every Nth received message are recorded
+        self.untilTraced = METRICS_SAMPLE  # received messages until the next traced one
+        self.traced = False  # the message being handled is timed
+        self.messageCounts = {}  # type -> decoded messages, only written by the receiving thread
+        self.droppedCounts = {}  # reason -> messages dropped before classification
+        self.expiry = ExpiryHeap(TCAS_AIRCRAFT_TIMEOUT)
+        self.interrogation = InterrogationScheduler(self.sendInterogation)
+        self.coordination = Coordinator()
+        self.spatialIndex = SpatialGrid(TCAS_MAX_DISTANCE + TCAS_INDEX_MARGIN,
+                                        TCAS_MAX_VERTICAL_SEPARATION + TCAS_INDEX_VS_MARGIN)
+
+    def setGeometry(self, name):
+        # "geodesic" (exact), "enu" or "numpy" (local tangent plane, see geoUtils for the error bounds)
+        self.geometry = getGeometry(name)
+        if isinstance(self.ownPlane, plane.PlaneDummy):
+            self.ownPlane.geometry = self.geometry
+
+    def setClock(self, clock):
+        # before the tasks are scheduled, the dummy ownship keeps its position and moves on from the new time
+        self.clock = clock
+        self.outbound.setClock(clock)
+        self.ownPlane.setClock(clock)
+
+    def setPositionSource(self, name, **options):
+        # see positionSource.py, the source module is imported here
+        self.ownPlane = createPositionSource(name, self.clock, **options)
+        if isinstance(self.ownPlane, plane.PlaneDummy):
+            self.ownPlane.geometry = self.geometry
+
+    def setTracker(self, name):
+        # "difference" (legacy), "alphabeta" or "kalman", applies to aircraft detected afterwards
+        self.tracker = getTracker(name)
+
+    def enableMetrics(self, port=None, path=None):
+        # stage latencies and counters, served on localhost:port and / or written to path
+        self.metrics = Metrics()
+        self.metrics.counter("messages_total", lambda: labelled("type", self.messageCounts),
+                             "Decoded messages by type")
+        self.metrics.counter("dropped_total", lambda: labelled("reason", self.droppedCounts),
+                             "Messages dropped before classification by reason")
+        self.metrics.gauge("tracked_aircraft", lambda: len(self.knownAircrafts), "Aircraft in range")
+        self.metrics.gauge("spatial_index", lambda: labelled("stat", self.spatialIndex.stats),
+                           "Squitters seen by the spatial index and culled before the exact range check")
+        self.metrics.gauge("interrogation", lambda: labelled("stat", self.interrogation.metrics()),
+                           "Interrogation budget")
+        self.metrics.gauge("expiry", lambda: labelled("stat", self.expiry.stats), "Aircraft timeout heap")
+        self.metrics.gauge("coordination", lambda: labelled("stat", self.coordination.metrics()),
+                           "RA coordination, latencies in sec")
+        self.metrics.gauge("outbound", lambda: labelled("stat", self.outbound.metrics()),
+                           "Outgoing message queue with outboundScheduling, publish latencies in sec")
+        self.metricsFile = path
+        if port is not None:
+            self.metricsServer = MetricsServer(self.metrics, port=port)
+            self.metricsServer.start()
+
+    def observe(self, stage, start):
+        if self.metrics is not None:
+            self.metrics.observe(stage, time.perf_counter() - start)
+
+    def observeMessage(self, stage, start):
+        if self.traced:
+            self.metrics.observe(stage, time.perf_counter() - start)
+
+    def countMessage(self, counts, key):
+        if self.metrics is not None:
+            counts[key] = counts.get(key, 0) + 1
+
+    def writeMetrics(self):
+        self.metrics.writeTextFile(self.metricsFile)
 
     @staticmethod
     def stop():
@@ -106,7 +186,7 @@ class Tcas(Thread):
             self.client.loop_start()
             self.startAquisitionBroadcastLoop()
         except ConnectionError:
-            self.ui.popup("Sim not running")
+            self.error = "Sim not running"
             abort = True
 
     def detect(self):
@@ -115,66 +195,163 @@ class Tcas(Thread):
     def track(self):
         pass
 
+    def publish(self, message):
+        if self.outboundScheduling:
+            self.outbound.enqueue(message)
+        else:
+            self.transmit(message)
+
+    def transmit(self, message):
+        payload = None
+        if self.wireFormat == "binary":
+            try:
+                payload = encodeBinary(message)
+            except (ValueError, KeyError, struct.error):
+                payload = None  # no binary representation, send as json
+        binary = payload is not None
+        if not binary:
+            payload = encodeJson(message)
+        topic = messageTopic(MQTT_TCAS_CHANNEL, self.aircraftIdentification, message.get("receiver"), binary)
+        self.client.publish(topic, payload=payload, qos=0, retain=False)
+        if self.recorder is not None:
+            self.recorder.record(SENT, topic, payload, self.clock())
+
     def sendShortSquitter(self):
         self.ownPlane.update()
-        message = json.dumps({"mode": MessageMode.BROADCAST.name, "address": f"{self.aircraftIdentification}",
-                              "type": MessageType.SHORT_SQUITTER.name,
-                              "data": self.ownPlane.getAsDict()})
-        self.client.publish(f"{MQTT_TCAS_CHANNEL}/{self.aircraftIdentification}", payload=message, qos=0, retain=False)
-        self.ui.updateLabel(
-            f"GPS: {geopy.Point(latitude=self.ownPlane.lat, longitude=self.ownPlane.long)} ALT: {round(self.ownPlane.alt)} ft VS: {round(self.ownPlane.vs)} ft/min GS: {round(self.ownPlane.gs)} knt HDG: {round(self.ownPlane.hdg)}")
+        self.spatialIndex.setOwnship(self.ownPlane.lat, self.ownPlane.long, self.ownPlane.alt)
+        self.publish({"mode": MessageMode.BROADCAST.name, "address": f"{self.aircraftIdentification}",
+                      "type": MessageType.SHORT_SQUITTER.name,
+                      "data": self.ownPlane.getAsDict()})
 
     def sendLongSquitter(self, aircraft=None):
         self.ownPlane.update()
         if aircraft is None:
             self.ownPlane.update()
-            message = json.dumps({"mode": MessageMode.BROADCAST.name, "address": f"{self.aircraftIdentification}",
-                                  "type": MessageType.LONG_SQUITTER.name,
-                                  "data": self.ownPlane.getAsDict()})
-            self.client.publish(f"{MQTT_TCAS_CHANNEL}/{self.aircraftIdentification}", payload=message, qos=0, retain=False)
+            self.publish({"mode": MessageMode.BROADCAST.name, "address": f"{self.aircraftIdentification}",
+                          "type": MessageType.LONG_SQUITTER.name,
+                          "data": self.ownPlane.getAsDict()})
         else:
-            message = json.dumps({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
-                                  "receiver": f"{aircraft.identification}",
-                                  "type": MessageType.LONG_SQUITTER.name,
-                                  "data": self.ownPlane.getAsDict()})
-            self.client.publish(f"{MQTT_TCAS_CHANNEL}/{self.aircraftIdentification}", payload=message, qos=0, retain=False)
-
-    def sendResolutionRequest(self, aircraft):
-        message = json.dumps({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
-                              "receiver": f"{aircraft.identification}",
-                              "type": MessageType.RESOLUTION_REQUEST.name,
-                              "data": aircraft.advisory.opponentSolution})
-        self.client.publish(f"{MQTT_TCAS_CHANNEL}/{self.aircraftIdentification}", payload=message, qos=0, retain=False)
-        print(f"Sent RESOLUTION_REQUEST to {aircraft.identification}: solution: {aircraft.advisory.opponentSolution}")
-
-    def sendResolutionResponse(self, aircraft, accept):
-        message = json.dumps({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
-                              "receiver": f"{aircraft.identification}",
-                              "type": MessageType.RESOLUTION_RESPONSE.name,
-                              "data": {"accept": accept}})
-        self.client.publish(f"{MQTT_TCAS_CHANNEL}/{self.aircraftIdentification}", payload=message, qos=0, retain=False)
-        print(f"Sent RESOLUTION_RESPONSE to {aircraft.identification}: accept: {accept}")
+            self.publish({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
+                          "receiver": f"{aircraft.identification}",
+                          "type": MessageType.LONG_SQUITTER.name,
+                          "data": self.ownPlane.getAsDict()})
+
+    def sendResolutionRequest(self, address, solution, seq):
+        self.publish({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
+                      "receiver": f"{address}",
+                      "type": MessageType.RESOLUTION_REQUEST.name,
+                      "data": dict(solution, seq=seq)})
+        print(f"Sent RESOLUTION_REQUEST {seq} to {address}: solution: {solution}")
+
+    def sendResolutionResponse(self, address, accept, seq):
+        self.publish({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
+                      "receiver": f"{address}",
+                      "type": MessageType.RESOLUTION_RESPONSE.name,
+                      "data": {"accept": accept, "seq": seq}})
+        print(f"Sent RESOLUTION_RESPONSE {seq} to {address}: accept: {accept}")
+
+    def retransmitResolutions(self):
+        for address, seq, solution in self.coordination.due(self.clock()):
+            self.sendResolutionRequest(address, solution, seq)
 
     def startAquisitionBroadcastLoop(self):
-        while not abort:
-            self.ui.displayAircraft()
-            self.ui.updateDisplay()
-            self.sendShortSquitter()
-            self.checkAircraftTimout()
-            self.ui.checkAdvisoryLevel()
-            self.interogate()
-            time.sleep(1)
+        self.scheduler = TaskScheduler(self.clock, self.clock.sleep)
+        self.scheduleTasks(self.scheduler)
+        self.scheduler.run(lambda: abort)
 
         self.client.disconnect()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.metricsServer is not None:
+            self.metricsServer.stop()
+
+    def scheduleTasks(self, scheduler, prefix="", display=True):
+        # the squitter comes first, it also updates the ownship position the other tasks use, the display snapshot is
+        # left out for runs nothing shows
+        scheduler.add(prefix + "squitter", self.sendShortSquitter, self.taskRates["squitter"])
+        if self.batchEvaluation:
+            scheduler.add(prefix + "threats", self.evaluateThreats, self.taskRates["threats"])
+        else:
+            scheduler.add(prefix + "resolution", self.resolveThreats, self.taskRates["resolution"])
+        scheduler.add(prefix + "interrogation", self.interogate, self.taskRates["interrogation"])
+        scheduler.add(prefix + "coordination", self.retransmitResolutions, self.taskRates["coordination"])
+        if self.outboundScheduling:
+            scheduler.add(prefix + "outbound", self.outbound.flush, self.taskRates["outbound"])
+        scheduler.add(prefix + "timeouts", self.checkAircraftTimout, self.taskRates["timeouts"])
+        if display:
+            scheduler.add(prefix + "display", self.publishSnapshot, self.taskRates["display"])
+        if self.metrics is not None and self.metricsFile is not None:
+            scheduler.add(prefix + "metrics", self.writeMetrics, self.taskRates["metrics"])
+
+    def tick(self):
+        # all tasks once, in schedule order
+        self.sendShortSquitter()
+        self.checkAircraftTimout()
+        if self.batchEvaluation:
+            self.evaluateThreats()
+        else:
+            self.resolveThreats()
+        self.interogate()
+        self.retransmitResolutions()
+        if self.outboundScheduling:
+            self.outbound.flush()
+        self.publishSnapshot()
+
+    def publishSnapshot(self):
+        start = time.perf_counter()
+        self.snapshot = takeSnapshot(self.ownPlane, self.knownAircrafts, self.clock())
+        self.observe("snapshot", start)
 
     # The callback for when the client receives a CONNACK response from the server.
     def on_connect(self, client, userdata, flags, rc):
         print("Connected with result code " + str(rc))
-        client.subscribe(f"{MQTT_TCAS_CHANNEL}/#")
+        client.subscribe(subscriptions(MQTT_TCAS_CHANNEL, [self.aircraftIdentification]))
 
     # The callback for when a PUBLISH message is received from the server.
     def on_message(self, client, userdata, msg):
-        message = json.loads(msg.payload)
+        start = time.perf_counter() if self.sampleMessage() else 0.0
+        message = self.decodeReceived(msg, start)
+        if message is not None:
+            self.dispatchMessage(message)
+            self.observeMessage("receive", start)
+
+    def sampleMessage(self):
+        # every metricsSample-th received message is traced, the others skip the stage timings
+        if self.metrics is None:
+            return False
+        untilTraced = self.untilTraced - 1
+        if untilTraced:
+            self.untilTraced = untilTraced
+            self.traced = False
+            return False
+        self.untilTraced = self.metricsSample
+        self.traced = True
+        return True
+
+    def decodeReceived(self, msg, start):
+        # the decoded message, None if it is dropped, start is the perf_counter time it was received
+        if self.recorder is not None:
+            self.recorder.record(RECEIVED, msg.topic, msg.payload, self.clock())
+        # own echoes and selective messages for others are dropped by topic before decoding
+        sender, receiver = parseTopic(MQTT_TCAS_CHANNEL, msg.topic)
+        if sender == self.aircraftIdentification or receiver not in (None, self.aircraftIdentification):
+            self.countMessage(self.droppedCounts, "topic")
+            return None
+        try:
+            message = decodeMessage(msg.topic, msg.payload)
+        except (ValueError, struct.error):
+            self.countMessage(self.droppedCounts, "decode")
+            return None
+        if self.metrics is not None:
+            # every message is counted by type, only the traced ones are timed
+            counts = self.messageCounts
+            messageType = message.get("type")
+            counts[messageType] = counts.get(messageType, 0) + 1
+            if self.traced:
+                self.metrics.observe("decode", time.perf_counter() - start)
+        return message
+
+    def dispatchMessage(self, message):
         if message.get('address') == self.aircraftIdentification:
             return
 
@@ -189,31 +366,55 @@ class Tcas(Thread):
 
     def listenToSquitter(self, message):
         address = message.get('address')
-        lastPos = self.ownPlane.point
-        otherPlanePos = geopy.Point(message.get('data').get('lat'), message.get('data').get('long'))
-        distance = geopy.distance.distance(lastPos, otherPlanePos).m
-        bearing = getBearing(lastPos, otherPlanePos)
-        otherPlaneALt = message.get('data').get('alt')
+        data = message.get('data')
+        self.interrogation.answered(address)
+
+        # cheap check against the grid cells around the ownship first
+        if not self.spatialIndex.update(address, data.get('lat'), data.get('long'), data.get('alt'), self.clock()):
+            self.countMessage(self.droppedCounts, "grid")
+            self.forgetAircraft(address)
+            return
+
+        traced = self.traced
+        if traced:
+            start = time.perf_counter()
+        distance, bearing = self.geometry.distanceAndBearing(self.ownPlane.lat, self.ownPlane.long,
+                                                             data.get('lat'), data.get('long'))
+        if traced:
+            self.metrics.observe("geometry", time.perf_counter() - start)
+        otherPlaneALt = data.get('alt')
         verticalSeparation = self.ownPlane.alt - otherPlaneALt
         # print(f"dist: {distance * METERS_TO_NM} NMi, bear: {bearing} deg, vSep: {verticalSeparation} ft")
 
         # check if out of range
         if distance > TCAS_MAX_DISTANCE or abs(verticalSeparation) > TCAS_MAX_VERTICAL_SEPARATION:
-            if address in self.knownAircrafts.keys():
-                self.knownAircrafts.pop(address)
+            self.spatialIndex.rejectExact()
+            self.countMessage(self.droppedCounts, "range")
+            self.forgetAircraft(address)
             return
 
         # Save Entry to known Aircrafts
         if address not in self.knownAircrafts.keys():
-            self.knownAircrafts[address] = Aircraft(address)
+            tracker = self.tracker() if self.tracker is not None else None
+            self.knownAircrafts[address] = Aircraft(address, self.historyDepth, tracker)
 
         aircraft = self.knownAircrafts.get(address)  # type: Aircraft
         aircraft.lastMessage = message
-        aircraft.saveEntry({"time": time.monotonic(), "distance": distance, "bearing": bearing,
-                            "verticalSeparation": verticalSeparation})
+        now = self.clock()
+        aircraft.saveEntry(now, distance, bearing, verticalSeparation)
         self.knownAircrafts[address] = aircraft
+        self.expiry.touch(address, now)
+        if aircraft.tracker is not None and aircraft.rangeRate is not None:
+            # classify the filtered state instead of the raw sample
+            distance, bearing, verticalSeparation = aircraft.predict(now)
         # print(aircraft.history)
 
+        if self.batchEvaluation:
+            self.threatTable.update(address, distance, verticalSeparation, aircraft.rangeRate, aircraft.verticalRate)
+            return
+
+        if traced:
+            start = time.perf_counter()
         tau = 0
         vSepMin = 0
 
@@ -258,107 +459,133 @@ class Tcas(Thread):
             if aircraft.advisory is not None:
                 adv = aircraft.advisory.type
 
+            if traced:
+                self.metrics.observe("classification", time.perf_counter() - start)
             print(f"{aircraft.type}: old: {oldAircraftType} adv: {adv}, Dist: {round(distance * METERS_TO_NM * 100) / 100}, vertSep: {round(verticalSeparation)} ft, rangeRate: {round(aircraft.rangeRate * 100) / 100} m/s, vert.Rate: {round(aircraft.verticalRate * 100) / 100} ft/s, tau: {round(tau * 100) / 100} s, vSepMin: {round(vSepMin)} ft")
-
-            if aircraft.type == AircraftCategory.RA:
-                if aircraft.advisory is not None:
-                    if not aircraft.advisory.isSend:
-                        self.findResolution(aircraft)
+            # the resolution of all RA intruders is solved once per tick by resolveThreats
             # TODO tau is 0 Why?
 
     def checkAircraftTimout(self):
-        toBeDeleted = []
-        for ac in self.knownAircrafts.values():
-            ac = ac  # type: Aircraft
-            dt = time.monotonic() - ac.lasUpdate
-
-            if dt > TCAS_AIRCRAFT_TIMEOUT:
-                toBeDeleted.append(ac.identification)
-        for i in toBeDeleted:
-            self.knownAircrafts.pop(i)
-
-    def findResolution(self, aircraft):
+        now = self.clock()
+        for address in self.expiry.popExpired(now):
+            self.forgetAircraft(address)
+        self.spatialIndex.expire(now - TCAS_AIRCRAFT_TIMEOUT)
+
+    def forgetAircraft(self, address):
+        self.knownAircrafts.pop(address, None)
+        self.expiry.discard(address)
+        self.interrogation.forget(address)
+        self.coordination.forget(address)
+        self.threatTable.remove(address)
+
+    def evaluateThreats(self):
+        start = time.perf_counter()
+        if self.tracker is not None:
+            self.deadReckon()
+        noRA = self.ownPlane.alt_agl < TCAS_TA_ONLY_ALTITUDE
+        changes, _ = self.threatTable.evaluate(self.getTcasThreshold(), noRA, TCAS_PROXIMATE_LIMIT,
+                                                     TCAS_PROXIMATE_VS_LIMIT)
+        for address, category, advisory, renew in changes:
+            aircraft = self.knownAircrafts.get(address)  # type: Aircraft
+            if aircraft is None:
+                continue
+            aircraft.type = AircraftCategory(category)
+            if renew:
+                aircraft.advisory = Advisory(AdvisoryType(advisory)) if advisory >= 0 else None
+        self.observe("classification", start)
+        self.resolveThreats()
+
+    def deadReckon(self):
+        # tracked intruders are evaluated at their extrapolated state even without a new squitter
+        now = self.clock()
+        for aircraft in list(self.knownAircrafts.values()):
+            if aircraft.tracker is not None and aircraft.rangeRate is not None:
+                distance, _, verticalSeparation = aircraft.predict(now)
+                self.threatTable.update(aircraft.identification, distance, verticalSeparation, aircraft.rangeRate,
+                                        aircraft.verticalRate)
+
+    def getResolutionLimits(self):
         raNoClimb = self.ownPlane.alt > TCAS_RA_CLIMB_INHIBITED_ALTITUDE
         raNoIncDesc = self.ownPlane.alt_agl < TCAS_RA_INC_DESC_INHIBITED_ALTITUDE
         raNoDesc = self.ownPlane.alt_agl < TCAS_RA_DESC_INHIBITED_ALTITUDE
-
-        vsPlus = 0  # in ft/min
-        distance = aircraft.getLastDistance()
-        verticalSeparation = aircraft.getLatvSep()
-        tau = distance / abs(aircraft.rangeRate)
+        return not raNoClimb, not raNoDesc or not raNoIncDesc
+
+    def resolveThreats(self):
+        # one sense and vertical speed band against all RA intruders, requests go to the intruders that have not
+        # been sent this sense yet, intruders whose request we accepted fix the sense
+        threats = [aircraft for aircraft in list(self.knownAircrafts.values())
+                   if aircraft.type == AircraftCategory.RA and aircraft.advisory is not None and
+                   aircraft.advisory.type == AdvisoryType.RA and aircraft.rangeRate is not None]
+        if not any(not aircraft.advisory.isSend for aircraft in threats):
+            return
+        start = time.perf_counter()
+        accepted = [aircraft for aircraft in threats
+                    if self.coordination.state(aircraft.identification) == CoordinationState.ACCEPTED]
+        climb = accepted[0].advisory.alert == "CLIMB, CLIMB" if accepted else None
+        allowClimb, allowDescend = self.getResolutionLimits()
+        distance = np.array([aircraft.getLastDistance() for aircraft in threats])
+        verticalSeparation = [aircraft.getLatvSep() for aircraft in threats]
+        verticalRate = [aircraft.verticalRate for aircraft in threats]
+        with np.errstate(divide="ignore"):
+            tau = distance / np.abs([aircraft.rangeRate for aircraft in threats])
         tcasThreshold = self.getTcasThreshold()
 
-        # check increase vs
-        resultsUp = collections.OrderedDict()
-        if not raNoClimb:
-            for vsPlus in range(0, VS_MAX, 100):
-                vSepMin = abs(verticalSeparation + (aircraft.verticalRate + vsPlus / 60) * tau)  # to ft/sec
-                if vSepMin > tcasThreshold.get("TA_ZTHR"):
-                    resultsUp[vSepMin] = vsPlus
-
-        # check increase vs
-        resultsDown = collections.OrderedDict()
-        if not raNoDesc or not raNoIncDesc:
-            for vsPlus in range(VS_MIN, 0, 100):
-                vSepMin = abs(verticalSeparation + (aircraft.verticalRate + vsPlus / 60) * tau)  # to ft/sec
-                if vSepMin > tcasThreshold.get("TA_ZTHR"):
-                    resultsDown[vSepMin] = vsPlus
-
-        # print(resultsUp)
-        # print(resultsDown)
-
-        if len(resultsUp) == 0:
-            resultsUp[0] = 0
-
-        if len(resultsDown) == 0:
-            resultsDown[0] = 0
-
-        if list(resultsUp.keys())[0] > list(resultsDown.keys())[0]:
-            aircraft.advisory.minimalVerticalSpeed = resultsUp[list(resultsUp.keys())[len(resultsUp)-1]]
-            aircraft.advisory.maximalVerticalSpeed = resultsUp[list(resultsUp.keys())[0]]
+        resolution = solveJointResolution(verticalSeparation, verticalRate, tau, tcasThreshold.get("TA_ZTHR"),
+                                          allowClimb, allowDescend, VS_MIN, VS_MAX, climb)
+        alert = "CLIMB, CLIMB" if resolution.climb else "DESCEND, DESCEND"
+        for aircraft in threats:
+            if aircraft in accepted:
+                continue
+            if aircraft.advisory.isSend and aircraft.advisory.alert == alert:
+                # same sense, only the band follows the new solution
+                aircraft.advisory.minimalVerticalSpeed = resolution.minimalVerticalSpeed
+                aircraft.advisory.maximalVerticalSpeed = resolution.maximalVerticalSpeed
+            else:
+                self.applyResolution(aircraft, resolution.climb, resolution.minimalVerticalSpeed,
+                                     resolution.maximalVerticalSpeed)
+        self.observe("resolution", start)
+
+    def applyResolution(self, aircraft, climb, minimalVerticalSpeed, maximalVerticalSpeed):
+        aircraft.advisory.minimalVerticalSpeed = minimalVerticalSpeed
+        aircraft.advisory.maximalVerticalSpeed = maximalVerticalSpeed
+        if climb:
             opponentMaxVS = VS_MIN
             opponentMinVS = 0
             aircraft.advisory.alert = "CLIMB, CLIMB"
             opponentAlert = "DESCEND, DESCEND"
         else:
-            aircraft.advisory.maximalVerticalSpeed = resultsDown[list(resultsDown.keys())[len(resultsDown)-1]]
-            aircraft.advisory.minimalVerticalSpeed = resultsDown[list(resultsDown.keys())[0]]
             opponentMaxVS = 0
             opponentMinVS = VS_MAX
             aircraft.advisory.alert = "DESCEND, DESCEND"
             opponentAlert = "CLIMB, CLIMB"
 
-        # print(tcasThreshold.get("TA_ZTHR"))
-        # print(f"{aircraft.advisory.minimalVerticalSpeed}: {list(resultsUp.keys())[len(resultsUp)-1]}")
-        # print(f"{aircraft.advisory.maximalVerticalSpeed}: {list(resultsUp.keys())[0]}")
-
         aircraft.advisory.opponentSolution = {"alert": opponentAlert, "minimalVerticalSpeed": opponentMinVS, "maximalVerticalSpeed": opponentMaxVS}
-        self.sendResolutionRequest(aircraft)
+        seq = self.coordination.request(aircraft.identification, aircraft.advisory.opponentSolution, self.clock())
+        self.sendResolutionRequest(aircraft.identification, aircraft.advisory.opponentSolution, seq)
         aircraft.advisory.isSend = True
 
     def handleMessage(self, message):
+        address = message.get('address')
+        aircraft = self.knownAircrafts.get(address)  # type: Aircraft
         if message.get("type") == MessageType.RESOLUTION_REQUEST.name:
+            if aircraft is None:
+                return  # not tracked yet, the sender retransmits
             data = message.get("data")
-            aircraft = self.knownAircrafts[message.get('address')]  # type: Aircraft
+            seq = data.get("seq", 0)
             # print(f"Received RESOLUTION_REQUEST from {aircraft.identification}: {data}")
-            if aircraft.type is not AircraftCategory.RA:
-                self.checkResolutionRequest(aircraft, data)
-            else:
-                if aircraft.advisory.isSend:
-                    if aircraft.identification < self.aircraftIdentification:
-                        return
+            action = self.coordination.onRequest(address, seq, outranks(address, self.aircraftIdentification))
+            if action == RequestAction.ACCEPT:
                 self.checkResolutionRequest(aircraft, data)
+            elif action == RequestAction.RESEND:
+                self.sendResolutionResponse(address, True, seq)
         elif message.get("type") == MessageType.RESOLUTION_RESPONSE.name:
             data = message.get("data")
-            aircraft = self.knownAircrafts[message.get('address')]  # type: Aircraft
-            # print(f"Received RESOLUTION_RESPONSE from {aircraft.identification}: {data}")
-            if data["accept"] == True:
-                aircraft.advisory.isAccepted = True
-            else:
-                pass
+            # print(f"Received RESOLUTION_RESPONSE from {address}: {data}")
+            if self.coordination.onResponse(address, data.get("seq", 0), data["accept"], self.clock()):
+                if data["accept"] and aircraft is not None and aircraft.advisory is not None:
+                    aircraft.advisory.isAccepted = True
         elif message.get("type") == MessageType.INTEROGATION.name:
-            aircraft = self.knownAircrafts[message.get('address')]  # type: Aircraft
-            self.sendLongSquitter(aircraft)
+            self.sendLongSquitter(aircraft)  # broadcast if the interrogator is not tracked
         elif message.get("type") == MessageType.LONG_SQUITTER.name:
             self.listenToSquitter(message)
 
@@ -369,27 +596,25 @@ class Tcas(Thread):
         aircraft.advisory.alert = data["alert"]
         aircraft.advisory.minimalVerticalSpeed = data["minimalVerticalSpeed"]
         aircraft.advisory.maximalVerticalSpeed = data["maximalVerticalSpeed"]
-        self.sendResolutionResponse(aircraft, True)
+        self.threatTable.setState(aircraft.identification, categoryCode(aircraft.type), advisoryCode(aircraft.advisory))
+        self.sendResolutionResponse(aircraft.identification, True, data.get("seq", 0))
         aircraft.advisory.isAccepted = True
 
     def getTcasThreshold(self):
         tcasThreshold = None
-        for k in TcasThresholds.keys():
+        for k in self.thresholds.keys():
             if k > self.ownPlane.alt:
-                tcasThreshold = TcasThresholds.get(k)
+                tcasThreshold = self.thresholds.get(k)
                 return tcasThreshold
 
     def interogate(self):
-        for ac in self.knownAircrafts.values():
-            if time.monotonic() - ac.lasUpdate > 5:
-                self.sendInterogation(ac)
+        self.interrogation.run(list(self.knownAircrafts.values()), self.clock())
 
     def sendInterogation(self, aircraft):
-        message = json.dumps({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
-                              "receiver": f"{aircraft.identification}",
-                              "type": MessageType.INTEROGATION.name,
-                              "data": {}})
-        self.client.publish(f"{MQTT_TCAS_CHANNEL}/{self.aircraftIdentification}", payload=message, qos=0, retain=False)
+        self.publish({"mode": MessageMode.SELECTIVE.name, "address": f"{self.aircraftIdentification}",
+                      "receiver": f"{aircraft.identification}",
+                      "type": MessageType.INTEROGATION.name,
+                      "data": {}})
         print(f"Sent INTEROGATION to {aircraft.identification}")
 
 
@@ -0,0 +1,165 @@
+from threading import Lock
+import numpy as np
+from aircraft import AircraftCategory, AdvisoryType
+
+NO_CATEGORY = -1  # aircraft that was never classified
+NO_ADVISORY = -1  # aircraft without advisory object
+
+OTHER = AircraftCategory.OTHER.value
+PROXIMATE = AircraftCategory.PROXIMATE.value
+TA = AircraftCategory.TA.value
+RA = AircraftCategory.RA.value
+
+ADV_TA = AdvisoryType.TA.value
+ADV_CC = AdvisoryType.CC.value
+ADV_RA = AdvisoryType.RA.value
+
+
+def categoryCode(category):
+    if isinstance(category, AircraftCategory):
+        return category.value
+    return NO_CATEGORY
+
+
+def advisoryCode(advisory):
+    if advisory is None:
+        return NO_ADVISORY
+    return advisory.type.value
+
+
+def classifyThreats(distance, verticalSeparation, rangeRate, verticalRate, oldCategory, oldAdvisory,
+                    threshold, noRA, proximateLimit, proximateVsLimit):
+    # vectorized form of the classification in Tcas.listenToSquitter, same conditions and precedence
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tau = distance / np.abs(rangeRate)
+        vSepMin = np.abs(verticalSeparation + verticalRate * tau)
+    absVSep = np.abs(verticalSeparation)
+    closing = rangeRate <= 0
+
+    category = np.where((absVSep <= proximateVsLimit) & (distance <= proximateLimit), PROXIMATE, OTHER)
+    advisory = oldAdvisory.copy()
+
+    ta = closing & (((tau < threshold.get("TA_TAU")) & (vSepMin < threshold.get("TA_ZTHR"))) | (
+            (absVSep < threshold.get("TA_ZTHR")) & (distance < threshold.get("RA_DMOD"))))
+    category[ta] = TA
+    advisory[ta & (advisory == NO_ADVISORY)] = ADV_TA
+
+    if not noRA:
+        ra = (closing & (tau < threshold.get("RA_TAU")) & (vSepMin < threshold.get("RA_ZTHR"))) | (
+                (absVSep < threshold.get("RA_ZTHR")) & (distance < threshold.get("RA_DMOD")))
+        category[ra] = RA
+        advisory[ra & ((advisory == NO_ADVISORY) | (advisory == ADV_TA))] = ADV_RA
+
+    calm = (category == OTHER) | (category == PROXIMATE)
+    wasAlerted = (oldCategory == TA) | (oldCategory == RA)
+    advisory[calm] = np.where(wasAlerted[calm], ADV_CC, NO_ADVISORY)
+
+    return category, advisory, tau, vSepMin
+
+
+class ThreatTable:
+    # struct of arrays holding the latest track state of every known intruder, rows are swapped on removal
+
+    def __init__(self, capacity=64):
+        self.lock = Lock()
+        self.index = {}
+        self.addresses = []
+        self.count = 0
+        self.distance = np.zeros(capacity)
+        self.verticalSeparation = np.zeros(capacity)
+        self.rangeRate = np.zeros(capacity)
+        self.verticalRate = np.zeros(capacity)
+        self.tau = np.zeros(capacity)
+        self.vSepMin = np.zeros(capacity)
+        self.category = np.full(capacity, NO_CATEGORY, dtype=np.int8)
+        self.advisory = np.full(capacity, NO_ADVISORY, dtype=np.int8)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.dirty = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        capacity = len(self.distance) * 2
+        for name in ("distance", "verticalSeparation", "rangeRate", "verticalRate", "tau", "vSepMin"):
+            setattr(self, name, np.resize(getattr(self, name), capacity))
+        self.category = np.resize(self.category, capacity)
+        self.advisory = np.resize(self.advisory, capacity)
+        self.valid = np.resize(self.valid, capacity)
+        self.dirty = np.resize(self.dirty, capacity)
+
+    def row(self, address):
+        row = self.index.get(address)
+        if row is None:
+            if self.count == len(self.distance):
+                self.grow()
+            row = self.count
+            self.count += 1
+            self.index[address] = row
+            self.addresses.append(address)
+            self.category[row] = NO_CATEGORY
+            self.advisory[row] = NO_ADVISORY
+            self.tau[row] = 0
+            self.vSepMin[row] = 0
+        return row
+
+    def update(self, address, distance, verticalSeparation, rangeRate, verticalRate):
+        with self.lock:
+            row = self.row(address)
+            self.distance[row] = distance
+            self.verticalSeparation[row] = verticalSeparation
+            self.valid[row] = rangeRate is not None
+            if rangeRate is not None:
+                self.rangeRate[row] = rangeRate
+                self.verticalRate[row] = verticalRate
+            self.dirty[row] = True
+
+    def setState(self, address, category, advisory):
+        with self.lock:
+            row = self.index.get(address)
+            if row is not None:
+                self.category[row] = category
+                self.advisory[row] = advisory
+
+    def remove(self, address):
+        with self.lock:
+            row = self.index.pop(address, None)
+            if row is None:
+                return
+            last = self.count - 1
+            if row != last:
+                moved = self.addresses[last]
+                self.addresses[row] = moved
+                self.index[moved] = row
+                for array in (self.distance, self.verticalSeparation, self.rangeRate, self.verticalRate, self.tau,
+                              self.vSepMin, self.category, self.advisory, self.valid, self.dirty):
+                    array[row] = array[last]
+            self.addresses.pop()
+            self.count = last
+
+    def evaluate(self, threshold, noRA, proximateLimit, proximateVsLimit):
+        # classify every row that received a sample since the last pass
+        # returns [(address, category, advisory, renewAdvisory)] for changed rows and the addresses in RA
+        with self.lock:
+            rows = np.flatnonzero(self.dirty[:self.count] & self.valid[:self.count])
+            self.dirty[:self.count] = False
+            if len(rows) == 0:
+                return [], []
+
+            oldCategory = self.category[rows]
+            oldAdvisory = self.advisory[rows]
+            category, advisory, tau, vSepMin = classifyThreats(
+                self.distance[rows], self.verticalSeparation[rows], self.rangeRate[rows], self.verticalRate[rows],
+                oldCategory, oldAdvisory, threshold, noRA, proximateLimit, proximateVsLimit)
+            self.category[rows] = category
+            self.advisory[rows] = advisory
+            self.tau[rows] = tau
+            self.vSepMin[rows] = vSepMin
+
+            # clear of conflict is issued anew on every calm sample after an alert
+            calm = (category == OTHER) | (category == PROXIMATE)
+            renew = (advisory != oldAdvisory) | (calm & ((oldCategory == TA) | (oldCategory == RA)))
+            changed = np.flatnonzero(renew | (category != oldCategory))
+            changes = [(self.addresses[rows[i]], int(category[i]), int(advisory[i]), bool(renew[i])) for i in changed]
+            resolve = [self.addresses[rows[i]] for i in np.flatnonzero((category == RA) & (advisory != NO_ADVISORY))]
+            return changes, resolve
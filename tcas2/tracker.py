@@ -0,0 +1,132 @@
+import math
+
+TRACK_MIN_DT = 0.05  # sec, samples closer than this to the last used one are ignored, they carry no rate information
+
+# Both filters track the intruder relative to the ownship with a constant velocity model on three independent axes:
+# east and north in m from distance and bearing, and the vertical separation in ft.
+# The range rate is the projection of the relative velocity onto the line of sight, so it stays correct near the
+# closest point of approach, where the distance itself is not linear in time.
+# Velocities are initialised from the first two samples, so the rates are known from the second sample on, like the
+# difference of the last two samples of the history.
+
+
+def toRelative(distance, bearing, verticalSeparation):
+    bearing = math.radians(bearing)
+    return [distance * math.sin(bearing), distance * math.cos(bearing), verticalSeparation]
+
+
+def fromRelative(position):
+    east, north, verticalSeparation = position
+    return math.hypot(east, north), math.degrees(math.atan2(east, north)) % 360.0, verticalSeparation
+
+
+class Tracker:
+    # common sample handling, subclasses implement initVelocity and correct
+
+    def __init__(self):
+        self.time = None
+        self.position = [0.0, 0.0, 0.0]
+        self.velocity = [0.0, 0.0, 0.0]
+        self.initialised = False
+
+    def update(self, time, distance, bearing, verticalSeparation):
+        # returns (rangeRate in m/s, verticalRate in ft/s) or None while the velocity is unknown
+        measured = toRelative(distance, bearing, verticalSeparation)
+        if self.time is None:
+            self.time = time
+            self.position = measured
+            return None
+        dt = time - self.time
+        if dt < TRACK_MIN_DT:
+            # the time stays at the last used sample, so the next one gets the whole interval
+            return self.rates()
+        if not self.initialised:
+            self.initVelocity(measured, dt)
+            self.initialised = True
+        else:
+            self.correct(measured, dt)
+        self.time = time
+        return self.rates()
+
+    def rates(self):
+        if not self.initialised:
+            return None
+        distance = math.hypot(self.position[0], self.position[1])
+        if distance == 0:
+            rangeRate = math.hypot(self.velocity[0], self.velocity[1])
+        else:
+            rangeRate = (self.position[0] * self.velocity[0] + self.position[1] * self.velocity[1]) / distance
+        return rangeRate, self.velocity[2]
+
+    def predict(self, time):
+        # (distance, bearing, verticalSeparation) extrapolated to time, dead reckoning between samples
+        dt = time - self.time
+        return fromRelative([p + v * dt for p, v in zip(self.position, self.velocity)])
+
+
+class AlphaBetaTracker(Tracker):
+
+    def __init__(self, alpha=0.5, beta=None):
+        super().__init__()
+        self.alpha = alpha
+        self.beta = alpha * alpha / (2 - alpha) if beta is None else beta  # critically damped by default
+
+    def initVelocity(self, measured, dt):
+        self.velocity = [(m - p) / dt for m, p in zip(measured, self.position)]
+        self.position = measured
+
+    def correct(self, measured, dt):
+        for axis in range(3):
+            predicted = self.position[axis] + self.velocity[axis] * dt
+            residual = measured[axis] - predicted
+            self.position[axis] = predicted + self.alpha * residual
+            self.velocity[axis] += self.beta * residual / dt
+
+
+class KalmanTracker(Tracker):
+    # per axis state (position, velocity) with covariance [[pp, pv], [pv, vv]], white noise acceleration
+
+    def __init__(self, positionNoise=(30.0, 30.0, 25.0), accelerationNoise=(2.0, 2.0, 3.0)):
+        super().__init__()
+        self.measurementVariance = [n * n for n in positionNoise]  # m, m, ft
+        self.accelerationVariance = [n * n for n in accelerationNoise]  # m/s^2, m/s^2, ft/s^2
+        self.covariance = [[0.0, 0.0, 0.0] for _ in range(3)]
+
+    def initVelocity(self, measured, dt):
+        self.velocity = [(m - p) / dt for m, p in zip(measured, self.position)]
+        self.position = measured
+        for axis in range(3):
+            r = self.measurementVariance[axis]
+            self.covariance[axis] = [r, r / dt, 2 * r / (dt * dt)]
+
+    def correct(self, measured, dt):
+        for axis in range(3):
+            pp, pv, vv = self.covariance[axis]
+            q = self.accelerationVariance[axis]
+            # predict
+            position = self.position[axis] + self.velocity[axis] * dt
+            pp = pp + 2 * dt * pv + dt * dt * vv + q * dt ** 3 / 3
+            pv = pv + dt * vv + q * dt * dt / 2
+            vv = vv + q * dt
+            # correct with the measured position
+            s = pp + self.measurementVariance[axis]
+            gainP = pp / s
+            gainV = pv / s
+            residual = measured[axis] - position
+            self.position[axis] = position + gainP * residual
+            self.velocity[axis] += gainV * residual
+            self.covariance[axis] = [(1 - gainP) * pp, (1 - gainP) * pv, vv - gainV * pv]
+
+
+TRACKERS = {
+    "alphabeta": AlphaBetaTracker,
+    "kalman": KalmanTracker,
+}
+TRACKER_NAMES = ("difference",) + tuple(TRACKERS)
+
+
+def getTracker(name):
+    # "difference" keeps the rates of the last two history samples (no tracker object)
+    if name == "difference":
+        return None
+    return TRACKERS[name]
@@ -0,0 +1,88 @@
+import json
+from bisect import bisect_right
+from collections import deque
+from clock import REAL_CLOCK
+from plane import Plane, PlaneDummy
+from recorder import Recording, ownshipData
+
+# scripted trajectory, json:
+#   {"start": {"lat": 53.8, "long": 10.7, "alt": 7000, "vs": 0, "gs": 250, "hdg": 90},
+#    "changes": [{"time": 30, "vs": -1500}, {"time": 60, "hdg": 180, "vs": 0}]}
+# times in sec after the start, a change sets any of alt, vs, gs, hdg, the plane flies straight in between
+SCRIPT_FIELDS = ("alt", "vs", "gs", "hdg")
+
+
+def loadScript(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+class ScriptedPlane(PlaneDummy):
+    # a dummy plane that applies the changes of a script at their times, on any clock
+
+    def __init__(self, path=None, clock=REAL_CLOCK, script=None):
+        super().__init__(clock)
+        script = script if script is not None else loadScript(path)
+        start = script["start"]
+        self.setPos(alt=start["alt"], lat=start["lat"], long=start["long"], vs=start.get("vs", 0.0),
+                    gs=start.get("gs", 0.0), hdg=start.get("hdg", 0.0))
+        self.start = self.lastTime
+        self.changes = deque(sorted(script.get("changes", []), key=lambda change: change["time"]))
+
+    def setClock(self, clock):
+        # the script goes on where it was
+        elapsed = self.lastTime - self.start
+        super().setClock(clock)
+        self.start = self.lastTime - elapsed
+
+    def update(self):
+        now = self.clock()
+        while self.changes and self.start + self.changes[0]["time"] <= now:
+            change = self.changes.popleft()
+            self.moveTo(self.start + change["time"])
+            for key in SCRIPT_FIELDS:
+                if key in change:
+                    setattr(self, key, change[key])
+            self.alt_agl = self.alt
+        self.moveTo(now)
+
+
+class ReplayPlane(Plane):
+    # the ownship squitters of a recording, the recorded time line restarts at the time of the clock
+
+    def __init__(self, path, clock=REAL_CLOCK):
+        super().__init__(clock)
+        recording = Recording(path)
+        self.times = []
+        self.states = []
+        for record in recording:
+            data = ownshipData(record)
+            if data is not None:
+                self.times.append(record.time)
+                self.states.append(data)
+        recording.close()
+        if not self.states:
+            raise ValueError(f"{path} has no squitters of the recording node")
+        self.start = clock()
+        self.apply(self.states[0])
+
+    def connect(self):
+        pass
+
+    def setClock(self, clock):
+        self.clock = clock
+        self.start = clock()
+
+    def apply(self, data):
+        self.alt = data["alt"]
+        self.alt_agl = data["agl"]
+        self.lat = data["lat"]
+        self.long = data["long"]
+        self.vs = data["vs"]
+        self.gs = data["gs"]
+        self.hdg = data["hdg"]
+
+    def update(self):
+        # the last squitter sent at or before the current time of the replay
+        index = bisect_right(self.times, self.times[0] + self.clock() - self.start) - 1
+        self.apply(self.states[max(0, index)])
@@ -1,12 +1,18 @@
 import math
+import time
 import tkinter as tk
 from threading import Thread
 import tcas
-from aircraft import AircraftCategory, Advisory
+from aircraft import AircraftCategory
+from clock import REAL_CLOCK
+from recorder import Recorder
 from tcas import Tcas
 
 UI_SIZE = 500
 UI_DISPLAY_RANGE = tcas.TCAS_MAX_DISTANCE  # km
+UI_REFRESH_INTERVAL = 100  # ms, polling of the Tcas snapshot on the Tk thread
+AIRCRAFT_COLORS = {AircraftCategory.OTHER: "grey", AircraftCategory.PROXIMATE: "white",
+                   AircraftCategory.TA: "yellow", AircraftCategory.RA: "red"}
 
 class UI(Thread):
 
@@ -16,14 +22,23 @@ class UI(Thread):
         self.vsScale = []
         self.started = False
         self.tcas = None
+        self.ownship = None  # OwnshipView of the displayed snapshot
+        self.lastSnapshot = None
         self.root = tk.Tk()
         self.root.title("TCAS2")
         self.root.geometry("500x620")
         self.useDummy = False
-        self.dummyPlane = None
-        self.aircraftIcons = []
-        self.compassIcons = []
-        self.vsIndicator = []
+        self.dummyPlane = None  # position source used instead of SimConnect, see positionSource.py
+        self.recordPath = None
+        self.metricsPort = None
+        self.metricsFile = None
+        self.clock = REAL_CLOCK  # of the Tcas and the dummy plane
+        self.outboundScheduling = False
+        self.tracker = "difference"  # see tracker.py
+        self.wireFormat = "json"  # of the sent messages
+        self.aircraftItems = {}  # address -> canvas items of the aircraft, kept while it is displayed
+        self.compassIcons = []  # (icon, distance, bearing)
+        self.vsIndicator = None
 
         self.canvas = tk.Canvas(self.root, width=UI_SIZE, height=UI_SIZE, bg="darkgrey")
         self.canvas.create_oval(0, 0, UI_SIZE, UI_SIZE, fill="black")
@@ -33,6 +48,7 @@ class UI(Thread):
         self.gpsLabel = tk.Label(self.root, width=UI_SIZE, text="")
         self.taraLabel = tk.Label(self.root, width=UI_SIZE, text="", fg="black", font='Helvetica 18 bold')
         self.startButton = tk.Button(self.root, width=UI_SIZE, height=40, text="Start", command=self.onClick)
+        self.createCompass()
         self.updateDisplay()
         self.displayVSScale()
 
@@ -43,9 +59,16 @@ class UI(Thread):
 
     def onClick(self):
         if not self.started:
-            self.tcas = Tcas(self, self.useDummy)
+            self.tcas = Tcas(self, self.useDummy, self.clock)
             if self.useDummy:
                 self.tcas.ownPlane = self.dummyPlane
+            self.tcas.outboundScheduling = self.outboundScheduling
+            self.tcas.setTracker(self.tracker)
+            self.tcas.wireFormat = self.wireFormat
+            if self.recordPath is not None:
+                self.tcas.recorder = Recorder(self.recordPath, self.tcas.aircraftIdentification)
+            if self.metricsPort is not None or self.metricsFile is not None:
+                self.tcas.enableMetrics(self.metricsPort, self.metricsFile)
             self.tcas.start()
             self.startButton["text"] = "Stop"
         else:
@@ -59,8 +82,29 @@ class UI(Thread):
         self.gpsLabel["text"] = labelString
 
     def run(self):
+        self.root.after(UI_REFRESH_INTERVAL, self.refresh)
         self.root.mainloop()
 
+    def refresh(self):
+        # runs on the Tk thread, only reads the snapshot the Tcas thread published last
+        if self.tcas is not None and self.started:
+            if self.tcas.error is not None:
+                self.popup(self.tcas.error)
+            snapshot = self.tcas.snapshot
+            if snapshot is not None and snapshot is not self.lastSnapshot:
+                start = time.perf_counter()
+                self.lastSnapshot = snapshot
+                self.ownship = snapshot.ownship
+                self.displayAircraft(snapshot.aircrafts)
+                self.updateDisplay()
+                self.displayTARA(snapshot.advisory)
+                self.updateLabel(snapshot.status)
+                self.tcas.observe("render", start)
+                if self.tcas.metrics is not None:
+                    # age of the snapshot when it is on screen
+                    self.tcas.metrics.observe("display", self.tcas.clock() - snapshot.time)
+        self.root.after(UI_REFRESH_INTERVAL, self.refresh)
+
     def popup(self, string):
         self.updateLabel(string)
 
@@ -77,66 +121,89 @@ class UI(Thread):
         self.startButton["text"] = "Start"
         self.started = False
 
-    def displayAircraft(self):
-        self.clearAircraftDisplay()
-
-        for aircraft in self.tcas.knownAircrafts.values():
-            if len(aircraft.history):
-                labalcolor = ""
-                dist = aircraft.getLastDistance()
-                bear = aircraft.getLastBearing()
-                xy = self.getPointDistAndBear(dist=dist, bear=bear)
-                x = xy[0]
-                y = xy[1]
-
-                icon = None
-                if aircraft.type == AircraftCategory.OTHER:
-                    icon = self.canvas.create_polygon([x-5, y, x, y+7, x+5, y, x, y-7], fill="grey")
-                    labalcolor = "grey"
-                elif aircraft.type == AircraftCategory.PROXIMATE:
-                    icon = self.canvas.create_polygon([x-5, y, x, y+7, x+5, y, x, y-7], fill="white")
-                    labalcolor = "white"
-                elif aircraft.type == AircraftCategory.TA:
-                    icon = self.canvas.create_oval(x-4, y-4, x+8, y+8, fill="yellow")
-                    labalcolor = "yellow"
-                elif aircraft.type == AircraftCategory.RA:
-                    icon = self.canvas.create_polygon([x-4, y-4, x+4, y-4, x+4, y+4, x-4, y+4], fill="red")
-                    labalcolor = "red"
-                self.aircraftIcons.append(icon)
-
-                # add labels
-                vSep = aircraft.getLatvSep()
-                vs = aircraft.lastMessage.get('data').get('vs')
-                offset = 15
-                offsetFactor = 1
-                sign = "+"
-                if abs(vSep) < 100:
-                    sign = ""
-                    offsetFactor = -1
-                elif vSep >= 0:
-                    offsetFactor = -1
-                    sign = "-"
-
-                icon = nIcon = self.canvas.create_text(x, y + -offsetFactor * offset, fill=labalcolor, font="Times 10", text=f"{sign}{abs(round(vSep/100)):02d}")
-                self.aircraftIcons.append(icon)
-
-                if abs(vs) > 50:
-                    if vs > 0:
-                        arrow = tk.LAST
-                    else:
-                        arrow = tk.FIRST
-                    icon = self.canvas.create_line(x+13, y+8, x+13, y-8, arrow=arrow, fill=labalcolor)
-                    self.aircraftIcons.append(icon)
+    def displayAircraft(self, aircrafts):
+        # every address keeps its icon, label and arrow, they are only moved and restyled
+        displayed = set()
+        for aircraft in aircrafts:
+            displayed.add(aircraft.identification)
+            xy = self.getPointDistAndBear(dist=aircraft.distance, bear=aircraft.bearing)
+            x = xy[0]
+            y = xy[1]
+            labalcolor = AIRCRAFT_COLORS.get(aircraft.type, "")
+
+            items = self.aircraftItems.get(aircraft.identification)
+            if items is None:
+                items = {"type": None, "icon": None,
+                         "label": self.canvas.create_text(x, y, font="Times 10"),
+                         "arrow": self.canvas.create_line(x, y, x, y, state=tk.HIDDEN)}
+                self.aircraftItems[aircraft.identification] = items
+
+            if items["type"] != aircraft.type:
+                if items["icon"] is not None:
+                    self.canvas.delete(items["icon"])
+                items["icon"] = self.createAircraftIcon(aircraft.type, x, y)
+                items["type"] = aircraft.type
+            elif items["icon"] is not None:
+                self.canvas.coords(items["icon"], self.getAircraftIconCoords(aircraft.type, x, y))
+
+            # add labels
+            vSep = aircraft.verticalSeparation
+            vs = aircraft.vs
+            offset = 15
+            offsetFactor = 1
+            sign = "+"
+            if abs(vSep) < 100:
+                sign = ""
+                offsetFactor = -1
+            elif vSep >= 0:
+                offsetFactor = -1
+                sign = "-"
+
+            self.canvas.coords(items["label"], x, y + -offsetFactor * offset)
+            self.canvas.itemconfigure(items["label"], fill=labalcolor, text=f"{sign}{abs(round(vSep/100)):02d}")
+
+            if abs(vs) > 50:
+                if vs > 0:
+                    arrow = tk.LAST
+                else:
+                    arrow = tk.FIRST
+                self.canvas.coords(items["arrow"], x+13, y+8, x+13, y-8)
+                self.canvas.itemconfigure(items["arrow"], arrow=arrow, fill=labalcolor, state=tk.NORMAL)
+            else:
+                self.canvas.itemconfigure(items["arrow"], state=tk.HIDDEN)
+
+        for address in [address for address in self.aircraftItems if address not in displayed]:
+            self.removeAircraftItems(address)
+
+    def getAircraftIconCoords(self, aircraftType, x, y):
+        if aircraftType == AircraftCategory.TA:
+            return [x-4, y-4, x+8, y+8]
+        if aircraftType == AircraftCategory.RA:
+            return [x-4, y-4, x+4, y-4, x+4, y+4, x-4, y+4]
+        return [x-5, y, x, y+7, x+5, y, x, y-7]
+
+    def createAircraftIcon(self, aircraftType, x, y):
+        if aircraftType not in AIRCRAFT_COLORS:
+            return None
+        coords = self.getAircraftIconCoords(aircraftType, x, y)
+        if aircraftType == AircraftCategory.TA:
+            return self.canvas.create_oval(*coords, fill=AIRCRAFT_COLORS[aircraftType])
+        return self.canvas.create_polygon(coords, fill=AIRCRAFT_COLORS[aircraftType])
+
+    def removeAircraftItems(self, address):
+        items = self.aircraftItems.pop(address)
+        for key in ("icon", "label", "arrow"):
+            if items[key] is not None:
+                self.canvas.delete(items[key])
 
     def clearAircraftDisplay(self):
-        for icon in self.aircraftIcons:
-            self.canvas.delete(icon)
-        self.aircraftIcons = []
+        for address in list(self.aircraftItems):
+            self.removeAircraftItems(address)
 
     def displayTARA(self, adv):
         noTAAural = True
-        if self.tcas is not None:
-            noTAAural = self.tcas.ownPlane.alt_agl < tcas.TCAS_TA_NO_AURAL
+        if self.ownship is not None:
+            noTAAural = self.ownship.alt_agl < tcas.TCAS_TA_NO_AURAL
         color = "black"
         text = ""
         if adv is not None:
@@ -162,65 +229,48 @@ class UI(Thread):
         dist = dist / UI_DISPLAY_RANGE * UI_SIZE / 2
         centerpoint = [UI_SIZE / 2, UI_SIZE / 2]
         relBear = bear
-        if self.tcas is not None:
-            hdg = self.tcas.ownPlane.hdg
+        if self.ownship is not None:
+            hdg = self.ownship.hdg
             relBear = (360 + bear - hdg) % 360
         bearInRad = relBear * math.pi / 180
         x = centerpoint[0] + (dist * (math.sin(bearInRad)))
         y = centerpoint[1] - (dist * (math.cos(bearInRad)))
         return [x, y]
 
-    def updateDisplay(self):
-        angle = 0
-        if self.tcas is not None:
-            angle = self.tcas.ownPlane.hdg
-        for icon in self.compassIcons:
-            self.canvas.delete(icon)
-        self.compassIcons = []
+    def createCompass(self):
         for i in range(0, 360, 30):
-            point = self.getPointDistAndBear(tcas.TCAS_MAX_DISTANCE - 2000, i)
-            icon = self.canvas.create_text(point[0], point[1], fill="grey", font="Times 10", text=f"{round(i/10)}")
-            self.canvas.itemconfigure(icon, angle=((360+angle-i) % 360))
-            self.compassIcons += [icon]
+            icon = self.canvas.create_text(0, 0, fill="grey", font="Times 10", text=f"{round(i/10)}")
+            self.compassIcons += [(icon, tcas.TCAS_MAX_DISTANCE - 2000, i)]
+
+        icon = self.canvas.create_text(0, 0, fill="grey", font="Times 10", text=f"N")
+        self.compassIcons += [(icon, tcas.TCAS_MAX_DISTANCE - 4500, 0)]
 
-        point = self.getPointDistAndBear(tcas.TCAS_MAX_DISTANCE - 4500, 0)
-        icon = self.canvas.create_text(point[0], point[1], fill="grey", font="Times 10", text=f"N")
-        self.compassIcons += [icon]
-        self.canvas.itemconfigure(icon, angle=angle)
+    def updateDisplay(self):
+        angle = 0
+        if self.ownship is not None:
+            angle = self.ownship.hdg
+        for icon, dist, bear in self.compassIcons:
+            point = self.getPointDistAndBear(dist, bear)
+            self.canvas.coords(icon, point[0], point[1])
+            self.canvas.itemconfigure(icon, angle=((360+angle-bear) % 360))
 
         self.displayVSIndicator()
-        #self.showVSLimits2(-20, 20)
-
-    def checkAdvisoryLevel(self):
-        mostSevereAdv = None
-        mostSev = 0
-        for ac in self.tcas.knownAircrafts.values():
-            adv = ac.advisory  # type: Advisory
-            if adv is not None:
-                if adv.type.value > mostSev:
-                    mostSev = adv.type.value
-                    mostSevereAdv = adv
-        self.displayTARA(mostSevereAdv)
-        # if mostSevereAdv is not None:
-            # self.showVSLimits(mostSevereAdv.minimalVerticalSpeed, mostSevereAdv.minimalVerticalSpeed)
 
     def displayVSIndicator(self):
-        for i in self.vsIndicator:
-            self.canvas.delete(i)
-
         centerpoint = [UI_SIZE / 2, UI_SIZE / 2]
-        vsNull = 270
         angle = 0
-        if self.tcas is not None:
-            angle = self.tcas.ownPlane.vs / 500 * 10
+        if self.ownship is not None:
+            angle = self.ownship.vs / 500 * 10
         offsetAngle = (270 + angle) % 360
         angleInRad = offsetAngle * math.pi / 180
         x = centerpoint[0] + (UI_SIZE / 2 * 0.99 * (math.sin(angleInRad)))
         y = centerpoint[1] - (UI_SIZE / 2 * 0.99 * (math.cos(angleInRad)))
         a = centerpoint[0] + (UI_SIZE / 2 * 1/2 * (math.sin(angleInRad)))
         b = centerpoint[1] - (UI_SIZE / 2 * 1/2 * (math.cos(angleInRad)))
-        icon = self.canvas.create_line(a, b, x, y, arrow=tk.LAST, fill="white", width=3)
-        self.vsIndicator += [icon]
+        if self.vsIndicator is None:
+            self.vsIndicator = self.canvas.create_line(a, b, x, y, arrow=tk.LAST, fill="white", width=3)
+        else:
+            self.canvas.coords(self.vsIndicator, a, b, x, y)
 
     def displayVSScale(self):
         for i in range(-80, 90, 10):
@@ -251,32 +301,23 @@ class UI(Thread):
             self.vsScale += [icon]
 
     def showVSLimits(self, min, max):
+        # red below min, green between, red above max, drawn as three arcs on the rim
+        if not self.showVSLimitIndicator:
+            radius = UI_SIZE / 2 * 0.985
+            box = (UI_SIZE / 2 - radius, UI_SIZE / 2 - radius, UI_SIZE / 2 + radius, UI_SIZE / 2 + radius)
+            for color in ("red", "green", "red"):
+                icon = self.canvas.create_arc(*box, style=tk.ARC, outline=color, width=9, state=tk.HIDDEN)
+                self.showVSLimitIndicator += [icon]
         if min == 0.0 and max == 0.0:
             for i in self.showVSLimitIndicator:
-                self.canvas.delete(i)
+                self.canvas.itemconfigure(i, state=tk.HIDDEN)
             return
-        for i in self.showVSLimitIndicator:
-            self.canvas.delete(i)
-
-        for i in range(-300, 300):
-            centerpoint = [UI_SIZE / 2, UI_SIZE / 2]
-            angle = i*100 / 300
-            offsetAngle = (270 + angle) % 360
-            angleInRad = offsetAngle * math.pi / 180
-            x = centerpoint[0] + (UI_SIZE / 2 * (math.sin(angleInRad)))
-            y = centerpoint[1] - (UI_SIZE / 2 * (math.cos(angleInRad)))
-            a = centerpoint[0] + (UI_SIZE / 2 * 0.97 * (math.sin(angleInRad)))
-            b = centerpoint[1] - (UI_SIZE / 2 * 0.97 * (math.cos(angleInRad)))
-            if i < min or i > max:
-                color = "red"
-            else:
-                color = "green"
-            icon = self.canvas.create_line(a, b, x, y, fill=color, width=9)
-            self.showVSLimitIndicator += [icon]
 
-    def showVSLimits2(self, min, max):
-        if min == 0.0 and max == 0.0:
-            for i in self.showVSLimitIndicator:
-                self.canvas.delete(i)
-            return
-        redPart = self.canvas.create_arc(0+2, 0+2, UI_SIZE-2, UI_SIZE-2, start=0, extent=180, outline="red", width=4)
+        # vertical speed i maps to i / 3 deg from the 9 o'clock position, tk arcs start at 3 o'clock counterclockwise
+        low = sorted((-300, min, 300))[1]
+        high = sorted((low, max, 300))[1]
+        for icon, (start, end) in zip(self.showVSLimitIndicator, ((-300, low), (low, high), (high, 300))):
+            if end <= start:
+                self.canvas.itemconfigure(icon, state=tk.HIDDEN)
+                continue
+            self.canvas.itemconfigure(icon, start=90 - (270 + end / 3), extent=(end - start) / 3, state=tk.NORMAL)
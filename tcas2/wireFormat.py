@@ -0,0 +1,157 @@
+import json
+import struct
+from enum import Enum
+from functools import lru_cache
+
+WIRE_VERSION = 2  # 2 added the sequence number of the resolution messages, version 1 is still decoded
+WIRE_FORMATS = ("json", "binary")  # of the sent messages, received ones are decoded in either format
+BINARY_TOPIC_SUFFIX = "bin"  # binary messages get this last topic level
+INBOX_TOPIC = "inbox"
+
+# broadcast messages:  {channel}/{sender}[/bin]
+# selective messages:  {channel}/{receiver}/inbox/{sender}[/bin]
+# a node subscribes to all broadcasts and its own inbox, the broker drops selective traffic for other nodes
+
+
+class MessageMode(Enum):
+    ALLCALL = 0
+    BROADCAST = 1
+    SELECTIVE = 2
+    INTEROGATE = 3
+
+
+class MessageType(Enum):
+    SHORT_SQUITTER = 0
+    LONG_SQUITTER = 1
+    INTEROGATION = 2
+    RESOLUTION_REQUEST = 3
+    RESOLUTION_RESPONSE = 4
+
+
+ALERTS = ["RA", "CLIMB, CLIMB", "DESCEND, DESCEND"]
+
+FLAG_RECEIVER = 1
+
+# little endian, fixed layout per message type
+HEADER = struct.Struct("<BBBB16s")  # version, mode, type, flags, address
+RECEIVER = struct.Struct("<16s")
+PLANE_DATA = struct.Struct("<ffddfff")  # alt, agl in ft, lat, long in deg, vs in ft/min, gs in knots, hdg in deg
+RESOLUTION_REQUEST = struct.Struct("<BiiI")  # alert, minimalVerticalSpeed, maximalVerticalSpeed, seq
+RESOLUTION_RESPONSE = struct.Struct("<?I")  # accept, seq
+RESOLUTION_REQUEST_V1 = struct.Struct("<Bii")
+RESOLUTION_RESPONSE_V1 = struct.Struct("<?")
+
+PLANE_KEYS = ("alt", "agl", "lat", "long", "vs", "gs", "hdg")
+PLANE_TYPES = (MessageType.SHORT_SQUITTER.value, MessageType.LONG_SQUITTER.value)
+
+MODE_CODES = {mode.name: mode.value for mode in MessageMode}
+MODE_NAMES = {mode.value: mode.name for mode in MessageMode}
+TYPE_CODES = {messageType.name: messageType.value for messageType in MessageType}
+TYPE_NAMES = {messageType.value: messageType.name for messageType in MessageType}
+
+
+# addresses are uuid strings, the same few senders repeat on the channel
+@lru_cache(maxsize=4096)
+def addressToBytes(address):
+    raw = bytes.fromhex(address.replace("-", ""))
+    if len(raw) != 16:
+        raise ValueError(f"address {address} is not a uuid")
+    return raw
+
+
+@lru_cache(maxsize=4096)
+def bytesToAddress(raw):
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def isBinaryTopic(topic):
+    return topic.endswith("/" + BINARY_TOPIC_SUFFIX)
+
+
+def messageTopic(channel, sender, receiver=None, binary=False):
+    topic = f"{channel}/{sender}" if receiver is None else f"{channel}/{receiver}/{INBOX_TOPIC}/{sender}"
+    return f"{topic}/{BINARY_TOPIC_SUFFIX}" if binary else topic
+
+
+def parseTopic(channel, topic):
+    # sender and receiver (None for broadcasts) of a message topic
+    levels = topic[len(channel) + 1:].split("/")
+    if levels[-1] == BINARY_TOPIC_SUFFIX:
+        levels.pop()
+    if len(levels) == 3 and levels[1] == INBOX_TOPIC:
+        return levels[2], levels[0]
+    return levels[0], None
+
+
+def subscriptions(channel, addresses):
+    topics = [f"{channel}/+", f"{channel}/+/{BINARY_TOPIC_SUFFIX}"]
+    topics += [f"{channel}/{address}/{INBOX_TOPIC}/#" for address in addresses]
+    return [(topic, 0) for topic in topics]
+
+
+def encodeJson(message):
+    return json.dumps(message)
+
+
+def encodeBinary(message):
+    # raises ValueError or struct.error for messages that have no binary representation
+    messageType = TYPE_CODES[message["type"]]
+    receiver = message.get("receiver")
+    flags = FLAG_RECEIVER if receiver is not None else 0
+    payload = HEADER.pack(WIRE_VERSION, MODE_CODES[message["mode"]], messageType, flags,
+                          addressToBytes(message["address"]))
+    if receiver is not None:
+        payload += addressToBytes(receiver)
+
+    data = message.get("data")
+    if messageType in PLANE_TYPES:
+        payload += PLANE_DATA.pack(*[data[key] for key in PLANE_KEYS])
+    elif messageType == MessageType.RESOLUTION_REQUEST.value:
+        payload += RESOLUTION_REQUEST.pack(ALERTS.index(data["alert"]), data["minimalVerticalSpeed"],
+                                           data["maximalVerticalSpeed"], data.get("seq", 0))
+    elif messageType == MessageType.RESOLUTION_RESPONSE.value:
+        payload += RESOLUTION_RESPONSE.pack(data["accept"], data.get("seq", 0))
+    return payload
+
+
+def decodeBinary(payload):
+    version, mode, messageType, flags, address = HEADER.unpack_from(payload)
+    if version not in (1, WIRE_VERSION):
+        raise ValueError(f"unsupported wire format version {version}")
+    if mode not in MODE_NAMES or messageType not in TYPE_NAMES:
+        raise ValueError(f"unknown mode {mode} or type {messageType}")
+    message = {"mode": MODE_NAMES[mode], "address": bytesToAddress(address), "type": TYPE_NAMES[messageType]}
+    offset = HEADER.size
+    if flags & FLAG_RECEIVER:
+        message["receiver"] = bytesToAddress(RECEIVER.unpack_from(payload, offset)[0])
+        offset += RECEIVER.size
+
+    if messageType in PLANE_TYPES:
+        message["data"] = dict(zip(PLANE_KEYS, PLANE_DATA.unpack_from(payload, offset)))
+    elif messageType == MessageType.RESOLUTION_REQUEST.value:
+        if version == 1:
+            alert, minimal, maximal = RESOLUTION_REQUEST_V1.unpack_from(payload, offset)
+            seq = 0
+        else:
+            alert, minimal, maximal, seq = RESOLUTION_REQUEST.unpack_from(payload, offset)
+        if alert >= len(ALERTS):
+            raise ValueError(f"unknown alert {alert}")
+        message["data"] = {"alert": ALERTS[alert], "minimalVerticalSpeed": minimal, "maximalVerticalSpeed": maximal,
+                           "seq": seq}
+    elif messageType == MessageType.RESOLUTION_RESPONSE.value:
+        if version == 1:
+            message["data"] = {"accept": RESOLUTION_RESPONSE_V1.unpack_from(payload, offset)[0], "seq": 0}
+        else:
+            accept, seq = RESOLUTION_RESPONSE.unpack_from(payload, offset)
+            message["data"] = {"accept": accept, "seq": seq}
+    else:
+        message["data"] = {}
+    return message
+
+
+def decodeMessage(topic, payload):
+    # raises ValueError or struct.error for payloads that can not be decoded
+    if isBinaryTopic(topic):
+        return decodeBinary(payload)
+    return json.loads(payload)